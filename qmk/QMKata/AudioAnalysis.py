@@ -0,0 +1,182 @@
+import numpy as np
+
+
+class BandPeaks:
+    """
+    Peak magnitude per frequency band of audio chunks (rfft of the chunk).
+
+    The bands (f_min, f_max, both inclusive) are compiled into rfft bin index
+    ranges whenever the bands, the chunk size or the sample rate change; per
+    chunk the peaks are a single np.maximum.reduceat over the magnitude
+    spectrum with the ranges as interleaved start/end indices. Bands may
+    overlap, bands without any bin have peak 0.
+
+    window: None (rectangular, the chunk as it is) or a name of WINDOWS. The
+    window is cached per chunk size and normalized to a mean of 1, so a tone
+    has about the same peak with any window, gain scales the magnitudes.
+    numpy's pocketfft keeps the fft plan of the last lengths, the chunk size
+    stays fixed to reuse it.
+    """
+
+    WINDOWS = {"hann": np.hanning, "hamming": np.hamming, "blackman": np.blackman}
+
+    def __init__(self, freq_bands, n_samples, rate, window=None, gain=1.0):
+        self.freq_bands = list(freq_bands)
+        self.n_samples = n_samples
+        self.rate = rate
+        self.window_name = window
+        self.gain = gain
+        self._compile()
+
+    def set_freq_bands(self, freq_bands):
+        """From another thread: the tables are swapped in one attribute store."""
+        self.freq_bands = list(freq_bands)
+        self._compile()
+
+    def set_chunk(self, n_samples, rate=None):
+        if n_samples != self.n_samples or (rate and rate != self.rate):
+            self.n_samples = n_samples
+            self.rate = rate or self.rate
+            self._compile()
+
+    def _compile(self):
+        n_bins = self.n_samples // 2 + 1
+        freqs = np.fft.rfftfreq(self.n_samples, d=1.0 / self.rate)
+        bands = np.asarray(self.freq_bands, dtype=np.float64).reshape(-1, 2)
+        start = np.searchsorted(freqs, bands[:, 0], side="left")
+        end = np.searchsorted(freqs, bands[:, 1], side="right")
+        # [start0, end0, start1, end1, ...], results at the even positions;
+        # the magnitude buffer has a trailing 0 bin so end == n_bins is valid
+        indices = np.empty(2 * len(bands), dtype=np.intp)
+        indices[0::2] = start
+        indices[1::2] = end
+        window = None
+        if self.window_name:
+            window = self.WINDOWS[self.window_name](self.n_samples)
+            window = (window / window.mean() * self.gain).astype(np.float32)
+        elif self.gain != 1.0:
+            window = np.full(self.n_samples, self.gain, dtype=np.float32)
+        # one tuple, read once per chunk by the audio thread
+        self.tables = (self.n_samples, indices, end > start, window, np.zeros(n_bins + 1))
+
+    def magnitude(self, samples, tables=None):
+        """|rfft| of a chunk of n_samples float samples, with a trailing 0 bin."""
+        n_samples, _, _, window, mag = tables or self.tables
+        if window is not None:
+            samples = samples * window
+        np.abs(np.fft.rfft(samples, n_samples), out=mag[:-1])
+        return mag
+
+    def peaks(self, samples):
+        """(num bands,) peak magnitudes of a chunk."""
+        tables = self.tables
+        _, indices, nonempty, _, _ = tables
+        if len(indices) == 0:
+            return np.zeros(0)
+        mag = self.magnitude(samples, tables)
+        peaks = np.maximum.reduceat(mag, indices)[0::2]
+        peaks[~nonempty] = 0
+        return peaks
+
+    def push(self, samples):
+        """Peaks of a chunk of any size (tables rebuilt when it changes), the
+        interface of StreamingBandAnalyzer.push."""
+        self.set_chunk(len(samples))
+        return self.peaks(samples)
+
+
+class StreamingBandAnalyzer:
+    """
+    Band levels of an audio stream, updated every hop samples independent of
+    the fft length (frequency resolution).
+
+    The latest samples are kept in a ring buffer (stored twice, so the last
+    fft_len samples are always one contiguous slice). Every hop the bands
+    are analysed with a windowed fft over the ring buffer:
+
+        bands narrower than 2 bins of the short fft: fft_len samples, the
+            resolution low bands need
+        other bands: the last short_len samples, which react to transients
+            within about short_len / 2 samples
+
+    The band peaks drive attack/decay envelopes (time constants attack_s,
+    decay_s), the levels reported. Magnitudes are scaled as if from a
+    rectangular level_len sample chunk, so levels stay comparable to
+    BandPeaks of level_len chunks.
+    """
+
+    def __init__(self, freq_bands, rate, hop, fft_len=4096, short_len=1024, window="hann",
+                 attack_s=0.005, decay_s=0.12, level_len=None):
+        self.rate = rate
+        self.hop = hop
+        self.fft_len = fft_len
+        self.short_len = min(short_len, fft_len)
+        self.window = window
+        self.level_len = level_len or fft_len
+        self.attack = 1 - np.exp(-hop / (rate * attack_s)) if attack_s > 0 else 1.0
+        self.decay = 1 - np.exp(-hop / (rate * decay_s)) if decay_s > 0 else 1.0
+
+        self.ring = np.zeros(2 * fft_len, dtype=np.float32)
+        self.pos = 0  # next write position, the last fft_len samples: ring[pos:pos + fft_len]
+        self.hop_fill = 0  # samples since the last hop
+        self.num_hops = 0
+        self.set_freq_bands(freq_bands)
+
+    def set_freq_bands(self, freq_bands):
+        """From another thread: the analysis is swapped in one attribute store."""
+        bands = np.asarray(list(freq_bands), dtype=np.float64).reshape(-1, 2)
+        short = bands[:, 1] - bands[:, 0] >= 2 * self.rate / self.short_len
+        long_peaks = BandPeaks(bands[~short], self.fft_len, self.rate, self.window,
+                               self.level_len / self.fft_len)
+        short_peaks = BandPeaks(bands[short], self.short_len, self.rate, self.window,
+                                self.level_len / self.short_len)
+        self.analysis = (np.flatnonzero(~short), long_peaks, np.flatnonzero(short), short_peaks)
+        self.envelope = np.zeros(len(bands))
+
+    def push(self, samples):
+        """Add float samples, returns the band levels if a hop completed, else None."""
+        levels = None
+        samples = np.asarray(samples, dtype=np.float32)
+        while len(samples):
+            n = min(len(samples), self.hop - self.hop_fill)
+            self._write(samples[:n])
+            samples = samples[n:]
+            self.hop_fill += n
+            if self.hop_fill == self.hop:
+                self.hop_fill = 0
+                levels = self._analyse()
+        return levels
+
+    def _write(self, samples):
+        n = self.fft_len
+        if len(samples) >= n:
+            samples, self.pos = samples[-n:], 0
+        first = min(len(samples), n - self.pos)
+        for offset in (0, n):  # both copies
+            self.ring[self.pos + offset : self.pos + offset + first] = samples[:first]
+            self.ring[offset : offset + len(samples) - first] = samples[first:]
+        self.pos = (self.pos + len(samples)) % n
+
+    def _analyse(self):
+        long_index, long_peaks, short_index, short_peaks = self.analysis
+        latest = self.ring[self.pos : self.pos + self.fft_len]
+        peaks = np.empty(len(long_index) + len(short_index))
+        peaks[long_index] = long_peaks.peaks(latest)
+        peaks[short_index] = short_peaks.peaks(latest[-self.short_len :])
+
+        envelope = self.envelope
+        if len(envelope) != len(peaks):
+            envelope = np.zeros(len(peaks))
+        coef = np.where(peaks > envelope, self.attack, self.decay)
+        envelope = envelope + coef * (peaks - envelope)
+        self.envelope = envelope
+        self.num_hops += 1
+        return envelope
+
+
+def band_analyzer(freq_bands, rate, chunk, fft_len=None, level_len=None):
+    """Analysis of AudioCaptureThread chunks: StreamingBandAnalyzer with a hop
+    of chunk samples if fft_len, else BandPeaks of each chunk."""
+    if fft_len:
+        return StreamingBandAnalyzer(freq_bands, rate, chunk, fft_len, level_len=level_len)
+    return BandPeaks(freq_bands, chunk, rate)
@@ -0,0 +1,154 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# t: time.monotonic() of the hop it was detected in, kind: "onset" or "beat",
+# strength: onset strength (0 for a beat continued from the tempo), bands:
+# indices of the bands with an onset, tempo_bpm: None until estimated
+BeatEvent = namedtuple("BeatEvent", "t kind strength bands tempo_bpm")
+
+
+class BeatDetector:
+    """
+    Streaming onset/beat detection on the band peak levels of each audio hop
+    (AudioCaptureThread), with fixed size history buffers only.
+
+    onset: spectral flux per band, the increase of the log compressed band
+        level since the last hop. A band has an onset when its flux is above
+        an adaptive threshold: median of its last threshold_s of flux *
+        threshold_mult + threshold_delta. The onset strength (flux of all
+        bands) is thresholded the same way, with min_gap_s between onsets.
+    tempo: every tempo_update_s the autocorrelation of the last tempo_s of
+        onset strength, the strongest lag between 60/max_bpm and 60/min_bpm.
+    beat: an onset within beat_tolerance of a period after the last beat,
+        or the predicted beat itself if there was no onset (the tempo keeps
+        the pulse through quiet passages, as long as it is confident). Without
+        tempo every onset is a beat.
+
+    Detection runs on the audio clock (hops * hop_s), the events get the
+    time.monotonic() stamp of their hop. Subscribers are called with each
+    event from the thread calling process().
+    """
+
+    def __init__(self, hop_s, threshold_s=0.5, threshold_mult=2.0, threshold_delta=0.1,
+                 min_gap_s=0.1, tempo_s=4.0, tempo_update_s=0.5, min_bpm=60, max_bpm=200,
+                 beat_tolerance=0.2, min_confidence=0.1):
+        self.hop_s = hop_s
+        self.threshold_mult = threshold_mult
+        self.threshold_delta = threshold_delta
+        self.min_gap = max(1, round(min_gap_s / hop_s))
+        self.tempo_update = max(1, round(tempo_update_s / hop_s))
+        self.min_lag = max(1, int(60 / max_bpm / hop_s))
+        self.max_lag = int(np.ceil(60 / min_bpm / hop_s))
+        self.beat_tolerance = beat_tolerance
+        self.min_confidence = min_confidence
+        self.history_len = max(3, round(threshold_s / hop_s))
+        self.tempo_len = max(2 * self.max_lag, round(tempo_s / hop_s))
+        self.smooth = np.hanning(max(3, round(0.03 / hop_s)) + 2)[1:-1]
+        self.subscribers = []
+        self.reset()
+
+    def reset(self, num_bands=0):
+        self.num_bands = num_bands
+        self.hop = 0
+        self.prev = np.zeros(num_bands)
+        self.flux_history = np.zeros((self.history_len, num_bands))
+        self.strength_history = np.zeros(self.history_len)
+        self.onset_strength = np.zeros(self.tempo_len)  # ring buffer, hop % tempo_len
+        self.last_onset = -self.min_gap
+        self.last_beat = None  # hop
+        self.period = None  # hops per beat (fractional)
+        self.confidence = 0.0
+
+    @property
+    def tempo_bpm(self):
+        return 60 / (self.period * self.hop_s) if self.period else None
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def process(self, peak_levels, now=None):
+        """Band peak levels of the next hop, returns the events of this hop."""
+        levels = np.log1p(np.maximum(np.asarray(peak_levels, dtype=np.float64), 0))
+        if len(levels) != self.num_bands:
+            self.reset(len(levels))
+            self.prev = levels
+        if now is None:
+            now = time.monotonic()
+
+        flux = np.maximum(levels - self.prev, 0)
+        self.prev = levels
+        strength = float(flux.sum())
+        slot = self.hop % self.history_len
+        # thresholds of the history before this hop
+        band_onsets = flux > np.median(self.flux_history, axis=0) * self.threshold_mult + self.threshold_delta
+        threshold = np.median(self.strength_history) * self.threshold_mult + self.threshold_delta * max(1, self.num_bands)
+        self.flux_history[slot] = flux
+        self.strength_history[slot] = strength
+        self.onset_strength[self.hop % self.tempo_len] = strength
+
+        events = []
+        hop = self.hop
+        if strength > threshold and band_onsets.any() and hop - self.last_onset >= self.min_gap:
+            self.last_onset = hop
+            bands = tuple(np.flatnonzero(band_onsets).tolist())
+            events.append(BeatEvent(now, "onset", strength, bands, self.tempo_bpm))
+            if self._beat_due(hop, onset=True):
+                self.last_beat = hop
+                events.append(BeatEvent(now, "beat", strength, bands, self.tempo_bpm))
+        elif self._beat_due(hop, onset=False):
+            self.last_beat += self.period
+            events.append(BeatEvent(now, "beat", 0.0, (), self.tempo_bpm))
+
+        self.hop += 1
+        if self.hop % self.tempo_update == 0 and self.hop >= self.tempo_len:
+            self._update_tempo()
+        for event in events:
+            for callback in self.subscribers:
+                callback(event)
+        return events
+
+    def _beat_due(self, hop, onset):
+        if not self.period or self.last_beat is None or self.confidence < self.min_confidence:
+            return onset  # no tempo, every onset is a beat
+        since = hop - self.last_beat
+        tolerance = self.period * self.beat_tolerance
+        if onset:
+            return abs(since - self.period) <= tolerance or since > self.period + tolerance
+        return since >= self.period + tolerance
+
+    def _update_tempo(self):
+        # oldest first, smoothed over a few hops (period not a whole number
+        # of hops), mean removed, autocorrelation via the fft
+        start = self.hop % self.tempo_len
+        x = np.convolve(np.roll(self.onset_strength, -start), self.smooth, mode="same")
+        x -= x.mean()
+        spectrum = np.fft.rfft(x, 2 * self.tempo_len)
+        acf = np.fft.irfft(spectrum * np.conj(spectrum))[: self.max_lag + 1]
+        if acf[0] <= 0:
+            self.confidence = 0.0
+            return
+        lag = self._peak_lag(acf, self.min_lag, self.max_lag)
+        # a pulse on every other beat correlates as well: prefer the faster
+        # tempo when the half lag is about as strong
+        if int(lag / 2) - 1 >= self.min_lag:
+            half = self._peak_lag(acf, int(lag / 2) - 1, int(np.ceil(lag / 2)) + 1)
+            if acf[round(half)] > 0.5 * acf[round(lag)]:
+                lag = half
+        self.confidence = float(acf[round(lag)] / acf[0])
+        if self.confidence >= self.min_confidence:
+            self.period = lag
+
+    @staticmethod
+    def _peak_lag(acf, min_lag, max_lag):
+        """strongest lag in min_lag..max_lag, parabolic interpolation between hops"""
+        lag = min_lag + int(np.argmax(acf[min_lag : max_lag + 1]))
+        if 0 < lag < len(acf) - 1:
+            a, b, c = acf[lag - 1 : lag + 2]
+            if a - 2 * b + c < 0:
+                return lag + 0.5 * (a - c) / (a - 2 * b + c)
+        return float(lag)
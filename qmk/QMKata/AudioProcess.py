@@ -0,0 +1,322 @@
+import argparse, os, subprocess, sys, threading, time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from AudioAnalysis import band_analyzer
+from AudioSource import FileSource, PyAudioSource, default_audio_source
+
+#-------------------------------------------------------------------------------
+class BandLevelRing:
+    """
+    Band levels of the audio hops in shared memory, written by the analysis
+    process, read by the gui process.
+
+    header (int64): last written hop sequence number (1, 2, ..., 0: none),
+    state, freq bands version, number of freq bands, slots, max bands, rate
+    freq bands (float64, max bands x 2): (f_min, f_max) of the analysis,
+    written by the reader, the version is odd while they are written
+    slots (float64, slots x (3 + max bands)): sequence number, time.monotonic()
+    of the write, number of bands, levels; hop seq is in slot seq % slots
+
+    A slot's sequence number is cleared while it is written, a reader copies
+    the levels and checks the number again (torn/overwritten reads are
+    dropped, no locks across the processes).
+    """
+    SEQ, STATE, BANDS_VERSION, NUM_BANDS, SLOTS, MAX_BANDS, RATE = range(7)
+    HEADER_LEN = 8
+    STARTING, RUNNING, ENDED, FAILED = range(4)
+
+    def __init__(self, name=None, slots=64, max_bands=64):
+        if name is None:
+            size = 8 * (self.HEADER_LEN + 2 * max_bands + slots * (3 + max_bands))
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            if os.name == "posix":
+                # attached segment: unlinked by its owner, not by the tracker
+                # of this process at exit (python < 3.13)
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.header = np.ndarray((self.HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.header[:] = 0
+            self.header[self.SLOTS] = slots
+            self.header[self.MAX_BANDS] = max_bands
+        self.slots = int(self.header[self.SLOTS])
+        self.max_bands = int(self.header[self.MAX_BANDS])
+        offset = 8 * self.HEADER_LEN
+        self.bands = np.ndarray((self.max_bands, 2), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += self.bands.nbytes
+        self.ring = np.ndarray((self.slots, 3 + self.max_bands), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        if self.owner:
+            self.ring[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def state(self):
+        return int(self.header[self.STATE])
+
+    def set_state(self, state):
+        self.header[self.STATE] = state
+
+    def set_freq_bands(self, freq_bands):
+        bands = np.asarray(list(freq_bands), dtype=np.float64).reshape(-1, 2)[: self.max_bands]
+        self.header[self.BANDS_VERSION] += 1
+        self.bands[: len(bands)] = bands
+        self.header[self.NUM_BANDS] = len(bands)
+        self.header[self.BANDS_VERSION] += 1
+
+    def freq_bands(self):
+        """(version, [(f_min, f_max), ...]), None while they are written"""
+        version = int(self.header[self.BANDS_VERSION])
+        bands = self.bands[: int(self.header[self.NUM_BANDS])].tolist()
+        if version % 2 or version != self.header[self.BANDS_VERSION]:
+            return None
+        return version, bands
+
+    def write(self, levels, t):
+        seq = int(self.header[self.SEQ]) + 1
+        row = self.ring[seq % self.slots]
+        n = min(len(levels), self.max_bands)
+        row[0] = 0
+        row[1] = t
+        row[2] = n
+        row[3 : 3 + n] = levels[:n]
+        row[0] = seq
+        self.header[self.SEQ] = seq
+
+    def read(self, seq):
+        """(t, levels) of hop seq, None if it is overwritten or being written"""
+        row = self.ring[seq % self.slots]
+        if row[0] != seq:
+            return None
+        t = row[1]
+        n = min(int(row[2]), self.max_bands)
+        levels = row[3 : 3 + n].copy()
+        if row[0] != seq:
+            return None
+        return t, levels
+
+    def close(self):
+        # views on the buffer first, else SharedMemory.close() fails
+        self.header = self.bands = self.ring = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+#-------------------------------------------------------------------------------
+class AudioAnalysisProcess:
+    """
+    Audio capture and band analysis (AudioAnalysis.band_analyzer) in a child
+    python process, the band levels of each hop in a BandLevelRing. The gui
+    process only copies levels out of the ring, the capture and fft don't
+    compete with the qt ui, rgb encoding and usb writes for the gil.
+
+    The child is this file run as a script (a multiprocessing child would
+    import the app's main module). It ends at the end of the source, when
+    its stdin is closed (stop()) or when the gui process is gone. It writes
+    a byte to its stdout after every hop, wait() blocks on those instead of
+    polling the ring.
+    source: None/PyAudioSource (live capture) or a FileSource of a file.
+    """
+
+    def __init__(self, freq_bands, interval, fft_len=None, level_interval=0.04, source=None,
+                 slots=64, max_bands=64):
+        self.freq_bands = freq_bands
+        self.interval = interval
+        self.fft_len = fft_len
+        self.level_interval = level_interval
+        self.source = source
+        self.slots = slots
+        self.max_bands = max_bands
+        self.ring = None
+        self.proc = None
+        self.hop_event = threading.Event()  # set by the notifications of the child
+        self.notify_thread = None
+        self.last_seq = 0
+        self.skipped = 0  # hops overwritten before they were read
+
+    def source_args(self):
+        source = self.source
+        if source is None or isinstance(source, PyAudioSource):
+            return []
+        if isinstance(source, FileSource) and source.path:
+            args = ["--file", source.path, "--rate", str(source.rate)]
+            if source.loop:
+                args.append("--loop")
+            if not source.realtime:
+                args.append("--no-realtime")
+            return args
+        raise ValueError(f"{source.name} source can't be opened in the analysis process")
+
+    def start(self):
+        args = self.source_args()
+        self.ring = BandLevelRing(slots=self.slots, max_bands=max(self.max_bands, len(self.freq_bands)))
+        self.ring.set_freq_bands(self.freq_bands)
+        self.last_seq = 0
+        self.skipped = 0
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--shm", self.ring.name,
+             "--interval", str(self.interval), "--fft-len", str(self.fft_len or 0),
+             "--level-interval", str(self.level_interval)] + args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.hop_event.clear()
+        self.notify_thread = threading.Thread(target=self.read_notifications, args=(self.proc.stdout,),
+                                              name="audio_process_notify", daemon=True)
+        self.notify_thread.start()
+
+    def read_notifications(self, stdout):
+        """hop notifications of the child until it ends (end of its stdout)"""
+        try:
+            while os.read(stdout.fileno(), 4096):
+                self.hop_event.set()
+        except OSError:
+            pass
+        self.hop_event.set()
+
+    def set_freq_bands(self, freq_bands):
+        self.freq_bands = freq_bands
+        if self.ring:
+            self.ring.set_freq_bands(freq_bands)
+
+    def read(self):
+        """[(t, levels), ...] of the hops since the last read (at most the
+        ring's slots), None when the child ended and all hops are read."""
+        ring = self.ring
+        seq = int(ring.header[ring.SEQ])
+        if seq == self.last_seq:
+            if ring.state in (ring.ENDED, ring.FAILED) or self.proc.poll() is not None:
+                # hops written before the state changed are read first
+                return [] if seq != ring.header[ring.SEQ] else None
+            return []
+        # the oldest slot may be the one being overwritten
+        first = max(self.last_seq + 1, seq - self.slots + 2)
+        self.skipped += first - self.last_seq - 1
+        hops = []
+        for s in range(first, seq + 1):
+            hop = ring.read(s)
+            if hop is None:
+                self.skipped += 1
+            else:
+                hops.append(hop)
+        self.last_seq = seq
+        return hops
+
+    def wait(self, timeout):
+        """until a new hop is written, the child ended or timeout"""
+        # cleared before the check, a hop written since sets it again
+        self.hop_event.clear()
+        if self.ring.header[self.ring.SEQ] != self.last_seq or not self.notify_thread.is_alive():
+            return
+        self.hop_event.wait(timeout)
+
+    def stop(self, timeout=2.0):
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.notify_thread.join()
+            self.notify_thread = None
+            self.proc.stdout.close()
+            self.proc = None
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+#-------------------------------------------------------------------------------
+def run_analysis(ring, source, interval, fft_len, level_interval, stop, notify=None):
+    """child process: band levels of the source's chunks into the ring until stop
+    is set, notify() after each hop"""
+    try:
+        source.open(interval)
+    except Exception as e:
+        print(f"{source.name} not available: {e}", file=sys.stderr)
+        source.close()
+        ring.set_state(ring.FAILED)
+        return
+    ring.header[ring.RATE] = source.rate
+    version = None
+    analyzer = None
+    ring.set_state(ring.RUNNING)
+    try:
+        while not stop.is_set():
+            if version != ring.header[ring.BANDS_VERSION]:
+                bands = ring.freq_bands()
+                if bands:
+                    version, freq_bands = bands
+                    if analyzer is None:
+                        analyzer = band_analyzer(freq_bands, source.rate, source.chunk, fft_len,
+                                                 int(source.rate * level_interval))
+                    else:
+                        analyzer.set_freq_bands(freq_bands)
+            frames = source.read()
+            if frames is None:
+                break
+            if analyzer is None:
+                continue
+            levels = analyzer.push(frames)
+            if levels is not None:
+                ring.write(levels, time.monotonic())
+                if notify:
+                    notify()
+    finally:
+        source.close()
+        ring.set_state(ring.ENDED)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="audio analysis process of AudioAnalysisProcess")
+    parser.add_argument("--shm", required=True, help="BandLevelRing shared memory name")
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--fft-len", type=int, default=0)
+    parser.add_argument("--level-interval", type=float, default=0.04)
+    parser.add_argument("--file", type=str, help="wav/npy file, default: live capture")
+    parser.add_argument("--rate", type=int, default=48000, help="rate of a npy file")
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--no-realtime", action="store_true")
+    args = parser.parse_args()
+
+    ring = BandLevelRing(args.shm)
+    if args.file:
+        source = FileSource(args.file, rate=args.rate, realtime=not args.no_realtime, loop=args.loop)
+    else:
+        source = default_audio_source()
+    stop = threading.Event()
+
+    def wait_stdin():
+        # closed by stop() or when the gui process ends, unbuffered: no lock
+        # held by this daemon thread at interpreter shutdown
+        while os.read(sys.stdin.fileno(), 256):
+            pass
+        stop.set()
+        source.stop()
+
+    def notify():
+        try:
+            os.write(notify_fd, b"\x01")
+        except OSError:  # gui process gone
+            stop.set()
+
+    notify_fd = sys.stdout.fileno()
+    threading.Thread(target=wait_stdin, daemon=True).start()
+    try:
+        run_analysis(ring, source, args.interval, args.fft_len or None, args.level_interval, stop, notify)
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import numpy as np
+
+
+def band_levels(peak_levels, db_min, max_level, log_scale=True):
+    """Band levels 0..255 of band peak levels, all bands at once.
+
+    log_scale: peak / max level in dB, db_min..0 dB -> 0..255 (rounded),
+    else peak / max level * 255 (not clipped). Bands with a 0 peak or max
+    level, or no dB range (db_min 0: min level == max level) are 0; bands
+    missing in one of the lists (bands changed in the ui) are dropped.
+    """
+    n = min(len(peak_levels), len(db_min), len(max_level))
+    peak = np.asarray(peak_levels[:n], dtype=np.float64)
+    max_level = np.asarray(max_level[:n], dtype=np.float64)
+    ratio = np.divide(peak, max_level, out=np.zeros(n), where=max_level != 0)
+    if not log_scale:
+        return ratio * 255
+    db_min = np.asarray(db_min[:n], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        peak_db = 20 * np.log10(ratio)
+        normalized = np.clip((peak_db - db_min) / -db_min, 0, 1)
+    levels = np.round(255 * normalized)
+    levels[~(ratio > 0) | ~(db_min < 0)] = 0
+    return levels
+
+
+def levels_to_rgb(levels, freq_rgb, scale=1 / 6):
+    """Sum of the band colors weighted by the band levels, one color for all
+    leds: (r, g, b) floats 0..255. The sum of all bands is scaled down."""
+    n = min(len(levels), len(freq_rgb))
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    rgb = np.asarray(levels[:n]) @ np.asarray(freq_rgb[:n], dtype=np.float64).reshape(n, 3)
+    r, g, b = np.minimum(rgb * scale, 255).tolist()
+    return r, g, b
+
+
+class SpectrumRenderer:
+    """
+    Spectrum analyser frame: every matrix column is a bar of its band's level
+    (0..255, band_levels()), in the band's color (scaled to a max channel of
+    255), lit from the bottom; the top led of a bar is dimmed to the fraction
+    of its row.
+
+    With more bands than columns a column shows the loudest of its bands,
+    with fewer bands neighbouring columns share a band. The column -> bands
+    table is rebuilt when the number of bands changes.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.num_bands = None
+        self.columns = np.arange(width)
+        # row 0 is the top, bottom row has offset 0
+        self.row_offset = np.arange(height - 1, -1, -1, dtype=np.float32)[:, None]
+
+    def _compile(self, num_bands):
+        self.num_bands = num_bands
+        # bands of a column: group[column, :], padded with the column's first band
+        start = np.arange(self.width) * num_bands // self.width
+        end = np.maximum(np.arange(1, self.width + 1) * num_bands // self.width, start + 1)
+        size = int((end - start).max())
+        group = start[:, None] + np.arange(size)[None, :]
+        self.group = np.where(group < end[:, None], group, start[:, None])
+
+    def render(self, levels, freq_rgb, out=None):
+        """(height, width, 3) uint8 frame, into out if given."""
+        n = min(len(levels), len(freq_rgb))
+        if out is None:
+            out = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        if n == 0:
+            out[...] = 0
+            return out
+        if n != self.num_bands:
+            self._compile(n)
+        levels = np.asarray(levels[:n], dtype=np.float32)
+        # band colors scaled into 0..255, hue kept
+        colors = np.clip(np.asarray(freq_rgb[:n], dtype=np.float32).reshape(n, 3), 0, None)
+        colors *= 255 / np.maximum(colors.max(axis=1, keepdims=True), 1)
+        # loudest band of each column
+        group_levels = levels[self.group]
+        loudest = group_levels.argmax(axis=1)
+        column_band = self.group[self.columns, loudest]
+        column_level = group_levels[self.columns, loudest]
+        column_color = colors[column_band]
+
+        fill = column_level * (self.height / 255.0)  # lit rows per column
+        intensity = np.clip(fill[None, :] - self.row_offset, 0, 1)
+        out[...] = intensity[:, :, None] * column_color[None, :, :] + 0.5
+        return out
@@ -0,0 +1,199 @@
+import time, wave
+
+import numpy as np
+
+from DebugTracer import DebugTracer
+try:
+    import pyaudiowpatch as pyaudio
+except ImportError:
+    try:
+        import pyaudio
+    except ImportError:
+        pyaudio = None
+
+#-------------------------------------------------------------------------------
+class AudioSource:
+    """
+    Audio input of AudioCaptureThread.
+
+    open(interval): start, chunks of interval seconds, sets rate
+    read(): float32 mono samples of the next chunk, None at the end or on error
+    stop(): from another thread, unblocks a pending read()
+    close(): release, in the thread that opened the source
+    """
+    name = "audio source"
+
+    def __init__(self):
+        self.dbg = DebugTracer(zones={'D':0, 'E':1}, obj=self)
+        self.rate = None
+        self.chunk = None
+
+    def open(self, interval):
+        raise NotImplementedError
+
+    def read(self):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def mono(frames, channels):
+        if channels > 1:
+            frames = frames.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+        return frames
+
+#-------------------------------------------------------------------------------
+class PyAudioSource(AudioSource):
+    """
+    Live capture with (py)audio: loopback of the default speakers with
+    pyaudiowpatch (windows wasapi), else the default input device of
+    portaudio (on linux e.g. the pulseaudio/pipewire monitor of the output).
+    """
+    name = "pyaudio"
+
+    def __init__(self, loopback=True):
+        super().__init__()
+        self.loopback = loopback
+        self.paudio = None
+        self.stream = None
+
+    def device(self):
+        if self.loopback and hasattr(pyaudio, "paWASAPI"):
+            try:
+                # see https://github.com/s0d3s/PyAudioWPatch/blob/master/examples/pawp_record_wasapi_loopback.py
+                wasapi_info = self.paudio.get_host_api_info_by_type(pyaudio.paWASAPI)
+                self.dbg.tr('D', "wasapi: {}", wasapi_info)
+                default_speakers = self.paudio.get_device_info_by_index(wasapi_info["defaultOutputDevice"])
+                if not default_speakers["isLoopbackDevice"]:
+                    for loopback in self.paudio.get_loopback_device_info_generator():
+                        if default_speakers["name"] in loopback["name"]:
+                            default_speakers = loopback
+                            break
+                return default_speakers
+            except Exception as e:
+                self.dbg.tr('D', "wasapi not supported: {}", e)
+        return self.paudio.get_default_input_device_info()
+
+    def open(self, interval):
+        if pyaudio is None:
+            raise RuntimeError("pyaudiowpatch/pyaudio not installed")
+        self.paudio = pyaudio.PyAudio()
+        device = self.device()
+        self.dbg.tr('D', "input device: {}", device)
+        self.channels = device["maxInputChannels"]
+        self.rate = int(device["defaultSampleRate"])
+        self.chunk = int(self.rate * interval)
+        self.stream = self.paudio.open(format=pyaudio.paFloat32,
+                        channels=self.channels,
+                        rate=self.rate,
+                        input=True,
+                        frames_per_buffer=self.chunk,
+                        input_device_index=device["index"])
+        self.dbg.tr('D', "audio stream opened: rate={}, chunk size={}, channels={}", self.rate, self.chunk, self.channels)
+
+    def read(self):
+        try:
+            data = self.stream.read(self.chunk)
+        except Exception as e:
+            self.dbg.tr('E', "audio stream read error: {}", e)
+            return None
+        return self.mono(np.frombuffer(data, dtype=np.float32), self.channels)
+
+    def stop(self):
+        try:
+            self.stream.stop_stream()
+        except Exception:
+            pass
+
+    def close(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.paudio:
+            self.paudio.terminate()
+            self.paudio = None
+        self.dbg.tr('D', "audio stream closed")
+
+#-------------------------------------------------------------------------------
+class FileSource(AudioSource):
+    """
+    Samples of a wav (8/16/24/32 bit pcm) or numpy (.npy, float -1..1, rate
+    given) file, or of an array. realtime: chunks are returned at the pace
+    of the sample rate, else as fast as they are read (benchmarks, tests).
+    """
+    name = "file"
+
+    def __init__(self, path=None, samples=None, rate=48000, realtime=True, loop=False):
+        super().__init__()
+        self.path = path
+        self.samples = samples
+        self.rate = rate
+        self.realtime = realtime
+        self.loop = loop
+        self.pos = 0
+        self.stopped = False
+
+    @staticmethod
+    def load_wav(path):
+        """(float32 mono samples, rate)"""
+        with wave.open(path, "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            data = wav.readframes(wav.getnframes())
+        if width == 3:
+            # 24 bit: sign extend to int32 via the top 3 bytes
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            pcm = np.zeros((len(raw), 4), dtype=np.uint8)
+            pcm[:, 1:] = raw
+            frames = pcm.view("<i4").ravel() / float(1 << 31)
+        elif width == 1:
+            frames = (np.frombuffer(data, dtype=np.uint8) - 128.0) / 128
+        else:
+            dtype = {2: "<i2", 4: "<i4"}[width]
+            frames = np.frombuffer(data, dtype=dtype) / float(1 << (8 * width - 1))
+        return AudioSource.mono(frames.astype(np.float32), channels), rate
+
+    def open(self, interval):
+        if self.samples is None:
+            if self.path.lower().endswith(".npy"):
+                self.samples = np.load(self.path)
+            else:
+                self.samples, self.rate = self.load_wav(self.path)
+        self.samples = np.asarray(self.samples, dtype=np.float32)
+        if self.samples.ndim > 1:
+            self.samples = self.mono(self.samples.ravel(), self.samples.shape[1])
+        self.chunk = int(self.rate * interval)
+        self.pos = 0
+        self.stopped = False
+        self.t_start = time.monotonic()
+        self.num_read = 0
+
+    def read(self):
+        if self.stopped:
+            return None
+        if self.pos + self.chunk > len(self.samples):
+            if not self.loop or len(self.samples) < self.chunk:
+                return None
+            self.pos = 0
+        frames = self.samples[self.pos : self.pos + self.chunk]
+        self.pos += self.chunk
+        self.num_read += 1
+        if self.realtime:
+            # chunk available when its last sample was "recorded", no drift
+            due = self.t_start + self.num_read * self.chunk / self.rate
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return frames
+
+    def stop(self):
+        self.stopped = True
+
+#-------------------------------------------------------------------------------
+def default_audio_source():
+    """live capture of the default output (or input) device"""
+    return PyAudioSource()
@@ -0,0 +1,608 @@
+import struct, threading, time
+from collections import deque
+
+from SerialRawHID import SerialRawHID, START_SYSEX, END_SYSEX
+from DebugTracer import DebugTracer
+
+# command/ids as used by QMKataKeyboard (QMKataKeybCmd), duplicated here so the
+# simulator doesn't pull in Qt
+SET, GET, DEL, PUB, RESPONSE = 1, 2, 4, 5, 0xF
+QMKATA_SYSEX = START_SYSEX + 1
+REPORT_FIRMWARE = 0x79
+ID_RGB_MATRIX_BUF = 1
+ID_DEFAULT_LAYER = 2
+ID_CLI = 3
+ID_STATUS = 4
+ID_MACWIN_MODE = 5
+ID_STRUCT_LAYOUT = 8
+ID_CONFIG = 9
+ID_KEYPRESS_EVENT = 10
+ID_COMBO = 11
+ID_TAP_DANCE = 12
+ID_LEADER = 13
+ID_MODULE = 14
+ID_TRANSPORT = 15
+ID_RGB_MATRIX_FRAME = 16
+ID_DYNLD_FUNCTION = 250
+ID_DYNLD_FUNEXEC = 251
+TRANSPORT_NATIVE_FRAMES = 0x01
+TRANSPORT_RGB_ACK = 0x02
+CODEC_RGB888, CODEC_RGB565, CODEC_PALETTE = 0, 1, 2
+
+CLI_CMD_MEMORY = 0x01
+CLI_CMD_EEPROM = 0x02
+CLI_CMD_CALL = 0x03
+CLI_CMD_LAYOUT = 0x40
+CLI_CMD_WRITE = 0x80
+
+MODULE_MAGIC = 0x4D4F444C
+MODULE_SLOT_SECTOR_ERASE = 0xFE
+MODULE_SLOT_RELOAD_DONE = 0xFD
+MODULE_SLOT_SUMMARY = 0xFF
+MODULE_RC_OK = 0
+MODULE_RC_ERROR = 1
+
+# struct field types/flags, see KeybStruct.TYPES/FLAGS in the keyboard models
+T_BIT, T_UINT8, T_UINT16, T_UINT32, T_ARRAY = 1, 2, 3, 4, 0x80
+READONLY = 1
+
+
+#-------------------------------------------------------------------------------
+class SimulatedFirmware:
+    '''
+    qmkata firmware model: handles one complete host message at a time and
+    returns the response frames, keeps config/status structs, memory, eeprom,
+    module flash slots and the rgb buffer.
+
+    Timing is only reported (busy_s), the transport decides when responses
+    become visible.
+    '''
+    FIRMWARE_NAME = "qmkata sim"
+    FIRMWARE_VERSION = (0, 5)
+
+    # layout id -> struct id -> (size, flags, [(field id, type, offset, size), ...])
+    # bit field offsets are in bits
+    STRUCT_LAYOUTS = {
+        ID_CONFIG: {
+            1: (1, 0, [(1, T_BIT, 0, 1), (2, T_BIT, 1, 1), (3, T_BIT, 2, 1), (4, T_BIT, 3, 1)]),
+            2: (1, 0, [(1, T_BIT, 0, 1), (2, T_BIT, 1, 1), (3, T_BIT, 2, 1), (4, T_BIT, 3, 1)]),
+            3: (7, 0, [(1, T_UINT8, 0, 1), (2, T_UINT8, 1, 1), (3, T_UINT8, 2, 1),
+                       (4, T_UINT8, 3, 1), (5, T_UINT8, 4, 1), (6, T_UINT8, 5, 1),
+                       (7, T_UINT8, 6, 1)]),
+            4: (2, 0, [(i + 1, T_BIT, i, 1) for i in range(13)]),
+            5: (1, 0, [(1, T_UINT8, 0, 1)]),
+            6: (1, 0, [(1, T_UINT8, 0, 1)]),
+            7: (1, 0, [(1, T_BIT, 0, 1), (2, T_BIT, 1, 1)]),
+        },
+        ID_STATUS: {
+            1: (5, READONLY, [(1, T_UINT8, 0, 1), (2, T_UINT16, 2, 2), (3, T_BIT, 32, 1)]),
+            2: (1, READONLY, [(1, T_BIT, 0, 1)]),
+            3: (24, READONLY, [(1, T_ARRAY | T_UINT32, 0, 6)]),
+        },
+    }
+
+    def __init__(self, keyboard_model=None, max_msg_len=512, native_frames=True,
+                 legacy=False, sector_erase_s=0.25, rgb_tick_s=0.01, rgb_ack=True,
+                 rgb_queue_len=16, rgb_apply_s=0, rgb_codecs=0b111):
+        '''
+        keyboard_model: keyboard model class (keyboards/*.py), None for defaults
+        max_msg_len: multi-report message size reported by ID_TRANSPORT
+        legacy: firmware without ID_TRANSPORT (single report, 7 bit responses)
+        sector_erase_s: flash sector erase time, stm32f4 16KB sector ~200ms-1s
+        rgb_tick_s: time per rgb pixel duration count
+        rgb_ack: supports TRANSPORT_RGB_ACK (rgb buf packets acked with credits)
+        rgb_queue_len: rgb buf packets queued for rgb_apply_s each, packets
+            arriving at a full queue are dropped (rgb_overruns)
+        rgb_codecs: ID_RGB_MATRIX_FRAME codecs bit mask (1 << CODEC_...)
+        '''
+        self.dbg = DebugTracer(zones={'D': 0}, obj=self)
+        self.model = keyboard_model
+        self.legacy = legacy
+        self.max_msg_len = max_msg_len
+        self.native_frames_supported = native_frames and not legacy
+        self.native_frames = False
+        self.sector_erase_s = sector_erase_s
+        self.rgb_tick_s = rgb_tick_s
+        self.rgb_ack_supported = rgb_ack and not legacy
+        self.rgb_ack = False
+        self.rgb_queue_len = rgb_queue_len
+        self.rgb_apply_s = rgb_apply_s
+        self.rgb_queue = deque() # applied time of queued packets
+        self.rgb_overruns = 0
+        self.rgb_codecs = 0 if legacy else rgb_codecs
+
+        mcu = getattr(keyboard_model, "MCU", ("", "", "le32"))
+        self.endian = ">" if mcu[2].startswith("be") else "<"
+
+        self.num_rgb_leds = getattr(keyboard_model, "NUM_RGB_LEDS", 102)
+        self.rgb_buf = [None] * self.num_rgb_leds # (r, g, b, expire time)
+        self.rgb_pixel_writes = 0
+        self.rgb_messages = 0
+        self.default_layer = 0
+        self.macwin_mode = ord('w')
+
+        self.structs = {
+            layout_id: {sid: bytearray(s[0]) for sid, s in structs.items()}
+            for layout_id, structs in self.STRUCT_LAYOUTS.items()
+        }
+        struct.pack_into("<BH", self.structs[ID_STATUS][1], 0, 87, 3950)
+
+        self.memory = self._memory_regions()
+        self.eeprom = bytearray(4096)
+        self.combos = {}
+        self.tap_dances = {}
+        self.leaders = {}
+        self.dynld_functions = {}
+
+        self.module_slots = self._module_slots()
+        self.module_staging = {} # slot id -> bytearray
+        self.module_reload = False # sector erased by host, finalize must not erase
+
+    def _memory_regions(self):
+        '''[(base, bytearray)] flash (erased) and ram of the model's mcu'''
+        profile = None
+        try:
+            profile = self.model.hw()
+        except Exception:
+            pass
+        if profile is None:
+            return [(0x08000000, bytearray(b'\xff' * 0x40000)), (0x20000000, bytearray(0x10000))]
+        flash_base = profile.flash_sectors[0].base
+        regions = [(flash_base, bytearray(b'\xff' * profile.flash_total))]
+        for ram in profile.ram_regions:
+            regions.append((ram.base, bytearray(ram.size)))
+        return regions
+
+    def _module_slots(self):
+        '''[(base, size)] per module slot id'''
+        try:
+            if slots := self.model.module_flash_layout():
+                return [(base, size) for _, base, size in slots]
+        except Exception:
+            pass
+        base = self.memory[0][0] + 0x8000
+        return [(base + i * 0x1000, 0x1000) for i in range(8)]
+
+    def _mem(self, addr, size):
+        '''memoryview of size bytes at addr, None if not mapped'''
+        for base, mem in self.memory:
+            if base <= addr and addr + size <= base + len(mem):
+                return memoryview(mem)[addr - base:addr - base + size]
+        return None
+
+    #---------------------------------------------------------------------------
+    def max_response_len(self):
+        '''max response payload (seqnum, id, ...) in one frame'''
+        max_msg_len = self.max_msg_len if not self.legacy else 63
+        if self.native_frames:
+            return min(max_msg_len - 5, 0xFFFF)
+        return (max_msg_len - 3) // 2
+
+    def frame(self, cmd, payload):
+        if self.native_frames:
+            return bytes([QMKATA_SYSEX, cmd, len(payload) & 0xFF, len(payload) >> 8]) + \
+                bytes(payload) + bytes([END_SYSEX])
+        frame = bytearray([START_SYSEX, cmd])
+        for b in payload:
+            frame.extend((b & 0x7F, b >> 7))
+        frame.append(END_SYSEX)
+        return bytes(frame)
+
+    def publish_keypress(self, row, col, pressed, time_ms=0):
+        '''pub frame for a key event, as sent with devel/pub_keypress enabled'''
+        payload = bytearray([ID_KEYPRESS_EVENT, col, row])
+        payload.extend(struct.pack(self.endian + "H", time_ms & 0xFFFF))
+        payload.extend((1, 1 if pressed else 0))
+        return self.frame(PUB, payload)
+
+    def rgb_pixels(self, now=None):
+        '''current rgb buffer, (r, g, b) or None for expired/unset leds'''
+        now = time.monotonic() if now is None else now
+        return [p[:3] if p and p[3] > now else None for p in self.rgb_buf]
+
+    #---------------------------------------------------------------------------
+    def handle_message(self, msg):
+        '''
+        handle one host message [START_SYSEX+1, cmd, seqnum, data..., END_SYSEX]
+        returns ([response frames], busy_s)
+        '''
+        if len(msg) < 2:
+            return [], 0
+        if msg[0] == START_SYSEX:
+            return [], 0 # plain firmata (open() ping), not answered
+        if msg[0] != QMKATA_SYSEX or len(msg) < 4:
+            return [], 0
+        cmd, seqnum, data = msg[1], msg[2], memoryview(msg)[3:-1]
+        if cmd == REPORT_FIRMWARE:
+            frame = bytearray([START_SYSEX, REPORT_FIRMWARE, *self.FIRMWARE_VERSION])
+            for c in self.FIRMWARE_NAME.encode():
+                frame.extend((c & 0x7F, c >> 7))
+            frame.append(END_SYSEX)
+            return [bytes(frame)], 0
+        if len(data) == 0:
+            return [], 0
+
+        self.busy_s = 0
+        responses = []
+        handler = {SET: self._set, GET: self._get, DEL: self._del}.get(cmd)
+        try:
+            for payload in handler(data) if handler else ():
+                responses.append(self.frame(RESPONSE, bytes([seqnum]) + bytes(payload)))
+        except (IndexError, struct.error) as e:
+            self.dbg.tr('E', "malformed message {}: {}", bytes(msg).hex(' '), e)
+        return responses, self.busy_s
+
+    def _set(self, data):
+        id = data[0]
+        if id == ID_RGB_MATRIX_BUF or id == ID_RGB_MATRIX_FRAME and self.rgb_codecs:
+            now = time.monotonic()
+            self.rgb_messages += 1
+            while self.rgb_queue and self.rgb_queue[0] <= now:
+                self.rgb_queue.popleft()
+            if len(self.rgb_queue) >= self.rgb_queue_len:
+                self.rgb_overruns += 1
+                return [(id, 0)] if self.rgb_ack else []
+            start = self.rgb_queue[-1] if self.rgb_queue else now
+            self.rgb_queue.append(start + self.rgb_apply_s)
+            self.busy_s += self.rgb_apply_s
+            if id == ID_RGB_MATRIX_BUF:
+                for off in range(1, len(data) - 4, 5):
+                    index, duration, r, g, b = data[off:off+5]
+                    self._rgb_set(index, (r, g, b), duration, now)
+            else:
+                for index, rgb in self._rgb_frame_decode(data):
+                    self._rgb_set(index, rgb, data[2], now)
+            # acked once applied, the packets sent since are in flight on the host
+            return [(id, self.rgb_queue_len)] if self.rgb_ack else []
+        if id == ID_DEFAULT_LAYER:
+            self.default_layer = data[1]
+            return []
+        if id == ID_MACWIN_MODE:
+            self.macwin_mode = data[1]
+            return []
+        if id == ID_CONFIG:
+            config = self.structs[ID_CONFIG][data[1]]
+            values = data[2:2 + len(config)]
+            config[:len(values)] = values
+            return []
+        if id == ID_CLI:
+            return [self._cli(data[1], data[2:])]
+        if id == ID_COMBO:
+            self.combos[data[1]] = bytes(data[2:20])
+            return []
+        if id == ID_TAP_DANCE:
+            self.tap_dances[data[1]] = bytes(data[2:10])
+            return []
+        if id == ID_LEADER:
+            self.leaders[data[1]] = bytes(data[2:14])
+            return []
+        if id == ID_TRANSPORT and not self.legacy:
+            self.native_frames = bool(data[1] & TRANSPORT_NATIVE_FRAMES) and self.native_frames_supported
+            self.rgb_ack = bool(data[1] & TRANSPORT_RGB_ACK) and self.rgb_ack_supported
+            # response with the flags now in effect, still in the old framing
+            return [self._transport_caps(
+                (TRANSPORT_NATIVE_FRAMES if self.native_frames else 0) |
+                (TRANSPORT_RGB_ACK if self.rgb_ack else 0))]
+        if id == ID_MODULE:
+            return [self._module_write(data)]
+        if id == ID_DYNLD_FUNCTION:
+            fun_id, offset = struct.unpack_from(self.endian + "HH", data, 1)
+            if offset == 0xFFFF:
+                return [] # end of data, no response
+            fun = self.dynld_functions.setdefault(fun_id, bytearray())
+            fun[offset:offset + len(data) - 5] = data[5:]
+            return [(ID_DYNLD_FUNCTION, 0)]
+        if id == ID_DYNLD_FUNEXEC:
+            return [bytes([ID_DYNLD_FUNEXEC]) + struct.pack(self.endian + "I", 0)]
+        return []
+
+    def _get(self, data):
+        id = data[0]
+        if id == ID_TRANSPORT and not self.legacy:
+            # supported flags
+            return [self._transport_caps(
+                (TRANSPORT_NATIVE_FRAMES if self.native_frames_supported else 0) |
+                (TRANSPORT_RGB_ACK if self.rgb_ack_supported else 0))]
+        if id == ID_STRUCT_LAYOUT:
+            layout_id = data[1]
+            responses = []
+            for sid, (size, flags, fields) in self.STRUCT_LAYOUTS.get(layout_id, {}).items():
+                payload = bytearray([ID_STRUCT_LAYOUT, layout_id, sid, size, flags])
+                for field in fields:
+                    payload.extend(field)
+                payload.append(0)
+                responses.append(payload)
+            return responses
+        if id == ID_CONFIG or id == ID_STATUS:
+            return [bytes([id, data[1]]) + self.structs[id][data[1]]]
+        if id == ID_MACWIN_MODE:
+            return [(ID_MACWIN_MODE, self.macwin_mode)]
+        if id == ID_COMBO:
+            return [bytes([ID_COMBO, data[1]]) + self.combos.get(data[1], bytes(18))]
+        if id == ID_TAP_DANCE:
+            return [bytes([ID_TAP_DANCE, data[1]]) + self.tap_dances.get(data[1], bytes(8))]
+        if id == ID_LEADER:
+            return [bytes([ID_LEADER, data[1]]) + self.leaders.get(data[1], bytes(12))]
+        if id == ID_MODULE:
+            return [self._module_read(data)]
+        return []
+
+    def _del(self, data):
+        if data[0] != ID_MODULE:
+            return []
+        slot_id = data[1]
+        if slot_id == MODULE_SLOT_RELOAD_DONE:
+            self.module_reload = False
+            return [(ID_MODULE, MODULE_RC_OK)]
+        if slot_id >= len(self.module_slots):
+            return [(ID_MODULE, MODULE_RC_ERROR)]
+        # unload only, the slot is erased with its sector on the next load
+        header = self._mem(self.module_slots[slot_id][0], 4)
+        header[:] = bytes(4)
+        return [(ID_MODULE, MODULE_RC_OK)]
+
+    def _transport_caps(self, flags):
+        return bytes([ID_TRANSPORT, 1, self.max_msg_len & 0xFF, self.max_msg_len >> 8, flags,
+                      self.rgb_codecs])
+
+    #---------------------------------------------------------------------------
+    def _rgb_set(self, index, rgb, duration, now):
+        if index < self.num_rgb_leds:
+            self.rgb_buf[index] = (*rgb, now + duration * self.rgb_tick_s)
+            self.rgb_pixel_writes += 1
+
+    def _rgb_frame_decode(self, data):
+        '''
+        reference decoder of ID_RGB_MATRIX_FRAME, yields (led index, (r, g, b))
+        [ID_RGB_MATRIX_FRAME, codec, duration, palette, run, run, ...]
+        palette (CODEC_PALETTE): [num colors, r, g, b, ...]
+        run: [first led, count, colors], palette index 4 bits (low nibble
+        first) for up to 16 colors
+        '''
+        codec, off = data[1], 3
+        if not self.rgb_codecs & (1 << codec):
+            return
+        palette = []
+        if codec == CODEC_PALETTE:
+            num_colors = data[off]
+            palette = [tuple(data[off + 1 + 3*i:off + 4 + 3*i]) for i in range(num_colors)]
+            off += 1 + 3 * num_colors
+        while off + 2 <= len(data):
+            first, count = data[off], data[off + 1]
+            off += 2
+            for i in range(count):
+                if codec == CODEC_RGB888:
+                    rgb = tuple(data[off:off + 3])
+                    off += 3
+                elif codec == CODEC_RGB565:
+                    c = data[off] | (data[off + 1] << 8)
+                    off += 2
+                    # expand to 8 bits, top bits repeated in the low bits
+                    r, g, b = c >> 11, (c >> 5) & 0x3F, c & 0x1F
+                    rgb = ((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2))
+                elif len(palette) <= 16:
+                    rgb = palette[(data[off + i // 2] >> (4 * (i % 2))) & 0x0F]
+                else:
+                    rgb = palette[data[off + i]]
+                yield first + i, rgb
+            if codec == CODEC_PALETTE:
+                off += (count + 1) // 2 if len(palette) <= 16 else count
+
+    #---------------------------------------------------------------------------
+    def _cli(self, cli_seq, cmd):
+        response = bytearray([ID_CLI, cli_seq])
+        cli_cmd = cmd[0]
+        if cli_cmd & 0x0F == CLI_CMD_CALL:
+            return response + struct.pack(self.endian + "I", 0)
+        if cli_cmd & CLI_CMD_LAYOUT:
+            return response # eeprom layout, not modeled
+        addr = struct.unpack_from(self.endian + "I", cmd, 1)[0]
+        size = min(cmd[5], self.max_response_len() - len(response) - 1)
+        if cli_cmd & 0x0F == CLI_CMD_MEMORY:
+            mem = self._mem(addr, size)
+        else:
+            mem = memoryview(self.eeprom)[addr:addr + size]
+        if mem is None:
+            return response
+        if cli_cmd & CLI_CMD_WRITE:
+            value = struct.pack(self.endian + "I", struct.unpack_from(self.endian + "I", cmd, 6)[0])
+            mem[:] = (value[:size] if self.endian == "<" else value[-size:])
+            return response
+        return response + mem
+
+    #---------------------------------------------------------------------------
+    def _sector_slots(self, slot_id):
+        slots_per_sector = getattr(self.model, "MODULE_FLASH_SLOTS_PER_SECTOR", 4)
+        first = slot_id - slot_id % slots_per_sector
+        return range(first, min(first + slots_per_sector, len(self.module_slots)))
+
+    def _erase_sector(self, slot_id):
+        for s in self._sector_slots(slot_id):
+            base, size = self.module_slots[s]
+            self._mem(base, size)[:] = b'\xff' * size
+        self.busy_s += self.sector_erase_s
+
+    def _module_write(self, data):
+        slot_id = data[1]
+        offset = data[2] | (data[3] << 8)
+        if slot_id == MODULE_SLOT_SECTOR_ERASE:
+            sector_id = data[3]
+            slots_per_sector = getattr(self.model, "MODULE_FLASH_SLOTS_PER_SECTOR", 4)
+            if sector_id * slots_per_sector >= len(self.module_slots):
+                return (ID_MODULE, MODULE_RC_ERROR)
+            self._erase_sector(sector_id * slots_per_sector)
+            self.module_reload = True
+            return (ID_MODULE, MODULE_RC_OK)
+        if slot_id >= len(self.module_slots):
+            return (ID_MODULE, MODULE_RC_ERROR)
+        base, size = self.module_slots[slot_id]
+        if offset != 0xFFFF:
+            declared_len = data[4]
+            chunk = data[5:5 + declared_len]
+            if len(chunk) != declared_len or offset + declared_len > size:
+                return (ID_MODULE, MODULE_RC_ERROR)
+            staging = self.module_staging.setdefault(slot_id, bytearray())
+            if len(staging) < offset + declared_len:
+                staging.extend(bytes(offset + declared_len - len(staging)))
+            staging[offset:offset + declared_len] = chunk
+            return (ID_MODULE, MODULE_RC_OK)
+
+        # finalize: validate, erase the sector if needed and program the slot
+        binary = self.module_staging.pop(slot_id, None)
+        if not binary or len(binary) < 32 or struct.unpack_from("<I", binary, 0)[0] != MODULE_MAGIC:
+            return (ID_MODULE, MODULE_RC_ERROR)
+        flash = self._mem(base, size)
+        if any(b != 0xFF for b in flash[:len(binary)]):
+            if self.module_reload:
+                return (ID_MODULE, MODULE_RC_ERROR) # can't program 0 -> 1
+            self._erase_sector(slot_id)
+        flash[:len(binary)] = binary
+        return (ID_MODULE, MODULE_RC_OK)
+
+    def _module_read(self, data):
+        slot_id = data[1]
+        if slot_id == MODULE_SLOT_SUMMARY:
+            response = bytearray([ID_MODULE, MODULE_SLOT_SUMMARY])
+            for base, _ in self.module_slots:
+                response.extend(self._mem(base, 4))
+            return response
+        if slot_id >= len(self.module_slots):
+            return (ID_MODULE, MODULE_RC_ERROR)
+        base, size = self.module_slots[slot_id]
+        if len(data) < 4:
+            # slot header: magic, flags, hook bitmap
+            header = bytes(self._mem(base, 16))
+            return bytes([ID_MODULE, slot_id]) + header[0:4] + header[6:8] + header[12:16] + bytes(1)
+        offset = data[2] | (data[3] << 8)
+        # [seqnum, ID_MODULE, slot, off_lo, off_hi, chunk_len, data...]
+        chunk_len = max(0, min(self.max_response_len() - 6, 0xFF, size - offset))
+        if chunk_len == 8:
+            chunk_len -= 1 # 13 byte response is the slot header
+        return bytes([ID_MODULE, slot_id, offset & 0xFF, offset >> 8, chunk_len]) + \
+            self._mem(base + offset, chunk_len)
+
+
+#-------------------------------------------------------------------------------
+class SimulatedHidDevice:
+    '''
+    hid.device stand-in connected to a SimulatedFirmware.
+
+    Models a full speed interrupt endpoint: every report in either direction
+    takes one report_interval_s slot, responses become readable latency_s
+    after the request (plus any firmware busy time, e.g. flash erase).
+    report_interval_s=0 and latency_s=0 run without any sleeps.
+    '''
+    def __init__(self, firmware, epsize=64, report_interval_s=0.001, latency_s=0.0005):
+        self.firmware = firmware
+        self.epsize = epsize
+        self.report_interval_s = report_interval_s
+        self.latency_s = latency_s
+        self.cond = threading.Condition()
+        self.in_reports = deque() # (ready time, report)
+        self.out_busy_until = 0
+        self.in_busy_until = 0
+        self.msg = None # message being reassembled from FA/FB reports
+        # a full report ending in END_SYSEX may still be continued, the message
+        # is handled when the next report starts a new one or the pipe is idle
+        self.msg_idle_s = max(2 * report_interval_s, 0.002)
+        self.msg_end_at = None
+        self.num_out_reports = 0
+        self.num_in_reports = 0
+        self.closed = False
+
+    def write(self, report):
+        # report: [report id, FIRMATA_MSG|FIRMATA_MSG_CONT, data...]
+        now = time.monotonic()
+        self.out_busy_until = max(now, self.out_busy_until) + self.report_interval_s
+        if self.out_busy_until > now:
+            time.sleep(self.out_busy_until - now)
+        self.num_out_reports += 1
+
+        marker, data = report[1], bytes(report[2:])
+        with self.cond:
+            if marker == SerialRawHID.FIRMATA_MSG:
+                self._end_msg()
+                self.msg = bytearray(data)
+            elif marker == SerialRawHID.FIRMATA_MSG_CONT and self.msg is not None:
+                self.msg.extend(data)
+            else:
+                return len(report)
+            self.msg_end_at = None
+            if len(data) < self.epsize - 2:
+                self._end_msg()
+            elif data[-1] == END_SYSEX:
+                self.msg_end_at = time.monotonic() + self.msg_idle_s
+                self.cond.notify_all()
+        return len(report)
+
+    def _end_msg(self):
+        if self.msg is not None:
+            msg, self.msg, self.msg_end_at = self.msg, None, None
+            self.deliver(*self.firmware.handle_message(msg))
+
+    def deliver(self, frames, busy_s=0):
+        '''queue response frames as input reports'''
+        with self.cond:
+            ready = max(time.monotonic() + self.latency_s, self.in_busy_until) + busy_s
+            for frame in frames:
+                marker = SerialRawHID.FIRMATA_MSG
+                for off in range(0, len(frame), self.epsize - 1):
+                    chunk = frame[off:off + self.epsize - 1]
+                    report = bytes([marker]) + chunk + bytes(self.epsize - 1 - len(chunk))
+                    ready += self.report_interval_s
+                    self.in_reports.append((ready, report))
+                    marker = SerialRawHID.FIRMATA_MSG_CONT
+            self.in_busy_until = ready
+            self.cond.notify_all()
+
+    def read(self, size, timeout=0):
+        '''next input report (without report id), [] on timeout (ms)'''
+        deadline = time.monotonic() + timeout / 1000
+        with self.cond:
+            while not self.closed:
+                now = time.monotonic()
+                if self.msg_end_at is not None and self.msg_end_at <= now:
+                    self._end_msg()
+                if self.in_reports and self.in_reports[0][0] <= now:
+                    self.num_in_reports += 1
+                    return list(self.in_reports.popleft()[1][:size])
+                if now >= deadline:
+                    return []
+                wait_s = deadline - now
+                if self.in_reports:
+                    wait_s = min(wait_s, self.in_reports[0][0] - now)
+                if self.msg_end_at is not None:
+                    wait_s = min(wait_s, self.msg_end_at - now)
+                self.cond.wait(wait_s)
+        return []
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+#-------------------------------------------------------------------------------
+class SimulatedRawHID(SerialRawHID):
+    '''
+    SerialRawHID on a SimulatedHidDevice, pass as transport= to QMKataKeyboard
+    to run the host stack (reader thread, framing, transfers) without hardware.
+    '''
+    def __init__(self, firmware=None, epsize=64, report_interval_s=0.001, latency_s=0.0005, timeout=100):
+        self.firmware = firmware if firmware else SimulatedFirmware()
+        self.device = SimulatedHidDevice(self.firmware, epsize, report_interval_s, latency_s)
+        vid, pid = (0, 0)
+        try:
+            vid, pid = self.firmware.model.vid_pid()
+        except Exception:
+            pass
+        super().__init__(vid, pid, epsize, timeout)
+
+    def __str__(self) -> str:
+        return "SIMULATED RAWHID: vid={:04x}, pid={:04x}".format(self.vid, self.pid)
+
+    def open(self):
+        self.device.closed = False
+        self.hid_device = self.device
+        self.data.consume(len(self.data))
+        self.write(bytearray([0xf0, 0x71, 0xf7]))
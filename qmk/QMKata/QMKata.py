@@ -794,6 +794,12 @@ class MainWindow(QMainWindow):
         self.rgb_matrix_tab.rgb_audio_tab.signal_peak_levels.connect(
             self.rgb_matrix_tab.rgb_animation_tab.on_audio_peak_levels
         )
+        self.rgb_matrix_tab.rgb_audio_tab.signal_audio_beat.connect(
+            self.rgb_matrix_tab.rgb_animation_tab.on_audio_beat
+        )
+        self.rgb_matrix_tab.rgb_audio_tab.signal_audio_beat.connect(
+            self.keyboard.keyb_audio_beat
+        )
         self.rgb_matrix_tab.rgb_dynld_animation_tab.signal_dynld_function.connect(
             self.keyboard.keyb_set_dynld_function
         )
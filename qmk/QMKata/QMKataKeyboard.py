@@ -20,10 +20,18 @@ from PySide6.QtCore import Signal
 from PySide6.QtGui import QImage, QColor, QPainter
 
 import pyfirmata2, serial, time, numpy as np
-import glob, inspect, os, importlib.util, struct
+import glob, inspect, os, importlib.util, struct, threading
 from pathlib import Path
 
 from SerialRawHID import SerialRawHID
+from ResponseDispatcher import ResponseDispatcher
+from WindowedTransfer import WindowedTransfer
+from RGBCompositor import RGBCompositor
+from RGBFlowControl import RGBFlowControl
+from RGBFrameCodec import RGBFrameCodec
+from RGBFrameEncoder import RGBFrameEncoder
+from RGBOutputScheduler import RGBOutputScheduler
+from RGBFrameRecord import RGBFrameRecorder, RGBFrameReplay
 from DebugTracer import DebugTracer
 
 
@@ -62,29 +70,6 @@ def find_com_port(vid, pid):
 
 
 # region combine images
-def combine_qimages(img1, img2):
-    # Ensure the images are the same size
-    if img1.size() != img2.size():
-        print("Images are not the same size!")
-        return img1
-
-    for x in range(img1.width()):
-        for y in range(img1.height()):
-            pixel1 = img1.pixel(x, y)
-            pixel2 = img2.pixel(x, y)
-            # Extract RGB values
-            r1, g1, b1, _ = QColor(pixel1).getRgb()
-            r2, g2, b2, _ = QColor(pixel2).getRgb()
-            # Add the RGB values
-            r = min(r1 + r2, QMKataKeyboard.MAX_RGB_VAL)
-            g = min(g1 + g2, QMKataKeyboard.MAX_RGB_VAL)
-            b = min(b1 + b2, QMKataKeyboard.MAX_RGB_VAL)
-            # Set the new pixel value
-            img1.setPixel(x, y, QColor(r, g, b).rgb())
-
-    return img1
-
-
 def combine_qimages_painter(img1, img2):
     # Ensure the images are the same size
     if img1.size() != img2.size():
@@ -114,6 +99,10 @@ class DefaultKeyboardModel:
 
     DEFAULT_LAYER = 2
     NUM_LAYERS = 8
+    TRANSFER_WINDOW = 4  # chunk requests in flight for module/dynld transfers
+    RGB_DELTA_THRESHOLD = 0  # resend a led when a channel changed more than this
+    RGB_LED_MAX_AGE = 0.25  # s, resend unchanged leds before their pixel duration ends
+    RGB_FRAME_CODECS = ("palette", "rgb888")  # preferred, "rgb565" is lossy
 
     def __init__(self, name):
         self.name = name
@@ -162,6 +151,11 @@ class QMKataKeybCmd_v0_3(QMKataKeybCmd_v0_2):
     ID_TAP_DANCE = 12
     ID_LEADER = 13
     ID_MODULE = 14
+    ID_TRANSPORT = 15  # transport capabilities (multi-report framing), optional in firmware
+    ID_RGB_MATRIX_FRAME = 16  # compact rgb frame (RGBFrameCodec), codecs in the transport caps
+    # ----------------------------------------------------
+    TRANSPORT_NATIVE_FRAMES = 0x01  # ID_TRANSPORT flag: 8 bit response/pub frames
+    TRANSPORT_RGB_ACK = 0x02  # ID_TRANSPORT flag: rgb buf packets acked with credits
 
 
 # use always latest, no plan for backward compatibility support for now
@@ -262,6 +256,7 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
 
     RAW_EPSIZE_FIRMATA = 64  # 32
     MAX_LEN_SYSEX_DATA = 60
+    MAX_LEN_SYSEX_MSG = 512  # host limit for a sysex message spanning multiple reports
 
     # -------------------------------------------------------------------------------
     # kb object in "keyboard script" tab
@@ -549,13 +544,20 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         # ----------------------------------------------------
         self.samplerThread = None
 
-        self.img = {}  # sender -> rgb QImage
-        self.img_ts_prev = 0  # previous image timestamp
+        self.rgb_compositor = RGBCompositor()  # sender -> latest rgb frame
+        self.rgb_output = None  # RGBOutputScheduler, sends the composed frames
+        self.rgb_encoder = None  # RGBFrameEncoder for the current image size
+        self.rgb_composed = None  # (size, rgb multiplier) of the composed frames published
+        self.rgb_record_path = None  # recording of the sent led colors (RGBFrameRecord)
+        self.rgb_recorder = None
+        self.rgb_record_lock = threading.Lock()  # recorder of the output thread vs keyb_rgb_record()
+        self.rgb_replay = None  # RGBFrameReplay, its frames instead of the composed ones
 
         self.name = None
         self.port = None
         self.vid_pid = None
         self.firmware_path = None
+        transport = None  # e.g. KeyboardSimulator.SimulatedRawHID instead of the device port
         for arg in kwargs:
             if arg == "name":
                 self.name = kwargs[arg]
@@ -565,11 +567,18 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
                 self.vid_pid = kwargs[arg]
             if arg == "firmware_path":
                 self.firmware_path = kwargs[arg]
+            if arg == "transport":
+                transport = kwargs[arg]
 
         if self.name == None:
             self.name = self.port
 
         self.port_type = "serial"
+        self.transport_caps = None
+        self.native_frames = False
+        self.rgb_ack = False
+        self.rgb_flow = None  # RGBFlowControl, paces rgb buf packets
+        self.rgb_codec = None  # RGBFrameCodec, if the keyboard supports ID_RGB_MATRIX_FRAME
 
         # load "keyboard models", keyboard model contains name, vid/pid, rgb matrix size, ...
         self.keyboardModel, self.keyboardModelVidPid = self.load_keyboard_models()
@@ -590,7 +599,8 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             except Exception as e:
                 pass
 
-            self.port = find_com_port(self.vid_pid[0], self.vid_pid[1])
+            if not transport:
+                self.port = find_com_port(self.vid_pid[0], self.vid_pid[1])
             self.dbg.tr(
                 "D", "using keyboard: {} on port {}", self.keyboardModel, self.port
             )
@@ -599,7 +609,12 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         self.kb_script_env = self.KeybScriptEnv(self, firmware_path=self.firmware_path)
 
         self.samplerThread = pyfirmata2.util.Iterator(self)
-        if self.port_type == "rawhid":
+        if transport:
+            self.sp = transport
+            if isinstance(transport, SerialRawHID):
+                self.port_type = "rawhid"
+                self.MAX_LEN_SYSEX_DATA = transport.epsize - 6
+        elif self.port_type == "rawhid":
             self.sp = SerialRawHID(
                 self.vid_pid[0], self.vid_pid[1], self.RAW_EPSIZE_FIRMATA
             )
@@ -646,6 +661,26 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             self.dbg.tr("D", "default_layer: {}", e)
         return DefaultKeyboardModel.DEFAULT_LAYER
 
+    def transfer_window(self):
+        return getattr(
+            self.keyboardModel, "TRANSFER_WINDOW", DefaultKeyboardModel.TRANSFER_WINDOW
+        )
+
+    def rgb_delta_threshold(self):
+        return getattr(
+            self.keyboardModel, "RGB_DELTA_THRESHOLD", DefaultKeyboardModel.RGB_DELTA_THRESHOLD
+        )
+
+    def rgb_frame_codecs(self):
+        return getattr(
+            self.keyboardModel, "RGB_FRAME_CODECS", DefaultKeyboardModel.RGB_FRAME_CODECS
+        )
+
+    def rgb_led_max_age(self):
+        return getattr(
+            self.keyboardModel, "RGB_LED_MAX_AGE", DefaultKeyboardModel.RGB_LED_MAX_AGE
+        )
+
     def xy_to_rgb_index(self, x, y):
         xy_to_rgb_index = DefaultKeyboardModel.xy_to_rgb_index
         if self.keyboardModel:
@@ -678,10 +713,10 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
 
         self.key_machine = KeyMachine(self)
 
-        self.sysex_response = {}
-        self.sysex_response[QMKataKeybCmd.ID_CLI] = {}
-        self.sysex_response[QMKataKeybCmd.ID_DYNLD_FUNEXEC] = {}
-        self.sysex_response_seq = {}
+        # responses are keyed by sysex seqnum, CLI responses by (ID_CLI, cli seqnum)
+        # and dynld funexec by (ID_DYNLD_FUNEXEC,)
+        self.response_dispatcher = ResponseDispatcher()
+        self.sysex_send_lock = threading.Lock()
         self.sysex_seqnum = 0
         self.keyb_cli_seqnum = (
             0  # todo: remove when sysex message sequence number is used
@@ -696,9 +731,20 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         self.add_cmd_handler(pyfirmata2.STRING_DATA, self.console_line_handler)
         self.add_cmd_handler(QMKataKeybCmd.RESPONSE, self.sysex_response_handler)
         self.add_cmd_handler(QMKataKeybCmd.PUB, self.sysex_pub_handler)
-
-        self.samplingOn()
+        # native 8 bit frames (see handle_frame), same handlers without 7 bit decode
+        self.frame_handlers = {
+            QMKataKeybCmd.RESPONSE: self.response_handler,
+            QMKataKeybCmd.PUB: self.pub_handler,
+        }
+
+        if hasattr(self.sp, "start_reader"):
+            # rawhid: reader thread hands complete frames to handle_frame,
+            # the pyfirmata byte-at-a-time iterator isn't used
+            self.sp.start_reader(self.handle_frame)
+        else:
+            self.samplingOn()
         self.send_sysex(pyfirmata2.REPORT_FIRMWARE, [])
+        self.keyb_get_transport()
         self.send_sysex(
             QMKataKeybCmd.GET, [QMKataKeybCmd.ID_STRUCT_LAYOUT, QMKataKeybCmd.ID_CONFIG]
         )
@@ -759,7 +805,14 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             self.keyb_get_leader(slot)
 
     def stop(self):
+        self.keyb_rgb_replay(None)
+        if self.rgb_output:
+            self.rgb_output.stop()
+            self.rgb_output = None
+        self.keyb_rgb_record(None)
         try:
+            if hasattr(self.sp, "stop_reader"):
+                self.sp.stop_reader()
             self.sp.close()
         except Exception as e:
             self.dbg.tr("E", "stop: {}", e)
@@ -783,20 +836,57 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             super().send_sysex(sysex_cmd, encoded_data)
             return
 
-        seqnum = self.sysex_seqnum
-        msg = bytearray([pyfirmata2.START_SYSEX + 1, sysex_cmd, seqnum])
-        msg.extend(encoded_data)
-        msg.append(
-            pyfirmata2.END_SYSEX
-        )  # todo: remove, not needed when processing directly from rawhid buffer on device, only needed when putting first in "serial buffer" and process it later
-        try:
-            n_written = self.sp.write(msg)
-        except Exception as e:
-            self.dbg.tr("E", "send_sysex: {}", e)
-            return 0
-        self.sysex_seqnum = (self.sysex_seqnum + 1) % 256
+        with self.sysex_send_lock:
+            seqnum = self.sysex_seqnum
+            msg = bytearray([pyfirmata2.START_SYSEX + 1, sysex_cmd, seqnum])
+            msg.extend(encoded_data)
+            msg.append(
+                pyfirmata2.END_SYSEX
+            )  # todo: remove, not needed when processing directly from rawhid buffer on device, only needed when putting first in "serial buffer" and process it later
+            # register before writing, the response may arrive before write() returns
+            self.response_dispatcher.expect(seqnum)
+            try:
+                n_written = self.sp.write(msg)
+            except Exception as e:
+                self.response_dispatcher.cancel(seqnum)
+                self.dbg.tr("E", "send_sysex: {}", e)
+                return 0
+            self.sysex_seqnum = (self.sysex_seqnum + 1) % 256
         return n_written, seqnum
 
+    def handle_frame(self, frame):
+        """Dispatch one complete firmata frame (called from the rawhid reader thread).
+
+        Same handler lookup as pyfirmata2.Board.iterate, but the frame is
+        passed in one call instead of being read byte by byte.
+
+        Native qmkata frames (negotiated with ID_TRANSPORT) carry 8 bit data:
+            [START_SYSEX+1, cmd, len_lo, len_hi, data..., END_SYSEX]
+        data is passed to the frame handler as a slice of the reader buffer,
+        it is only valid during the call.
+        """
+        cmd = frame[0]
+        if cmd == pyfirmata2.START_SYSEX + 1:
+            if handler := self.frame_handlers.get(frame[1]):
+                handler(frame[4:-1])
+            return
+        if cmd == pyfirmata2.START_SYSEX:
+            handler = self._command_handlers.get(frame[1])
+            data = frame[2:-1]
+        elif cmd < pyfirmata2.START_SYSEX:
+            # channel message, channel in the low nibble
+            handler = self._command_handlers.get(cmd & 0xF0)
+            data = [cmd & 0x0F, *frame[1:]]
+        else:
+            handler = self._command_handlers.get(cmd)
+            data = frame[1:]
+        if not handler:
+            return
+        try:
+            handler(*data)
+        except ValueError:
+            pass
+
     def _sysex_data_to_bytearray(self, data):
         buf = bytearray()
         if len(data) % 2 != 0:
@@ -809,9 +899,13 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         return buf
 
     def sysex_pub_handler(self, *data):
+        if buf := self._sysex_data_to_bytearray(data):
+            self.pub_handler(buf)
+
+    def pub_handler(self, buf):
         dbg_zone = "SYSEX_PUB"
         dbg_print = self.dbg.enabled(dbg_zone)
-        if not (buf := self._sysex_data_to_bytearray(data)):
+        if not buf:
             return
         if dbg_print:
             self.dbg.tr(dbg_zone, "-" * 40)
@@ -829,6 +923,15 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
 
     # -------------------------------------------------------------------------------
     def sysex_response_handler(self, *data):
+        if buf := self._sysex_data_to_bytearray(data):
+            self.response_handler(buf)
+
+    def response_handler(self, buf):
+        """Handle a decoded response: [seqnum, ID, ...]
+
+        buf may be a memoryview into the reader buffer, anything kept after
+        returning (completed responses, signal payloads) must be copied.
+        """
         dbg_zone = "SYSEX_RESPONSE"
         dbg_print = self.dbg.enabled(dbg_zone)
 
@@ -836,7 +939,7 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             if self.dbg.enabled(dbg_zone):
                 self.dbg.tr(dbg_zone, *args, **kwargs)
 
-        if not (buf := self._sysex_data_to_bytearray(data)):
+        if not buf:
             return
         if dbg_print:
             dbg("-" * 40)
@@ -846,23 +949,31 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             seqnum = buf[0]
             buf = buf[1:]
             if buf[0] == QMKataKeybCmd.ID_CLI:
-                dbg("cli response: {}", buf)
+                dbg("cli response: {}", buf.hex(" "))
                 cli_seq = buf[1]
-                buf.pop(0)
-                buf.pop(0)
-                self.sysex_response[QMKataKeybCmd.ID_CLI][cli_seq] = buf
+                self.response_dispatcher.complete(
+                    (QMKataKeybCmd.ID_CLI, cli_seq), bytearray(buf[2:])
+                )
                 return
             if buf[0] == QMKataKeybCmd.ID_DYNLD_FUNCTION:
                 return_code = buf[1]
-                self.sysex_response_seq[seqnum] = return_code
-                dbg("dynld set function response: {}, {}", buf, return_code)
+                self.response_dispatcher.complete(seqnum, return_code)
+                dbg("dynld set function response: {}, {}", buf.hex(" "), return_code)
                 return
             if buf[0] == QMKataKeybCmd.ID_DYNLD_FUNEXEC:
-                dbg("dynld funexec response: {}", buf)
+                dbg("dynld funexec response: {}", buf.hex(" "))
                 return_code = struct.unpack_from(self.pack_endian + "I", buf, 1)[0]
-                self.sysex_response[QMKataKeybCmd.ID_DYNLD_FUNEXEC] = return_code
+                self.response_dispatcher.complete((QMKataKeybCmd.ID_DYNLD_FUNEXEC,), return_code)
                 # buf.pop(0); buf.pop(0)
                 return
+            if buf[0] in (QMKataKeybCmd.ID_RGB_MATRIX_BUF, QMKataKeybCmd.ID_RGB_MATRIX_FRAME):
+                # [ID_RGB_MATRIX_BUF|FRAME, credits], TRANSPORT_RGB_ACK
+                self.response_dispatcher.complete(seqnum, buf[1])
+                return
+            if buf[0] == QMKataKeybCmd.ID_TRANSPORT:
+                dbg("transport response: {}", buf.hex(" "))
+                self.response_dispatcher.complete(seqnum, bytes(buf))
+                return
             if buf[0] == QMKataKeybCmd.ID_MACWIN_MODE:
                 macwin_mode = chr(buf[1])
                 dbg("macwin mode: {}", macwin_mode)
@@ -900,8 +1011,8 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             if buf[0] == QMKataKeybCmd.ID_MODULE:
                 if len(buf) <= 2:
                     # Chunk ACK or DEL response (3 bytes on wire incl. seqnum)
-                    self.sysex_response_seq[seqnum] = buf[1]
-                    dbg("module ACK response: {}, rc={}", buf, buf[1])
+                    self.response_dispatcher.complete(seqnum, buf[1])
+                    dbg("module ACK response: {}, rc={}", buf.hex(" "), buf[1])
                     return
                 if buf[1] == 0xFF:
                     # GET summary response
@@ -945,7 +1056,7 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
                     return
                 # Chunked binary read response (6+chunk bytes, never 13):
                 # [ID_MODULE, slot_id, off_lo, off_hi, chunk_len, data...]
-                self.sysex_response_seq[seqnum] = buf
+                self.response_dispatcher.complete(seqnum, bytearray(buf))
                 dbg("module binary chunk: slot={} off={} len={}",
                     buf[1], buf[2] | (buf[3] << 8), buf[4])
                 return
@@ -1084,7 +1195,7 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
                             item_type_size = 8
                         elif item_type == TYPE_FLOAT:
                             item_type_size = 4
-                        value = buf[off : off + (field_size * item_type_size)]
+                        value = bytearray(buf[off : off + (field_size * item_type_size)])
                     else:
                         value = 0
                     field_values[field_id] = value
@@ -1161,6 +1272,9 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
     def wait_for_response(self, seqnum, timeout_s=None):
         """Wait for a sysex response with the given seqnum.
 
+        Returns as soon as sysex_response_handler completes the seqnum
+        (no polling), (True, response) or None on timeout.
+
         timeout_s: overall timeout. Defaults to keyb_poll_time * 100 (~100ms).
             Callers performing operations known to block the firmware for
             >100ms (e.g. flash sector erase) should pass a larger timeout
@@ -1169,16 +1283,11 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         """
         if timeout_s is None:
             timeout_s = self.keyb_poll_time * 100
-        timed_out = False
-        start = now = time.monotonic()
-        while not timed_out:
-            time.sleep(self.keyb_poll_time)
-            if seqnum in self.sysex_response_seq:
-                return True, self.sysex_response_seq.pop(seqnum, None)
-            now = time.monotonic()
-            timed_out = now - start > timeout_s
+        start = time.monotonic()
+        if response := self.response_dispatcher.wait(seqnum, timeout_s):
+            return response
         self.dbg.tr(
-            "E", "response timeout seqnum:{} start-now:{}-{}", hex(seqnum), start, now
+            "E", "response timeout seqnum:{} start-now:{}-{}", hex(seqnum), start, time.monotonic()
         )
         return None
 
@@ -1202,6 +1311,85 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
                 return False
         return response_received
 
+    # send chunks with up to transfer_window() requests in flight
+    def send_sysex_windowed(self, sysex_cmd, chunks, validate=None, timeout_s=None):
+        """Send (offset, data) chunks pipelined, see WindowedTransfer.
+
+        Returns dict offset -> response, or None if a chunk could not be
+        transferred.
+        """
+        transfer = WindowedTransfer(self, self.transfer_window(), timeout_s)
+        responses = transfer.run(sysex_cmd, chunks, validate)
+        self.dbg.tr(
+            "SYSEX_COMMAND",
+            "send_sysex_windowed: sends={}, retransmits={}",
+            transfer.num_sends,
+            transfer.num_retransmits,
+        )
+        return responses
+
+    def keyb_get_transport(self, timeout_s=0.2):
+        """Negotiate the max sysex message length with the keyboard.
+
+        Response: [ID_TRANSPORT, version, max_msg_len_lo, max_msg_len_hi, flags, rgb codecs]
+        max_msg_len is the largest sysex message (START..END) the firmware
+        reassembles from continuation reports. Firmware without ID_TRANSPORT
+        doesn't respond, then single report messages are used as before.
+        rgb codecs (optional): ID_RGB_MATRIX_FRAME codecs bit mask, see RGBFrameCodec.
+        """
+        if not hasattr(self.sp, "set_max_msg_size"):
+            return None
+        if not (sent := self.send_sysex(QMKataKeybCmd.GET, [QMKataKeybCmd.ID_TRANSPORT])):
+            return None
+        # no retries, old firmware never answers
+        if not (response := self.response_dispatcher.wait(sent[1], timeout_s)):
+            self.dbg.tr("D", "keyb_get_transport: no response, single report framing")
+            return None
+        buf = response[1]
+        if len(buf) < 5:
+            return None
+        self.transport_caps = {
+            "version": buf[1],
+            "max_msg_len": buf[2] | (buf[3] << 8),
+            "flags": buf[4],
+            "rgb_codecs": buf[5] if len(buf) >= 6 else 0,
+        }
+        self.rgb_codec = RGBFrameCodec(self.transport_caps["rgb_codecs"], self.rgb_frame_codecs())
+        max_msg_len = min(self.transport_caps["max_msg_len"], self.MAX_LEN_SYSEX_MSG)
+        if max_msg_len > self.sp.MAX_DATA_SIZE:
+            self.sp.set_max_msg_size(max_msg_len)
+            # sysex start/end, cmd and seqnum
+            self.MAX_LEN_SYSEX_DATA = max_msg_len - 4
+        flags = self.transport_caps["flags"] & QMKataKeybCmd.TRANSPORT_RGB_ACK
+        if hasattr(self.sp, "start_reader"):
+            # native frames are only split by the rawhid reader thread,
+            # the pyfirmata iterator keeps getting 7 bit sysex
+            flags |= self.transport_caps["flags"] & QMKataKeybCmd.TRANSPORT_NATIVE_FRAMES
+        if flags:
+            flags = self.keyb_set_transport(flags, timeout_s)
+            self.native_frames = bool(flags & QMKataKeybCmd.TRANSPORT_NATIVE_FRAMES)
+            self.rgb_ack = bool(flags & QMKataKeybCmd.TRANSPORT_RGB_ACK)
+        self.dbg.tr(
+            "D",
+            "keyb_get_transport: {}, max sysex data len {}, native frames {}, rgb ack {}",
+            self.transport_caps,
+            self.MAX_LEN_SYSEX_DATA,
+            self.native_frames,
+            self.rgb_ack,
+        )
+        return self.transport_caps
+
+    def keyb_set_transport(self, flags, timeout_s=0.2):
+        """Enable transport flags, returns the flags the firmware enabled.
+
+        Response: same as the GET response, with the flags now in effect.
+        """
+        data = [QMKataKeybCmd.ID_TRANSPORT, flags]
+        if not (response := self.send_sysex_wait(QMKataKeybCmd.SET, data, timeout_s)):
+            return 0
+        buf = response[1]
+        return buf[4] & flags if len(buf) >= 5 else 0
+
     def keyb_set_cli_command(self, cmd):
         dbg_zone = "CLI"
         dbg_print = self.dbg.enabled(dbg_zone)
@@ -1261,13 +1449,16 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
 
         cli_seq = self.keyb_cli_seqnum % 256
         self.keyb_cli_seqnum += 1
+        response_key = (QMKataKeybCmd.ID_CLI, cli_seq)
         data = bytearray()
         try:
             data.append(QMKataKeybCmd.ID_CLI)
             data.append(cli_seq)
             data.extend(cmd_ba)
+            self.response_dispatcher.expect(response_key)
             self.send_sysex(QMKataKeybCmd.SET, data)
         except Exception as e:
+            self.response_dispatcher.cancel(response_key)
             self.dbg.tr("E", "keyb_set_cli_command: {}", e)
             return None
 
@@ -1275,15 +1466,10 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         wait_for_response = True
         response = None
         if wait_for_response:
-            timed_out = False
-            start = time.monotonic()
-            while response == None and not timed_out:
-                time.sleep(self.keyb_poll_time * 2)
-                try:
-                    response = self.sysex_response[QMKataKeybCmd.ID_CLI][cli_seq]
-                    del self.sysex_response[QMKataKeybCmd.ID_CLI][cli_seq]
-                except:
-                    timed_out = time.monotonic() - start > self.keyb_poll_time * 100
+            if received := self.response_dispatcher.wait(
+                response_key, self.keyb_poll_time * 100
+            ):
+                response = received[1]
 
             if dbg_print:
                 response_str = "none"
@@ -1336,92 +1522,215 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
 
         # self.dbg.tr('RGB_BUF', "rgb data: {}", data.hex(' '))
         self.send_sysex(QMKataKeybCmd.SET, data)
+        if self.rgb_encoder:
+            self.rgb_encoder.reset()  # next image frame overwrites these pixels
 
     def keyb_set_rgb_image(self, img, rgb_multiplier):
-        dbg_zone = "RGB_BUF"
-        if self.dbg_rgb_buf:
-            self.dbg.tr(dbg_zone, "-" * 120)
-            self.dbg.tr(dbg_zone, "rgb mult {}", rgb_multiplier)
+        """Rgb image from a sender (signal_rgb_image), None: sender stopped.
 
+        Only stores the frame, the rgb output thread composes the senders'
+        latest frames and sends them at rgb_max_refresh.
+        """
         # self.dbg.tr('D', "rgb img from sender {} {}", self.sender(), img)
         if not img:
             self.dbg.tr("D", "rgb sender {} stopped", self.sender())
-            if self.sender() in self.img:
-                self.img.pop(self.sender())
+            self.rgb_compositor.remove_frame(self.sender())
+            if self.rgb_compositor.num_frames() == 0:
+                self.rgb_composed = None
+                if self.rgb_output and not (self.rgb_replay and self.rgb_replay.running):
+                    self.rgb_output.publish(None)
             return
 
         # multiple images senders -> combine images
-        combined_img = img
-        # prev_img = self.img[self.sender()]
-        if len(self.img) > 1:
-            combined_img = img.copy()
-            for key in self.img:
-                if key != self.sender():
-                    # self.dbg.tr('D', "combine image from {}", key)
-                    combined_img = combine_qimages(combined_img, self.img[key])
-
-        # if not self.sender() in self.img:
-        # self.dbg.tr('D', "new sender {} {}", self.sender(), img)
-        self.img[self.sender()] = img
-        img = combined_img
-        # max refresh
-        if time.monotonic() - self.img_ts_prev < 1 / self._rgb_max_refresh:
-            if self.dbg_rgb_buf:
-                self.dbg.tr(dbg_zone, "skip")
+        self.rgb_compositor.set_frame(self.sender(), self.qimage_to_rgb_array(img))
+        self.rgb_composed = ((img.height(), img.width()), rgb_multiplier)
+        if self.rgb_replay and self.rgb_replay.running:
+            return  # composed again when the replay ends
+        self.rgb_output_scheduler().publish(self.rgb_composed)
+
+    def rgb_output_scheduler(self):
+        if not self.rgb_output:
+            self.rgb_output = RGBOutputScheduler(
+                self.rgb_output_tick, self.rgb_max_refresh(), "rgb_output"
+            )
+        return self.rgb_output
+
+    def rgb_output_tick(self, frame):
+        """rgb output thread: compose the latest frames and send, or send
+        replayed led colors ("leds", size, led index, colors)."""
+        if frame[0] == "leds":
+            self.keyb_send_rgb_leds(*frame[1:])
+            replay = self.rgb_replay
+            if not (replay and replay.running) and self.rgb_output.slot is frame:
+                # replay ended after its last frame was sent: the composed frames
+                # (if any) instead of sending that one again and again
+                self.rgb_output.publish(self.rgb_composed)
             return
-        self.img_ts_prev = time.monotonic()
+        size, rgb_multiplier = frame
+        arr = self.rgb_compositor.compose(size)
+        if arr is not None:
+            self.keyb_send_rgb_frame(arr, rgb_multiplier)
+
+    def keyb_rgb_record(self, path):
+        """Record the led colors sent from now on into path (RGBFrameRecord), None: stop.
+        Frames of another image size than the first one recorded are not recorded."""
+        with self.rgb_record_lock:
+            recorder = self.rgb_recorder
+            self.rgb_recorder = None
+            self.rgb_record_path = path
+        if recorder:
+            recorder.close()
+            self.dbg.tr("D", "rgb recording {}: {} frames", recorder.path, recorder.num_frames)
+
+    def rgb_record(self, encoder, colors):
+        """rgb output thread: append the colors of a sent frame to the recording."""
+        with self.rgb_record_lock:
+            path = self.rgb_record_path
+            if not path:
+                return  # stopped meanwhile
+            recorder = self.rgb_recorder
+            if not recorder:
+                try:
+                    recorder = RGBFrameRecorder(path, *encoder.size, encoder.led_index)
+                except OSError as e:
+                    self.dbg.tr("E", "rgb recording: {}", e)
+                    self.rgb_record_path = None
+                    return
+                self.rgb_recorder = recorder
+            if recorder.matches(*encoder.size, encoder.led_index):
+                recorder.write(colors)
+
+    def keyb_rgb_replay(self, path, speed=1.0, start_s=0.0, loop=False):
+        """Send the frames of a recording (RGBFrameRecord) at their recorded times
+        (speed: faster/slower) instead of the composed frames, None: stop.
+        Returns the RGBFrameReplay (len, duration, seek())."""
+        replay = self.rgb_replay
+        self.rgb_replay = None
+        if replay:
+            replay.stop()
+            if self.rgb_output:
+                self.rgb_output.publish(self.rgb_composed)
+        if path is None:
+            return None
+        replay = RGBFrameReplay(path)
+        self.rgb_replay = replay
+        output = self.rgb_output_scheduler()
+        replay.play(lambda led_index, colors: output.publish(("leds", replay.size, led_index, colors)),
+                    speed, start_s, loop)
+        return replay
+
+    def keyb_send_rgb_leds(self, size, led_index, colors):
+        """Send replayed led colors (led_index order) with the encoder of their image size."""
+        encoder = self.rgb_frame_encoder(*size)
+        if not np.array_equal(encoder.led_index, led_index):
+            # recorded with another led table: the colors of the leds in both
+            table = np.zeros((256, 3), dtype=np.uint8)
+            table[led_index] = colors
+            colors = table[encoder.led_index]
+        colors, select = encoder.delta_colors(colors)
+        self.keyb_send_rgb_colors(encoder, colors, select)
+
+    def keyb_send_rgb_frame(self, arr, rgb_multiplier):
+        """Convert a (height, width, 3) rgb frame to "keyboard rgb pixels" and send."""
+        dbg_zone = "RGB_BUF"
+        if self.dbg_rgb_buf:
+            self.dbg.tr(dbg_zone, "-" * 120)
+            self.dbg.tr(dbg_zone, "rgb mult {}", rgb_multiplier)
+
+        height, width = arr.shape[:2]
+        # only leds changed since the last frame (or due for refresh)
+        encoder = self.rgb_frame_encoder(width, height)
+        colors, select = encoder.delta(arr, False, rgb_multiplier)
+        self.keyb_send_rgb_colors(encoder, colors, select)
 
-        # -------------------------------------------------------------------------------
-        # iterate through the qimage pixels and convert to "keyboard rgb pixels" and send to keyboard
-        height = img.height()
-        width = img.width()
+    def keyb_send_rgb_colors(self, encoder, colors, select):
+        """Send the selected (changed/refresh) leds of the (num_leds, 3) led colors."""
+        dbg_zone = "RGB_BUF"
+        if self.rgb_record_path:
+            self.rgb_record(encoder, colors)
+        messages = None
+        if self.rgb_codec:
+            messages = self.rgb_codec.messages(
+                QMKataKeybCmd.ID_RGB_MATRIX_FRAME,
+                encoder.led_index,
+                colors,
+                select,
+                50,
+                self.MAX_LEN_SYSEX_DATA,
+            )
+        if messages is None:
+            # no frame codecs, or none fits in a message
+            messages = encoder.messages(
+                encoder.pack(colors, 50, select),
+                QMKataKeybCmd.ID_RGB_MATRIX_BUF,
+                self.MAX_LEN_SYSEX_DATA,
+            )
+        flow = self.rgb_flow_control()
+        for data in messages:
+            if self.dbg_rgb_buf:
+                self.dbg.tr(dbg_zone, data.hex(" "))
+            flow.send(data)
+        flow.end_frame()
+
+    def rgb_flow_control(self):
+        """Pacing of the rgb buf packets: credits if the firmware acks them (TRANSPORT_RGB_ACK),
+        else bursts synced with an acked query, burst size adapted to its round trip time.
+        Firmware without ID_TRANSPORT: fixed pacing."""
+        if not self.rgb_flow:
+            if self.rgb_ack:
+                mode = "credit"
+            else:
+                mode = "sync" if self.transport_caps is not None else "fixed"
+            self.rgb_flow = RGBFlowControl(
+                self,
+                QMKataKeybCmd.SET,
+                # transport caps query: answered in order, no state changed in the
+                # firmware (the sync runs on the rgb output thread, concurrent with
+                # module uploads etc. on the gui thread)
+                (QMKataKeybCmd.GET, bytearray([QMKataKeybCmd.ID_TRANSPORT])),
+                mode,
+                # initial burst: the former fixed pacing (sleep after 10 or 2 packets)
+                10 if self.port_type == "rawhid" else 2,
+            )
+        return self.rgb_flow
+
+    @staticmethod
+    def qimage_to_rgb_array(img):
+        """(height, width, 3) view of a RGB888/BGR888/RGBX8888/RGB32 qimage, in r, g, b order."""
+        fmt = img.format()
+        bpp = 4 if fmt in (QImage.Format_RGBX8888, QImage.Format_RGB32) else 3
         arr = np.ndarray(
-            (height, width, 3),
+            (img.height(), img.width(), bpp),
             buffer=img.constBits(),
-            strides=[img.bytesPerLine(), 3, 1],
+            strides=[img.bytesPerLine(), bpp, 1],
             dtype=np.uint8,
         )
-
-        img_format = img.format()
-        RGB_PIXEL_SIZE = 5
-        num_sends = 0
-        data = bytearray()
-        data.append(QMKataKeybCmd.ID_RGB_MATRIX_BUF)
-        for y in range(height):
-            for x in range(width):
-                pixel = arr[y, x]
-                rgb_pixel = self.convert_to_keyb_rgb(
-                    pixel, img_format, self.xy_to_rgb_index(x, y), 50, rgb_multiplier
-                )
-                if rgb_pixel:
-                    data.extend(rgb_pixel)
-
-                if self.dbg_rgb_buf:
-                    self.dbg.tr(
-                        dbg_zone,
-                        f"{x:2},{y:2}=({pixel[0]:3},{pixel[1]:3},{pixel[2]:3})",
-                        end=" ",
-                    )
-                    self.dbg.tr(dbg_zone, rgb_pixel.hex(" "))
-
-                if len(data) + RGB_PIXEL_SIZE > self.MAX_LEN_SYSEX_DATA:
-                    self.send_sysex(QMKataKeybCmd.SET, data)
-                    num_sends += 1
-                    # todo sync with keyboard to avoid buffer overflow
-                    # depends on keyboard, put parameter in "keyboard model" class
-                    if self.port_type == "rawhid":  # keychron q3 max
-                        if num_sends % 10 == 0:
-                            time.sleep(self.keyb_poll_time * 2)
-                    else:
-                        if num_sends % 2 == 0:
-                            time.sleep(self.keyb_poll_time * 2)
-
-                    data = bytearray()
-                    data.append(QMKataKeybCmd.ID_RGB_MATRIX_BUF)
-
-        if len(data) > RGB_PIXEL_SIZE:
-            self.send_sysex(QMKataKeybCmd.SET, data)
-            num_sends += 1
+        # RGB32: 0xffRRGGBB words, b, g, r, x in (little endian) memory
+        if fmt in (QImage.Format_BGR888, QImage.Format_RGB32):
+            return arr[:, :, 2::-1]
+        return arr[:, :, :3]
+
+    def keyb_set_rgb_layer(self, sender, mode=None, z=None, alpha=None, beat_decay=None):
+        """Blend mode ("add", "max", "alpha", "multiply"), z order and alpha of
+        the rgb images of sender (bottom layer: lowest z), beat_decay: alpha
+        flashing on audio beats (RGBCompositor.configure)."""
+        self.rgb_compositor.configure(sender, mode, z, alpha, beat_decay)
+
+    def keyb_audio_beat(self, event):
+        """Audio onset/beat event (RGBAudioTab.signal_audio_beat) for the beat layers."""
+        self.rgb_compositor.on_beat(event)
+
+    def rgb_frame_encoder(self, width, height):
+        """Encoder with the pixel -> led lookup and sent led state for this image size."""
+        if self.rgb_encoder is None or self.rgb_encoder.size != (width, height):
+            self.rgb_encoder = RGBFrameEncoder(
+                self.xy_to_rgb_index,
+                width,
+                height,
+                self.rgb_delta_threshold(),
+                self.rgb_led_max_age(),
+            )
+        return self.rgb_encoder
 
     def keyb_set_default_layer(self, layer):
         self.dbg.tr("SYSEX_COMMAND", "keyb_set_default_layer: {}", layer)
@@ -1549,33 +1858,23 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             data.extend(offset_packed)
             return data
 
-        data = dynld_fun_data_hdr(fun_id, 0)
-        data_hdr_len = len(data)
-        i = 0
-        while i < len(buf):
-            if len(data) >= self.MAX_LEN_SYSEX_DATA:
-                if not (response := self.send_sysex_wait(QMKataKeybCmd.SET, data)):
-                    self.dbg.tr("E", "keyb_set_dynld_function: send failed")
-                    return
-                if response[1] != 0:
-                    self.dbg.tr(
-                        "E", "keyb_set_dynld_function: error returned {}", response[1]
-                    )
-                    return
-                data = dynld_fun_data_hdr(fun_id, i)
-
-            data.append(buf[i])
-            i += 1
+        max_payload = self.MAX_LEN_SYSEX_DATA - len(dynld_fun_data_hdr(fun_id, 0))
+        chunks = []
+        for offset in range(0, len(buf), max_payload):
+            data = dynld_fun_data_hdr(fun_id, offset)
+            data.extend(buf[offset : offset + max_payload])
+            chunks.append((offset, data))
 
-        if len(data) > data_hdr_len:
-            if not (response := self.send_sysex_wait(QMKataKeybCmd.SET, data)):
-                self.dbg.tr("E", "keyb_set_dynld_function: send failed")
-                return
-            if response[1] != 0:
+        def chunk_ok(offset, return_code):
+            if return_code != 0:
                 self.dbg.tr(
-                    "E", "keyb_set_dynld_function: error returned {}", response[1]
+                    "E", "keyb_set_dynld_function: error returned {} at offset {}", return_code, offset
                 )
-                return
+            return return_code == 0
+
+        if self.send_sysex_windowed(QMKataKeybCmd.SET, chunks, chunk_ok) is None:
+            self.dbg.tr("E", "keyb_set_dynld_function: send failed")
+            return
 
         # last send for end of data, set function ptr
         data = dynld_fun_data_hdr(fun_id, 0xFFFF)
@@ -1592,19 +1891,15 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         data.extend(id)
         if buf:
             data.extend(buf)
+        response_key = (QMKataKeybCmd.ID_DYNLD_FUNEXEC,)
+        self.response_dispatcher.expect(response_key)
         self.send_sysex(QMKataKeybCmd.SET, data)
 
-        reponse = None
-        timed_out = False
-        start = time.monotonic()
-        while not reponse and not timed_out:
-            time.sleep(self.keyb_poll_time * 2)
-            try:
-                reponse = self.sysex_response[QMKataKeybCmd.ID_DYNLD_FUNEXEC]
-                del self.sysex_response[QMKataKeybCmd.ID_DYNLD_FUNEXEC]
-            except:
-                timed_out = time.monotonic() - start > self.keyb_poll_time * 100
-        return reponse
+        if response := self.response_dispatcher.wait(
+            response_key, self.keyb_poll_time * 100
+        ):
+            return response[1]
+        return None
 
     def keyb_set_combo(self, slot, keys, keycode):
         self.dbg.tr(
@@ -1688,8 +1983,9 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         if self.dbg.enabled("SYSEX_COMMAND"):
             self.dbg.tr("SYSEX_COMMAND", "keyb_set_module: slot={} len={}", slot_id, len(buf))
 
-        # 5 header bytes consumed per chunk; rest is payload.
-        MAX_PAYLOAD = self.MAX_LEN_SYSEX_DATA - 5
+        # 5 header bytes consumed per chunk; rest is payload, declared_len
+        # is one byte so chunks stay <= 255 with multi-report messages.
+        MAX_PAYLOAD = min(self.MAX_LEN_SYSEX_DATA - 5, 0xFF)
         if MAX_PAYLOAD <= 0:
             self.dbg.tr("E", "keyb_set_module: MAX_LEN_SYSEX_DATA too small")
             return False
@@ -1702,18 +1998,23 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             data.append(declared_len & 0xFF)
             return data
 
-        offset = 0
-        while offset < len(buf):
+        chunks = []
+        for offset in range(0, len(buf), MAX_PAYLOAD):
             chunk = buf[offset : offset + MAX_PAYLOAD]
             data = chunk_header(slot_id, offset, len(chunk))
             data.extend(chunk)
-            if not (response := self.send_sysex_wait(QMKataKeybCmd.SET, data)):
-                self.dbg.tr("E", "keyb_set_module: send failed at offset {}", offset)
-                return False
-            if response[1] != 0:
-                self.dbg.tr("E", "keyb_set_module: error {} at offset {}", response[1], offset)
-                return False
-            offset += len(chunk)
+            chunks.append((offset, data))
+
+        def chunk_ok(offset, return_code):
+            if return_code != 0:
+                self.dbg.tr("E", "keyb_set_module: error {} at offset {}", return_code, offset)
+            return return_code == 0
+
+        # chunks are pipelined, each one carries its offset so the firmware
+        # doesn't depend on arrival order
+        if self.send_sysex_windowed(QMKataKeybCmd.SET, chunks, chunk_ok) is None:
+            self.dbg.tr("E", "keyb_set_module: send failed")
+            return False
 
         # Finalize: offset=0xFFFF signals end-of-data + commit to flash.
         # Use a generous timeout because module_load() may erase the
@@ -1780,6 +2081,31 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
         magic = buf[5] | (buf[6] << 8) | (buf[7] << 16) | (buf[8] << 24)
         return magic
 
+    @staticmethod
+    def _module_read_request(slot_id, offset):
+        return bytearray([
+            QMKataKeybCmd.ID_MODULE,
+            slot_id & 0xFF,
+            offset & 0xFF,
+            (offset >> 8) & 0xFF,
+        ])
+
+    @staticmethod
+    def _module_read_chunk(buf, slot_id, offset):
+        """Payload of a chunked read response, None if it doesn't match slot/offset.
+
+        Response: [ID_MODULE, slot_id, off_lo, off_hi, chunk_len, data...]
+        """
+        if len(buf) < 6 or buf[0] != QMKataKeybCmd.ID_MODULE:
+            return None
+        resp_slot = buf[1]
+        resp_off = buf[2] | (buf[3] << 8)
+        resp_len = buf[4]
+        resp_data = buf[5:5+resp_len]
+        if resp_slot != slot_id or resp_off != offset or len(resp_data) < resp_len:
+            return None
+        return resp_data
+
     def keyb_read_module_binary(self, slot_id, size=0x1000):
         """Read full module binary from a slot via chunked GET.
 
@@ -1788,40 +2114,60 @@ class QMKataKeyboard(pyfirmata2.Board, QtCore.QObject):
             [ID_MODULE, slot_id, off_lo, off_hi]
         Response per chunk (distinguished from per-slot header by length):
             [ID_MODULE, slot_id, off_lo, off_hi, chunk_len, data...]
+
+        The first chunk is read on its own to learn the firmware chunk
+        length, the remaining offsets are then requested pipelined. Any
+        offset not covered by the pipelined responses (e.g. a short chunk)
+        falls back to a single GET.
         """
         self.dbg.tr("SYSEX_COMMAND", "keyb_read_module_binary: slot={} size={}", slot_id, size)
-        result = bytearray()
 
-        offset = 0
-        while offset < size:
-            data = bytearray([
-                QMKataKeybCmd.ID_MODULE,
-                slot_id & 0xFF,
-                offset & 0xFF,
-                (offset >> 8) & 0xFF,
-            ])
+        def read_chunk(offset):
+            data = self._module_read_request(slot_id, offset)
             response = self.send_sysex_wait(QMKataKeybCmd.GET, data)
             if not response:
                 self.dbg.tr("E", "keyb_read_module_binary: GET failed at offset {}", offset)
                 return None
             # response is (True, stored_buf); stored_buf is full response
             # after seqnum strip: [ID_MODULE, slot_id, off_lo, off_hi, chunk_len, data...]
-            buf = response[1]
-            if len(buf) < 6 or buf[0] != QMKataKeybCmd.ID_MODULE:
-                self.dbg.tr("E", "keyb_read_module_binary: bad response at offset {}", offset)
-                return None
-            resp_slot = buf[1]
-            resp_off = buf[2] | (buf[3] << 8)
-            resp_len = buf[4]
-            resp_data = buf[5:5+resp_len]
-            if resp_slot != slot_id or resp_off != offset or len(resp_data) < resp_len:
-                self.dbg.tr("E", "keyb_read_module_binary: slot/offset mismatch slot={} off={} exp=({},{})",
-                             resp_slot, resp_off, slot_id, offset)
-                return None
-            result.extend(resp_data[:resp_len])
-            offset += resp_len
+            chunk = self._module_read_chunk(response[1], slot_id, offset)
+            if not chunk:
+                self.dbg.tr("E", "keyb_read_module_binary: bad response at offset {}: {}",
+                             offset, response[1])
+            return chunk
+
+        chunks = {}
+        if not (first := read_chunk(0)):
+            return None
+        chunks[0] = first
+
+        chunk_len = len(first)
+        requests = [
+            (offset, self._module_read_request(slot_id, offset))
+            for offset in range(chunk_len, size, chunk_len)
+        ]
+        responses = self.send_sysex_windowed(
+            QMKataKeybCmd.GET,
+            requests,
+            # an empty chunk (offset past the slot) would never advance the offset
+            lambda offset, buf: bool(self._module_read_chunk(buf, slot_id, offset)),
+        )
+        if responses is None:
+            self.dbg.tr("E", "keyb_read_module_binary: pipelined read failed")
+            return None
+        for offset, buf in responses.items():
+            chunks[offset] = self._module_read_chunk(buf, slot_id, offset)
+
+        result = bytearray()
+        offset = 0
+        while offset < size:
+            if not (chunk := chunks.get(offset)):
+                if not (chunk := read_chunk(offset)):
+                    return None
+            result.extend(chunk)
+            offset += len(chunk)
 
-        return bytes(result)
+        return bytes(result[:size])
 
     def keyb_erase_module_sector(self, sector_id):
         """Erase an entire module flash sector (16 KB).
@@ -0,0 +1,159 @@
+import hashlib, json, os
+
+import numpy as np
+
+
+class FrameAnimation:
+    """
+    Headless animation at rgb matrix resolution: render(i, frame) writes
+    frame i into frame, a (height, width, 3) uint8 array that is kept between
+    the frames (cleared once at the start), i counts 0..n_frames-1 and
+    repeats. init() is called once before the first frame.
+
+    No figure, canvas or image scaling per frame; the caller paces the frames
+    (RGBAnimationTab: qt timer) and uses the returned buffer before the next
+    one.
+    """
+
+    def __init__(self, render, width, height, n_frames=1000, init=None):
+        self.render = render
+        self.init = init
+        self.n_frames = n_frames
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.i = 0
+        self.started = False
+
+    def next_frame(self):
+        if not self.started:
+            self.started = True
+            if self.init:
+                self.init()
+        self.render(self.i, self.frame)
+        self.i = (self.i + 1) % self.n_frames
+        return self.frame
+
+
+class CachedFrameAnimation:
+    """Playback of pre-rendered frames (FrameCache), the interface of
+    FrameAnimation: a copy of frame i per next_frame()."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.n_frames = len(frames)
+        self.frame = np.zeros(frames.shape[1:], dtype=np.uint8)
+        self.i = 0
+
+    def next_frame(self):
+        np.copyto(self.frame, self.frames[self.i])
+        self.i = (self.i + 1) % self.n_frames
+        return self.frame
+
+
+class FrameCache:
+    """
+    Frames of deterministic animations rendered once: a (n_frames, height,
+    width, 3) uint8 .npy per animation in cache_dir, named by the sha1 of the
+    animation source and parameters (key()), memory mapped for playback.
+
+    A new file is written to a temporary name first, a cache is only found
+    when it is complete. At most max_files are kept, the least recently used
+    are removed.
+    """
+
+    def __init__(self, cache_dir="animation_cache", max_files=32):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+
+    @staticmethod
+    def key(source, **params):
+        data = json.dumps([source, sorted(params.items())], default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def load(self, key):
+        """memory mapped frames, None if not cached"""
+        path = self.path(key)
+        try:
+            frames = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # recently used
+        return frames
+
+    def render(self, key, animation):
+        """n_frames of a FrameAnimation (from its start) into the cache"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp = path + f".{os.getpid()}.tmp"
+        n = animation.n_frames
+        try:
+            frames = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(n,) + animation.frame.shape)
+            for i in range(n):
+                frames[i] = animation.next_frame()
+            frames.flush()
+            del frames
+            os.replace(tmp, path)
+        except BaseException:
+            frames = None  # the memmap, before removing its file (windows)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.prune()
+        return self.load(key)
+
+    def frames(self, key, animation):
+        """cached frames, rendered first if needed"""
+        frames = self.load(key)
+        if frames is None:
+            frames = self.render(key, animation)
+        return frames
+
+    def prune(self):
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".npy")]
+        except OSError:
+            return
+        paths = sorted((os.path.join(self.cache_dir, n) for n in names), key=os.path.getmtime)
+        for path in paths[: max(0, len(paths) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def axes_grid(width, height, xlim=(0, 1), ylim=(0, 1)):
+    """(x, y) float32 (height, width) coordinates of the led centers in a
+    plot area xlim x ylim, row 0 is the top (y = ylim[1] side)."""
+    x = xlim[0] + (np.arange(width, dtype=np.float32) + 0.5) * ((xlim[1] - xlim[0]) / width)
+    y = ylim[1] - (np.arange(height, dtype=np.float32) + 0.5) * ((ylim[1] - ylim[0]) / height)
+    return np.meshgrid(x, y)
+
+
+def blend(frame, color, alpha):
+    """frame = frame * (1 - alpha) + color * alpha, in place; color: rgb
+    0..255, alpha: 0..1 scalar or (height, width) coverage."""
+    alpha = np.clip(np.asarray(alpha, dtype=np.float32), 0, 1)
+    if alpha.ndim:
+        alpha = alpha[..., None]
+    frame[...] = frame * (1 - alpha) + np.asarray(color, dtype=np.float32) * alpha + 0.5
+    return frame
+
+
+def line_coverage(y, curve, half_width, pixel_height):
+    """fraction 0..1 of the leds at heights y (axes_grid, pixel_height high)
+    covered by the band curve +- half_width"""
+    top = np.minimum(curve + half_width, y + pixel_height / 2)
+    bottom = np.maximum(curve - half_width, y - pixel_height / 2)
+    return np.clip((top - bottom) / pixel_height, 0, 1)
+
+
+def rect_coverage(width, height, x0, y0, x1, y1):
+    """(height, width) fraction of each led covered by the rectangle x0..x1,
+    y0..y1 in led units (x right, y down, led (r, c) spans c..c+1, r..r+1)"""
+    cx = np.clip(np.minimum(x1, np.arange(1, width + 1)) - np.maximum(x0, np.arange(width)), 0, 1)
+    cy = np.clip(np.minimum(y1, np.arange(1, height + 1)) - np.maximum(y0, np.arange(height)), 0, 1)
+    return np.outer(cy, cx).astype(np.float32)
@@ -1,15 +1,18 @@
-import numpy as np, random
+import numpy as np, random, inspect
+from collections import deque
 from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QTextEdit
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTextEdit, QCheckBox
 from PySide6.QtGui import QFont, QImage, QKeyEvent
 from PySide6.QtCore import Qt, QTimer, Signal
 
 from DebugTracer import DebugTracer
+# FrameAnimation and the helpers of the animation scripts
+from RGBAnimation import FrameAnimation, CachedFrameAnimation, FrameCache, axes_grid, blend, line_coverage, rect_coverage
 
 def add_method_to_class(class_def, method):
     method_definition = method
@@ -92,20 +95,34 @@ class RGBAnimationTab(QWidget):
         self.start_button.clicked.connect(self.start_animation)
         # canvas
         self.canvas = FigureCanvas(self.figure)
+        self.preview_checkbox = QCheckBox("preview")
+        self.preview_checkbox.setToolTip("show the frames of numpy animations in the figure")
+        self.preview_checkbox.setChecked(True)
         #-------------------------------------------------------
         # add widgets to layout
         layout = QVBoxLayout()
         layout.addWidget(self.code_editor)
         layout.addWidget(self.canvas)
-        layout.addWidget(self.start_button)
+        hlayout = QHBoxLayout()
+        hlayout.addWidget(self.start_button, 1)
+        hlayout.addWidget(self.preview_checkbox)
+        layout.addLayout(hlayout)
         self.setLayout(layout)
 
         # func animation parameters
         self.n_frames = 1000
         self.interval = 40
         self.ani = None
+        # numpy animation: frames at matrix resolution, paced by a timer
+        self.frame_animation = None
+        self.frame_cache = FrameCache()
+        self.preview_image = None
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setTimerType(Qt.PreciseTimer)
+        self.frame_timer.timeout.connect(self.render_frame)
 
         self._audio_peak_levels = None
+        self._audio_beats = deque(maxlen=16)
 
     def on_keypress(self, keypress_event):
         print("on_keypress: {} todo", keypress_event)
@@ -116,28 +133,83 @@ class RGBAnimationTab(QWidget):
     def audio_peak_levels(self):
         return self._audio_peak_levels
 
+    def on_audio_beat(self, event):
+        self._audio_beats.append(event)
+
+    def audio_beats(self, since=None):
+        """latest onset/beat events (AudioBeat.BeatEvent), those after time since (event.t)"""
+        return [e for e in self._audio_beats if since is None or e.t > since]
+
     def start_animation(self):
-        if self.ani is None:  # Prevent multiple instances if already running
+        if self.ani is None and self.frame_animation is None:  # Prevent multiple instances if already running
             add_method_to_class(RGBAnimationTab, self.code_editor.toPlainText())
             try:
-                init_fn_name, animate_fn_name = self.animate_methods()
+                methods = self.animate_methods()
+                init_fn_name, animate_fn_name = methods[:2]
                 animate_init_method = getattr(RGBAnimationTab, init_fn_name)
                 animate_method = getattr(RGBAnimationTab, animate_fn_name)
                 setattr(RGBAnimationTab, "_animate_init", animate_init_method)
                 setattr(RGBAnimationTab, "_animate", animate_method)
-                self._animate_init()
-                self.ani = animation.FuncAnimation(self.figure, self.animate, frames=self.n_frames, #init_func=self.init,
-                                                blit=True, interval=self.interval, repeat=True)
+                if len(inspect.signature(animate_method).parameters) == 3:
+                    # render(self, i, frame), frames of a deterministic one cached
+                    self.start_frame_animation(methods if len(methods) > 2 and methods[2] else None)
+                else:
+                    if self.preview_image:
+                        self.ax.clear()
+                        self.preview_image = None
+                    self._animate_init()
+                    self.ani = animation.FuncAnimation(self.figure, self.animate, frames=self.n_frames, #init_func=self.init,
+                                                    blit=True, interval=self.interval, repeat=True)
             except Exception as e:
                 print(e)
 
-            if self.ani:
+            if self.ani or self.frame_animation:
                 self.start_button.setText("stop")
         else:
+            self.stop_animation()
+
+    def stop_animation(self):
+        if self.ani:
             self.ani.event_source.stop()
             self.ani = None
-            self.signal_rgb_image.emit(None, (0,0,0))
-            self.start_button.setText("start")
+        self.frame_timer.stop()
+        self.frame_animation = None
+        self.signal_rgb_image.emit(None, (0,0,0))
+        self.start_button.setText("start")
+
+    def start_frame_animation(self, cache_methods=None):
+        w, h = self.rgb_matrix_size
+        self.frame_animation = FrameAnimation(self._animate, w, h, self.n_frames, self._animate_init)
+        if cache_methods:
+            key = FrameCache.key(self.code_editor.toPlainText(), methods=cache_methods[:2],
+                                 size=(w, h), n_frames=self.n_frames)
+            try:
+                self.frame_animation = CachedFrameAnimation(self.frame_cache.frames(key, self.frame_animation))
+            except Exception as e:
+                self.dbg.tr('E', "frame cache: {}", e)
+                self.frame_animation = FrameAnimation(self._animate, w, h, self.n_frames, self._animate_init)
+        self.ax.clear()
+        self.ax.set_axis_off()
+        self.preview_image = self.ax.imshow(self.frame_animation.frame, interpolation="nearest", aspect="auto")
+        self.canvas.draw_idle()
+        self.frame_timer.start(self.interval)
+
+    def render_frame(self):
+        try:
+            frame = self.frame_animation.next_frame()
+        except Exception as e:
+            self.dbg.tr('E', "render_frame: {}", e)
+            self.stop_animation()
+            return
+
+        h, w = frame.shape[:2]
+        # copy: the frame buffer is rendered into again while the image may be queued
+        keyb_rgb = QImage(frame.data, w, h, 3 * w, QImage.Format_RGB888).copy()
+        self.signal_rgb_image.emit(keyb_rgb, (1.0,1.0,1.0))
+        # preview only, the figure isn't needed for the frames
+        if self.preview_checkbox.isChecked() and self.canvas.isVisible():
+            self.preview_image.set_data(frame)
+            self.canvas.draw_idle()
 
     def capture_animation_frame(self):
         if self.ani == None:
@@ -169,6 +241,8 @@ class RGBAnimationTab(QWidget):
         return ret
 
     def closeEvent(self, event):
+        self.frame_timer.stop()
+        self.frame_animation = None
         if self.ani:
             self.ani.event_source.stop()
             self.ani = None
@@ -1,117 +1,132 @@
 import numpy as np
-import time, json
+import os, time, json
 
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QFrame, QFileDialog
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QFrame, QFileDialog, QComboBox, QCheckBox
 from PySide6.QtCore import Signal, QThread, QTimer
 from PySide6.QtGui import QImage, QColor, QIntValidator, QDoubleValidator
 
 from DebugTracer import DebugTracer
-try:
-    import pyaudiowpatch as pyaudio
-except:
-    print("pyaudiowpatch not installed")
+from AudioAnalysis import band_analyzer
+from AudioSource import FileSource, default_audio_source
+from AudioRGB import SpectrumRenderer, band_levels, levels_to_rgb
+from AudioBeat import BeatDetector
+from AudioProcess import AudioAnalysisProcess
 
 #-------------------------------------------------------------------------------
 class AudioCaptureThread(QThread):
+    """
+    Band peak levels of an audio source (AudioSource.py, default: live
+    capture of the default speakers) every interval.
 
-    def __init__(self, freq_bands, interval):
+    fft_len None: fft of each interval chunk (frequency resolution 1/interval),
+    else streaming analysis with fft_len samples every interval (hop) with
+    attack/decay envelopes, see StreamingBandAnalyzer. Levels are scaled to
+    those of LEVEL_INTERVAL chunks, the min/max levels of the band configs.
+
+    process: capture and analysis in a child process (AudioAnalysisProcess),
+    this thread only passes the levels of the hops on to the callback.
+    """
+    LEVEL_INTERVAL = 0.04
+
+    def __init__(self, freq_bands, interval, fft_len=None, source=None, process=False):
         self.dbg = DebugTracer(zones={'D':0}, obj=self)
 
         super().__init__()
         self.running = False
         self.freq_bands = freq_bands
         self.interval = interval
-        self.paudio = pyaudio.PyAudio()
+        self.fft_len = fft_len
+        self.process = process
+        self.band_peaks = None
+        self.analysis_process = None
+        self.set_source(source)
 
     def connect_callback(self, callback):
         self.callback = callback
 
+    def set_source(self, source):
+        """audio source of the next run(), None: default live capture"""
+        self.source = source if source else default_audio_source()
+
     def set_freq_bands(self, freq_bands):
         self.freq_bands = freq_bands
+        if self.band_peaks:
+            self.band_peaks.set_freq_bands(freq_bands)
+        analysis_process = self.analysis_process
+        if analysis_process:
+            analysis_process.set_freq_bands(freq_bands)
 
     def run(self):
-        self.paudio = pyaudio.PyAudio()
-        default_speakers = None
+        if self.process:
+            self.run_process()
+            return
+        source = self.source
         try:
-            # see https://github.com/s0d3s/PyAudioWPatch/blob/master/examples/pawp_record_wasapi_loopback.py
-            wasapi_info = self.paudio.get_host_api_info_by_type(pyaudio.paWASAPI)
-            self.dbg.tr('D', "wasapi: {}", wasapi_info)
-            default_speakers = self.paudio.get_device_info_by_index(wasapi_info["defaultOutputDevice"])
-            if not default_speakers["isLoopbackDevice"]:
-                for loopback in self.paudio.get_loopback_device_info_generator():
-                    if default_speakers["name"] in loopback["name"]:
-                        default_speakers = loopback
-                        break
-
-            self.dbg.tr('D', "loopback device: {}", default_speakers)
+            source.open(self.interval)
         except Exception as e:
-            self.dbg.tr('D', "wasapi not supported: {}", e)
+            self.dbg.tr('D', "{} not available: {}", source.name, e)
+            source.close()
             return
 
-        #-------------------------------------------------------------------------------
-        FORMAT = pyaudio.paFloat32
-        CHANNELS = default_speakers["maxInputChannels"]
-        RATE = int(default_speakers["defaultSampleRate"])
-        INPUT_INDEX = default_speakers["index"]
-        CHUNK = int(RATE * self.interval)
-
-        self.stream = self.paudio.open(format=FORMAT,
-                        channels=CHANNELS,
-                        rate=RATE,
-                        input=True,
-                        frames_per_buffer=CHUNK,
-                        input_device_index=INPUT_INDEX)
-        self.dbg.tr('D', "audio stream opened: rate={RATE}, chunk size={CHUNK}, channels={CHANNELS}, input device={INPUT_INDEX}", RATE=RATE, CHUNK=CHUNK, CHANNELS=CHANNELS, INPUT_INDEX=INPUT_INDEX)
+        RATE, CHUNK = source.rate, source.chunk
+        self.band_peaks = band_analyzer(self.freq_bands, RATE, CHUNK, self.fft_len,
+                                        int(RATE * self.LEVEL_INTERVAL))
 
         self.running = True
         while self.running:
-            frames = None
-            try:
-                data = self.stream.read(CHUNK)
-                frames = np.frombuffer(data, dtype=np.float32)
-                if CHANNELS > 1:
-                    frames = frames.reshape(-1, CHANNELS)
-                    frames = np.mean(frames, axis=1)
-            except Exception as e:
-                self.dbg.tr('E', "audio stream read error: {}", e)
+            frames = source.read()
+            if frames is None:
                 self.running = False
                 break
 
-            audio_data = np.hstack(frames)
-            freq_data = np.fft.rfft(audio_data)
-            freq_magnitude = np.abs(freq_data)
-
-            # Calculate frequency bins
-            freq_bins = np.fft.rfftfreq(len(audio_data), d=1./RATE)
-            #print(f"freq bins: {len(freq_bins)}, {len(audio_data)}")
-            peak_levels = []
-            for f_min, f_max in self.freq_bands:
-                # Find the bin indices corresponding to the frequency range
-                idx = np.where((freq_bins >= f_min) & (freq_bins <= f_max))
-                peak_level = 0
-                if len(freq_magnitude[idx]) > 0:
-                    peak_level = np.max(freq_magnitude[idx])
-                peak_levels.append(peak_level)
-
-            self.callback(peak_levels)
-
-        self.stream.stop_stream()
-        self.stream.close()
-        self.dbg.tr('D', "audio stream closed")
-        self.paudio.terminate()
+            # peak magnitude per band, bin ranges precomputed by set_freq_bands()
+            peak_levels = self.band_peaks.push(frames)
+            if peak_levels is None:
+                continue
+            self.callback(peak_levels.tolist())
+
+        source.close()
         self.callback(None)
 
-    def stop(self):
+    def run_process(self):
+        analysis_process = AudioAnalysisProcess(self.freq_bands, self.interval, self.fft_len,
+                                                self.LEVEL_INTERVAL, self.source)
         try:
-            self.stream.stop_stream()
+            analysis_process.start()
         except Exception as e:
-            pass
+            self.dbg.tr('D', "analysis process not started: {}", e)
+            analysis_process.stop()
+            return
+
+        self.analysis_process = analysis_process
+        self.running = True
+        while self.running:
+            hops = analysis_process.read()
+            if hops is None:
+                self.running = False
+                break
+            for t, peak_levels in hops:
+                self.callback(peak_levels.tolist())
+            analysis_process.wait(self.interval)
+
+        self.analysis_process = None
+        if analysis_process.skipped:
+            self.dbg.tr('D', "analysis process: {} hops skipped", analysis_process.skipped)
+        analysis_process.stop()
+        self.callback(None)
+
+    def stop(self):
         self.running = False
+        self.source.stop()
 
 #-------------------------------------------------------------------------------
 class RGBAudioTab(QWidget):
     signal_rgb_image = Signal(QImage, object)
     signal_peak_levels = Signal(object)
+    signal_audio_beat = Signal(object)  # AudioBeat.BeatEvent
+
+    RGB_MODES = ["fill", "spectrum", "beat"]
+    BEAT_DECAY = 0.15  # s, "beat" mode flash
 
     @staticmethod
     def freq_bands_linear(f_min, f_max, k):
@@ -151,12 +166,17 @@ class RGBAudioTab(QWidget):
         self.keyb_rgb_mask = QImage(self.keyb_rgb.size(), QImage.Format_Grayscale8)
         self.keyb_rgb_mask_mode = 0
         self.rgb_multiplier = (1.0,1.0,1.0)
+        self.spectrum = SpectrumRenderer(self.rgb_matrix_size[0], self.rgb_matrix_size[1])
 
+        # 10ms updates, 4096 samples (~85ms) fft for the low bands
         self.sample_count = 0
+        self.beat_flash = 0.0
         try:
-            self.audio_thread = AudioCaptureThread(self.freq_bands, 0.04)
+            self.audio_thread = AudioCaptureThread(self.freq_bands, 0.01, fft_len=4096)
+            self.audio_thread.finished.connect(self.audio_finished)
         except:
             self.audio_thread = None
+        self.set_audio_interval(0.01)
 
     def load_freqbands_jsonfile(self):
         filename, _ = QFileDialog.getOpenFileName(self, "open file", "", "json (*.json)")
@@ -265,9 +285,27 @@ class RGBAudioTab(QWidget):
         layout.addStretch(1)
 
         #-------------------------------------------------------------------------------
+        hlayout = QHBoxLayout()
         self.start_button = QPushButton("start")
         self.start_button.clicked.connect(self.start)
-        layout.addWidget(self.start_button)
+        self.source_button = QPushButton("audio file")
+        self.source_button.setToolTip("play a wav/npy file instead of capturing the audio output")
+        self.source_button.clicked.connect(self.select_audio_file)
+        self.source_label = QLabel("live capture")
+        self.process_checkbox = QCheckBox("separate process")
+        self.process_checkbox.setToolTip("capture and analyse the audio in a child process (next start)")
+        self.rgb_mode = self.RGB_MODES[0]
+        self.rgb_mode_selector = QComboBox()
+        self.rgb_mode_selector.addItems(self.RGB_MODES)
+        self.rgb_mode_selector.setToolTip("fill: all leds in the mixed band colors, spectrum: a level bar per band, "
+                                          "beat: fill flashing on the beats")
+        self.rgb_mode_selector.currentTextChanged.connect(self.set_rgb_mode)
+        hlayout.addWidget(self.start_button, 1)
+        hlayout.addWidget(self.rgb_mode_selector)
+        hlayout.addWidget(self.source_button)
+        hlayout.addWidget(self.source_label)
+        hlayout.addWidget(self.process_checkbox)
+        layout.addLayout(hlayout)
         self.setLayout(layout)
 
     def load_freq_bands_colors(self, file_name='freq_bands_colors.json'):
@@ -326,45 +364,10 @@ class RGBAudioTab(QWidget):
         self.min_max_level = min_max_level
 
     #-------------------------------------------------------------------------------
-    def db_to_255(self, dB_value, dB_min=-60, dB_max=0):
-        # Normalize dB value from [dB_min, dB_max] to [0, 1]
-        normalized = (dB_value - dB_min) / (dB_max - dB_min)
-        # Clip the normalized value to be within the range [0, 1]
-        normalized = max(0, min(1, normalized))
-        # Convert normalized value to an integer in the range [0, 255]
-        mapped_value = int(round(255 * normalized))
-        return mapped_value
-
     def peak_level_to_rgb(self, peak_levels, db_min, max_level, log_scale = True):
-        r = g = b = 0
-        MAX_RGB = 255
-        for i in range(len(peak_levels)):
-            try:
-                if peak_levels[i]/max_level[i] == 0:
-                    continue
-                peak_db = 20 * np.log10(peak_levels[i]/max_level[i])
-                peak_db_rgb = self.db_to_255(peak_db, db_min[i], 0)
-                #print(f"peak {i}: {peak_levels[i]} {peak_db} {peak_db_rgb}")
-                if log_scale:
-                    r += peak_db_rgb * self.freq_rgb[i][0]
-                    g += peak_db_rgb * self.freq_rgb[i][1]
-                    b += peak_db_rgb * self.freq_rgb[i][2]
-                else:
-                    r += peak_levels[i]/max_level[i] * self.freq_rgb[i][0] * MAX_RGB
-                    g += peak_levels[i]/max_level[i] * self.freq_rgb[i][1] * MAX_RGB
-                    b += peak_levels[i]/max_level[i] * self.freq_rgb[i][2] * MAX_RGB
-            except Exception as e:
-                self.dbg.tr('D', "peak_level_to_rgb:{}", e)
-                pass # #bands updated in ui
-
         # rgb values are added for all bands, normalize with a factor
-        r /= 6
-        g /= 6
-        b /= 6
-        r = min(r, MAX_RGB)
-        g = min(g, MAX_RGB)
-        b = min(b, MAX_RGB)
-        return r,g,b
+        levels = band_levels(peak_levels, db_min, max_level, log_scale)
+        return levels_to_rgb(levels, self.freq_rgb, 1 / 6)
 
     #-------------------------------------------------------------------------------
     def process_audiopeak_levels(self, peak_levels):
@@ -373,6 +376,8 @@ class RGBAudioTab(QWidget):
             return
 
         self.signal_peak_levels.emit(peak_levels)
+        self.beat_flash *= self.beat_flash_decay
+        self.beat_detector.process(peak_levels)
 
         self.sample_count += 1
         if self.dbg.enabled('PEAK_LEVEL'):
@@ -387,7 +392,7 @@ class RGBAudioTab(QWidget):
                 peak_level = lvl
 
         # update "max level" every N samples, brightness is based on current peak levels and "max level"
-        if self.sample_count == 20:
+        if self.sample_count == self.max_level_samples:
             self.sample_count = 0
             max_level_running = 0
             max_level_running_band = 0
@@ -419,12 +424,20 @@ class RGBAudioTab(QWidget):
             self.peak_level.setText(f"{max_level_running:.2f}")
             self.max_level_running = [0] * len(self.freq_bands)
 
-        if all(level < 0.05 for (level) in peak_levels):
+        if max(peak_levels, default=0) < 0.05:
             # no audio
             return
 
-        r,g,b = self.peak_level_to_rgb(peak_levels, self.db_min, self.max_level)
-        self.keyb_rgb.fill(QColor(r,g,b))
+        levels = band_levels(peak_levels, self.db_min, self.max_level)
+        if self.rgb_mode == "spectrum":
+            # bars straight into the image pixels (bits() detaches a copy still queued)
+            self.spectrum.render(levels, self.freq_rgb, self.rgb_array(self.keyb_rgb))
+        else:
+            r,g,b = levels_to_rgb(levels, self.freq_rgb, 1 / 6)
+            if self.rgb_mode == "beat":
+                brightness = 0.25 + 0.75 * self.beat_flash
+                r,g,b = r * brightness, g * brightness, b * brightness
+            self.keyb_rgb.fill(QColor(r,g,b))
         #-----------------------------------------------------------
         if self.running:
             self.signal_rgb_image.emit(self.keyb_rgb, self.rgb_multiplier)
@@ -463,6 +476,48 @@ class RGBAudioTab(QWidget):
             img = img.convertedTo(QImage.Format_RGB888)
             self.keyb_rgb = img
 
+    def set_audio_interval(self, interval):
+        """peak levels every interval (hop), for the next start"""
+        self.audio_interval = interval
+        self.max_level_samples = round(0.8 / interval)  # max level update period
+        # onsets/beats of the peak levels, subscribers are called in the audio thread
+        self.beat_detector = BeatDetector(interval)
+        self.beat_detector.subscribe(self.on_audio_beat)
+        self.beat_flash_decay = np.exp(-interval / self.BEAT_DECAY)
+        if self.audio_thread:
+            self.audio_thread.interval = interval
+
+    def on_audio_beat(self, event):
+        if event.kind == "beat":
+            self.beat_flash = 1.0
+        self.signal_audio_beat.emit(event)
+
+    def set_rgb_mode(self, mode):
+        self.rgb_mode = mode
+
+    @staticmethod
+    def rgb_array(img):
+        """(height, width, 3) writable view of a RGB888 qimage"""
+        return np.ndarray((img.height(), img.width(), 3), buffer=img.bits(),
+                          strides=[img.bytesPerLine(), 3, 1], dtype=np.uint8)
+
+    def select_audio_file(self):
+        """file source (looped, real time) for the next start, cancel: live capture"""
+        if not self.audio_thread:
+            return
+        filename, _ = QFileDialog.getOpenFileName(self, "open file", "", "audio (*.wav *.npy)")
+        if filename:
+            self.audio_thread.set_source(FileSource(filename, loop=True))
+            self.source_label.setText(os.path.basename(filename))
+        else:
+            self.audio_thread.set_source(None)
+            self.source_label.setText("live capture")
+
+    def audio_finished(self):
+        # source ended or failed
+        self.start_button.setText("start")
+        self.running = False
+
     def start(self):
         if not self.audio_thread:
             return
@@ -472,6 +527,8 @@ class RGBAudioTab(QWidget):
             self.update_freq_bands()
             self.update_min_max_level()
             self.audio_thread.connect_callback(self.process_audiopeak_levels)
+            self.audio_thread.process = self.process_checkbox.isChecked()
+            self.beat_detector.reset()
             self.audio_thread.start()
             self.start_button.setText("stop")
             self.running = True
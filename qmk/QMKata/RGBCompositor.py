@@ -0,0 +1,138 @@
+import math
+import time
+
+import numpy as np
+
+
+class RGBCompositor:
+    """
+    Combines the rgb frames of several image senders (video, audio, animation,
+    websocket, ...) into the frame sent to the keyboard.
+
+    Each sender is a layer holding its latest frame as a (height, width, 3)
+    uint8 array. Layers are blended bottom up in z order (then in the order
+    they were added) with one vectorized operation per layer:
+
+        add       saturating add (default)
+        max       per channel maximum
+        alpha     alpha over, layer * alpha + below * (1 - alpha)
+        multiply  below * layer / 255
+
+    The alpha of a layer with beat_decay flashes on audio beats (on_beat()):
+    alpha * exp(-(time since the beat) / beat_decay), e.g. an alpha layer
+    over the others showing on the beats only.
+    """
+
+    BLEND_MODES = ("add", "max", "alpha", "multiply")
+
+    class Layer:
+        def __init__(self, mode="add", z=0, alpha=1.0, beat_decay=0):
+            self.mode = mode
+            self.z = z
+            self.alpha = alpha
+            self.beat_decay = beat_decay
+            self.frame = None
+
+    def __init__(self):
+        self.layers = {}  # sender -> Layer
+        # layers sorted by z for a layers version, configure()/set_frame() of
+        # producer threads bump the version instead of touching the cache
+        self._version = 0
+        self._order = (-1, [])
+        self._acc = None  # uint16 blend buffer, reused while the size stays
+        self.beat_t = None  # time.monotonic() of the last beat
+
+    def on_beat(self, event):
+        """Onset/beat event (AudioBeat.BeatEvent), beats restart the beat_decay layers."""
+        if event.kind == "beat":
+            self.beat_t = event.t
+
+    def configure(self, key, mode=None, z=None, alpha=None, beat_decay=None):
+        """Set the blend mode/z order/alpha/beat decay (s, 0: off) of a layer,
+        kept when its sender stops."""
+        if mode is not None and mode not in self.BLEND_MODES:
+            raise ValueError(f"unknown blend mode '{mode}'")
+        layer = self.layers.setdefault(key, self.Layer())
+        if mode is not None:
+            layer.mode = mode
+        if z is not None:
+            layer.z = z
+        if alpha is not None:
+            layer.alpha = alpha
+        if beat_decay is not None:
+            layer.beat_decay = beat_decay
+        self._version += 1
+
+    def set_frame(self, key, arr):
+        """Latest frame of a sender, arr is copied (senders reuse their buffers)."""
+        if key not in self.layers:
+            self.layers[key] = self.Layer()
+            self._version += 1
+        self.layers[key].frame = np.array(arr, dtype=np.uint8, copy=True)
+
+    def remove_frame(self, key):
+        """Sender stopped, its layer no longer contributes."""
+        if key in self.layers:
+            self.layers[key].frame = None
+
+    def num_frames(self):
+        return sum(1 for layer in list(self.layers.values()) if layer.frame is not None)
+
+    def compose(self, size=None, now=None):
+        """Blended (height, width, 3) uint8 frame, None without frames.
+
+        size: (height, width) of the output, layers of other sizes are skipped
+        (default: size of the bottom layer). now: time of the beat flashes
+        (default: time.monotonic()).
+        """
+        version, order = self._order
+        if version != self._version:
+            version = self._version
+            # dict keeps insertion order, sorted() is stable
+            order = sorted(list(self.layers.values()), key=lambda layer: layer.z)
+            self._order = (version, order)
+        # (mode, alpha, frame) snapshot, frames are replaced by producer threads
+        layers = [(layer.mode, self._alpha(layer, now), layer.frame) for layer in order]
+        layers = [layer for layer in layers if layer[2] is not None]
+        if size is None and layers:
+            size = layers[0][2].shape[:2]
+        layers = [layer for layer in layers if layer[2].shape[:2] == tuple(size)]
+        if not layers:
+            return None
+        if len(layers) == 1:
+            return layers[0][2]
+
+        bottom = layers[0][2]
+        if self._acc is None or self._acc.shape != bottom.shape:
+            self._acc = np.empty(bottom.shape, dtype=np.uint16)
+        acc = self._acc
+        acc[...] = bottom
+        # sums of consecutive add layers are clipped once, same as clipping each
+        clipped = True
+        for mode, alpha, frame in layers[1:]:
+            if mode == "add":
+                acc += frame
+                clipped = False
+                continue
+            if not clipped:
+                np.minimum(acc, 255, out=acc)
+                clipped = True
+            if mode == "max":
+                np.maximum(acc, frame, out=acc)
+            elif mode == "multiply":
+                acc *= frame
+                acc //= 255
+            elif mode == "alpha":
+                acc[...] = acc * (1.0 - alpha) + frame * alpha + 0.5
+        if not clipped:
+            np.minimum(acc, 255, out=acc)
+        return acc.astype(np.uint8)
+
+    def _alpha(self, layer, now):
+        if not layer.beat_decay:
+            return layer.alpha
+        if self.beat_t is None:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        return layer.alpha * math.exp(-max(0.0, now - self.beat_t) / layer.beat_decay)
@@ -0,0 +1,145 @@
+import time
+
+from DebugTracer import DebugTracer
+
+
+class RGBFlowControl:
+    """
+    Paces ID_RGB_MATRIX_BUF packets so they go out as fast as the keyboard
+    applies them, without overrunning its rgb buffer.
+
+    credit: firmware with the TRANSPORT_RGB_ACK flag acknowledges every rgb
+        packet once applied with [ID_RGB_MATRIX_BUF, credits], credits: number
+        of packets it can accept now. At most credits packets are unacknowledged.
+    sync: older firmware. Every burst of packets is followed by a sync command
+        which the firmware answers after the packets before it (messages are
+        handled in order); the next burst is only sent once that sync was
+        answered, instead of a fixed sleep. The burst size adapts to the sync
+        round trip time: halved when it is above 2x the fastest one seen (and
+        more than a keyboard poll period slower) or on timeout, +1 otherwise,
+        up to the initial burst (dropped packets are not visible to the host,
+        the initial burst is the size known to be safe).
+    fixed: the sync command is not answered either, fixed sleeps after every
+        burst (the pacing used before flow control).
+    """
+
+    def __init__(self, keyboard, sysex_cmd, sync, mode="sync", burst=10, timeout_s=None,
+                 max_sync_timeouts=3):
+        """sysex_cmd: command of the rgb packets, sync: (sysex_cmd, data) of the
+        sync command, acknowledged and without side effects in the firmware
+        (it is interleaved with the commands of other threads)."""
+        self.dbg = DebugTracer(zones={"D": 0}, obj=self)
+        self.keyboard = keyboard
+        self.sysex_cmd = sysex_cmd
+        self.sync = sync
+        self.mode = mode
+        self.burst = burst
+        self.fixed_burst = burst
+        self.timeout_s = timeout_s if timeout_s else keyboard.keyb_poll_time * 100
+        self.max_sync_timeouts = max_sync_timeouts
+
+        self.credits = 1  # until the first ack tells
+        self.in_flight = {}  # seqnum -> send time, credit mode
+        self.num_unsynced = 0  # packets since the last sync
+        self.sync_pending = None  # (seqnum, send time)
+        self.sync_timeouts = 0  # consecutive
+        self.rtt_s = None  # ack/sync round trip, moving average
+        self.min_rtt_s = None
+        self.num_packets = 0
+        self.num_timeouts = 0
+
+    def send(self, data):
+        """Send one rgb packet (SET payload), blocks until the keyboard can take it."""
+        if self.mode == "credit":
+            while len(self.in_flight) >= max(1, self.credits):
+                self._wait_acks()
+        elif self.num_unsynced == 0:
+            self._wait_sync()  # previous burst applied
+        sent = self.keyboard.send_sysex(self.sysex_cmd, data)
+        self.num_packets += 1
+        if not sent:
+            return False
+        if self.mode == "credit":
+            self.in_flight[sent[1]] = time.monotonic()
+            return True
+
+        self.num_unsynced += 1
+        if self.num_unsynced >= self.burst:
+            self.flush()
+        return True
+
+    def end_frame(self):
+        """After the last packet of a frame: the frame is applied when this returns
+        (sync mode), the sync round trip is measured while it is pending."""
+        if self.mode != "credit" and self.num_unsynced:
+            self.flush()
+        self._wait_sync()
+
+    def flush(self):
+        """End of a burst: sync (answered once the burst is applied) or fixed sleep."""
+        self.num_unsynced = 0
+        if self.mode == "fixed":
+            time.sleep(self.keyboard.keyb_poll_time * 2)
+            return
+        sent = self.keyboard.send_sysex(*self.sync)
+        if sent:
+            self.sync_pending = (sent[1], time.monotonic())
+
+    # -------------------------------------------------------------------------------
+    def _rtt(self, rtt_s):
+        self.rtt_s = rtt_s if self.rtt_s is None else self.rtt_s * 0.8 + rtt_s * 0.2
+        self.min_rtt_s = rtt_s if self.min_rtt_s is None else min(self.min_rtt_s, rtt_s)
+
+    def _wait_acks(self):
+        dispatcher = self.keyboard.response_dispatcher
+        oldest = min(self.in_flight.values())
+        wait_s = max(0, oldest + self.timeout_s - time.monotonic())
+        acks = dispatcher.wait_any(list(self.in_flight), wait_s)
+        if not acks:
+            # lost acks must not stall the output, restart with one packet
+            self.dbg.tr("D", "rgb ack timeout, {} in flight", len(self.in_flight))
+            self.num_timeouts += 1
+            for seqnum in self.in_flight:
+                dispatcher.cancel(seqnum)
+            self.in_flight.clear()
+            self.credits = 1
+            return
+        now = time.monotonic()
+        # acks arrive in order, the last one has the current credits
+        for seqnum in sorted(acks, key=self.in_flight.get):
+            self._rtt(now - self.in_flight.pop(seqnum))
+            self.credits = acks[seqnum]
+
+    def _wait_sync(self):
+        if not self.sync_pending:
+            return
+        seqnum, sent_at = self.sync_pending
+        self.sync_pending = None
+        wait_s = max(0, sent_at + self.timeout_s - time.monotonic())
+        if not self.keyboard.response_dispatcher.wait(seqnum, wait_s):
+            self.num_timeouts += 1
+            self.sync_timeouts += 1
+            self.burst = max(1, self.burst // 2)
+            if self.sync_timeouts >= self.max_sync_timeouts:
+                self.dbg.tr("D", "rgb sync not answered, fixed pacing")
+                self.mode = "fixed"
+                self.burst = self.fixed_burst
+            return
+        self.sync_timeouts = 0
+        rtt_s = time.monotonic() - sent_at
+        self._rtt(rtt_s)
+        # keyboard is queuing, jitter below a poll period is the host scheduling
+        if rtt_s > 2 * self.min_rtt_s and rtt_s > self.min_rtt_s + self.keyboard.keyb_poll_time:
+            self.burst = max(1, self.burst // 2)
+        else:
+            self.burst = min(self.fixed_burst, self.burst + 1)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "burst": self.burst,
+            "credits": self.credits,
+            "rtt_ms": self.rtt_s * 1000 if self.rtt_s is not None else None,
+            "packets": self.num_packets,
+            "timeouts": self.num_timeouts,
+        }
@@ -0,0 +1,178 @@
+import numpy as np
+
+# ID_RGB_MATRIX_FRAME codecs, the keyboard reports the ones it decodes as a
+# bit mask (1 << codec) in the ID_TRANSPORT response
+CODEC_RGB888 = 0  # 3 bytes per led: r, g, b
+CODEC_RGB565 = 1  # 2 bytes per led, little endian rrrrrggg_gggbbbbb (lossy)
+CODEC_PALETTE = 2  # palette of the message + color index per led
+
+CODECS = {"rgb888": CODEC_RGB888, "rgb565": CODEC_RGB565, "palette": CODEC_PALETTE}
+
+RUN_HEADER_LEN = 2  # first led, count
+
+
+class RGBFrameCodec:
+    """
+    Compact ID_RGB_MATRIX_FRAME messages instead of 5 byte ID_RGB_MATRIX_BUF
+    pixels ([led index, duration, r, g, b]):
+
+        [ID_RGB_MATRIX_FRAME, codec, duration, palette, run, run, ...]
+        palette: CODEC_PALETTE only, [num colors, r, g, b, ...]
+        run: [first led, count, count led colors]
+
+    The duration is shared by all leds of the message, the led index of a run
+    is implicit (first led + position). A palette index takes 4 bits (low
+    nibble first) for up to 16 colors, else 8 bits.
+
+    Of the codecs in the preference list which the keyboard supports, the one
+    giving the fewest bytes for the frame is used, the palette counted in
+    every message.
+    """
+
+    def __init__(self, supported, preference=("palette", "rgb888")):
+        """supported: codec bit mask of the keyboard, preference: codec names."""
+        self.codecs = [
+            CODECS[name] for name in preference if supported & (1 << CODECS[name])
+        ]
+
+    def __bool__(self):
+        return bool(self.codecs)
+
+    @staticmethod
+    def runs(led_index, select, max_gap):
+        """Runs [(start, end)] of positions in led_index (sorted) covering the
+        selected leds. Gaps of up to max_gap leds are sent as part of the run,
+        which is cheaper than a new run header."""
+        pos = np.flatnonzero(select)
+        if len(pos) == 0:
+            return []
+        leds = led_index[pos].astype(np.int32)
+        # a new run where leds are not consecutive, unless the gap is small
+        # and all gap leds are mapped (positions advance like the leds)
+        led_gap = np.diff(leds) - 1
+        mergeable = (led_gap <= max_gap) & (np.diff(pos) == led_gap + 1)
+        breaks = np.flatnonzero(~mergeable)
+        starts = np.concatenate(([pos[0]], pos[breaks + 1]))
+        ends = np.concatenate((pos[breaks], [pos[-1]])) + 1
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    @staticmethod
+    def encode_colors(codec, colors, palette_index=None, index_bits=8):
+        if codec == CODEC_RGB888:
+            return colors.tobytes()
+        if codec == CODEC_RGB565:
+            c = colors.astype(np.uint16)
+            rgb565 = ((c[:, 0] >> 3) << 11) | ((c[:, 1] >> 2) << 5) | (c[:, 2] >> 3)
+            return rgb565.astype("<u2").tobytes()
+        if index_bits == 4:
+            index = np.zeros(len(palette_index) + len(palette_index) % 2, dtype=np.uint8)
+            index[: len(palette_index)] = palette_index
+            return (index[0::2] | (index[1::2] << 4)).tobytes()
+        return palette_index.astype(np.uint8).tobytes()
+
+    @staticmethod
+    def bytes_per_leds(codec, count, index_bits=8):
+        if codec == CODEC_RGB888:
+            return count * 3
+        if codec == CODEC_RGB565:
+            return count * 2
+        return (count + 1) // 2 if index_bits == 4 else count
+
+    @staticmethod
+    def leds_in_bytes(codec, size, index_bits=8):
+        if codec == CODEC_RGB888:
+            return size // 3
+        if codec == CODEC_RGB565:
+            return size // 2
+        return size * 2 if index_bits == 4 else size
+
+    def messages(self, msg_id, led_index, colors, select, duration, max_len):
+        """Messages [msg_id, codec, duration, ...] for the selected leds, None if
+        no codec fits them in max_len (send ID_RGB_MATRIX_BUF pixels instead).
+
+        led_index: sorted led numbers, colors: (len(led_index), 3) uint8,
+        select: bool mask of the leds to send.
+        """
+        select = np.asarray(select, dtype=bool)
+        if not select.any():
+            return []
+
+        best = None
+        for codec in self.codecs:
+            palette, palette_index, index_bits = b"", None, 8
+            if codec == CODEC_PALETTE:
+                if (palette_runs := self.palette_runs(led_index, colors, select)) is None:
+                    continue
+                palette, palette_index, index_bits, runs = palette_runs
+            else:
+                runs = self.runs(led_index, select, self.max_gap(codec))
+            header = bytes([msg_id, codec, duration]) + palette
+            # the palette is repeated in the header of every message
+            messages = self._pack(header, codec, led_index, colors, palette_index, index_bits, runs, max_len)
+            if messages is None:
+                continue
+            size = sum(len(m) for m in messages)
+            if best is None or size < best[0]:
+                best = (size, messages)
+        return best[1] if best else None
+
+    def max_gap(self, codec, index_bits=8):
+        """a gap is worth filling when its leds cost no more than a run header"""
+        max_gap = 0
+        while self.bytes_per_leds(codec, max_gap + 1, index_bits) <= RUN_HEADER_LEN:
+            max_gap += 1
+        return max_gap
+
+    def palette_runs(self, led_index, colors, select):
+        """(palette, color index per led, index bits, runs) of the leds sent,
+        None for more than 255 colors. The palette has the colors of the
+        selected leds and of the run gap leds, which are sent too."""
+        def palette_of(runs):
+            sent = np.concatenate([np.arange(start, end) for start, end in runs])
+            unique, inverse = np.unique(
+                colors[sent].view(np.dtype((np.void, 3))).ravel(), return_inverse=True
+            )
+            palette_index = np.zeros(len(colors), dtype=np.intp)
+            palette_index[sent] = inverse.ravel()
+            return unique, palette_index
+
+        num_colors = len(np.unique(colors[select].view(np.dtype((np.void, 3))).ravel()))
+        if num_colors > 255:
+            return None
+        index_bits = 4 if num_colors <= 16 else 8
+        runs = self.runs(led_index, select, self.max_gap(CODEC_PALETTE, index_bits))
+        unique, palette_index = palette_of(runs)
+        if len(unique) > (16 if index_bits == 4 else 255):
+            # gap leds add colors, send the selected leds only
+            runs = self.runs(led_index, select, 0)
+            unique, palette_index = palette_of(runs)
+        palette = bytes([len(unique)]) + unique.tobytes()
+        return palette, palette_index, index_bits, runs
+
+    def _pack(self, header, codec, led_index, colors, palette_index, index_bits, runs, max_len):
+        """messages of at most max_len bytes, None if the header and one led don't fit"""
+        if len(header) + RUN_HEADER_LEN + self.bytes_per_leds(codec, 1, index_bits) > max_len:
+            return None
+        messages = []
+        msg = bytearray(header)
+        for start, end in runs:
+            while start < end:
+                space = max_len - len(msg) - RUN_HEADER_LEN
+                count = min(end - start, 255, self.leds_in_bytes(codec, max(0, space), index_bits))
+                if count == 0:
+                    messages.append(bytes(msg))
+                    msg = bytearray(header)
+                    continue
+                msg.extend((int(led_index[start]), count))
+                msg.extend(
+                    self.encode_colors(
+                        codec,
+                        colors[start : start + count],
+                        None if palette_index is None else palette_index[start : start + count],
+                        index_bits,
+                    )
+                )
+                start += count
+        if len(msg) > len(header):
+            messages.append(bytes(msg))
+        return messages
@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+
+class RGBFrameEncoder:
+    """
+    Encodes rgb images into ID_RGB_MATRIX_BUF pixels: [led index, duration, r, g, b]
+
+    The pixel -> led index lookup of the keyboard model is evaluated once for
+    the image size and compiled into a led sampling table: every led is sent
+    once per frame with the average color of all pixels mapped to it (wide
+    keys like space/shift/enter cover several pixels). A frame is then
+    converted (channel swap, averaging, brightness, clip) and packed with
+    numpy instead of per pixel python calls.
+
+    encode_delta() keeps a shadow copy of the colors last sent and only emits
+    leds whose color moved more than threshold, or which were not sent for
+    max_age_s (the keyboard drops a pixel after its duration, so unchanged
+    leds have to be refreshed before that).
+    """
+
+    PIXEL_SIZE = 5
+
+    def __init__(self, xy_to_rgb_index, width, height, threshold=0, max_age_s=0.25):
+        self.size = (width, height)
+        self.threshold = threshold
+        self.max_age_s = max_age_s
+        lut = np.array(
+            [[xy_to_rgb_index(x, y) for x in range(width)] for y in range(height)],
+            dtype=np.int32,
+        )
+        # pixels without led are dropped, the rest in row major order
+        self.mask = (lut >= 0) & (lut <= 0xFF)
+        leds, pixel_led, count = np.unique(
+            lut[self.mask], return_inverse=True, return_counts=True
+        )
+        self.led_index = leds.astype(np.uint8)
+        self.num_leds = len(leds)
+        self.shared = bool(np.any(count > 1))
+        if self.shared:
+            # sparse sampling matrix as bincount bins: pixel channel -> led channel
+            self.bins = (pixel_led[:, None] * 3 + np.arange(3)).ravel()
+            self.weight = (1.0 / count)[:, None]
+        self.shadow = None
+        self.sent_ts = np.zeros(self.num_leds)
+        self.reset_pending = False
+
+    def reset(self):
+        """Forget the sent state, the next delta() sends all leds. Only flags
+        it, the shadow belongs to the thread encoding (rgb output thread)."""
+        self.reset_pending = True
+
+    def colors(self, arr, bgr=False, brightness=(1.0, 1.0, 1.0)):
+        """arr: (height, width, 3) uint8 image, brightness in r, g, b order.
+
+        Returns the (num_leds, 3) uint8 led colors, by led index.
+        """
+        rgb = arr[self.mask]
+        if bgr:
+            rgb = rgb[:, ::-1]
+        if self.shared:
+            rgb = np.bincount(
+                self.bins, weights=rgb.ravel(), minlength=self.num_leds * 3
+            ).reshape(-1, 3)
+            rgb *= self.weight
+        if tuple(brightness) != (1.0, 1.0, 1.0):
+            rgb = rgb * np.asarray(brightness, dtype=np.float64)
+        if rgb.dtype != np.uint8:
+            rgb = np.minimum(rgb, 255).astype(np.uint8)
+        return rgb
+
+    def pack(self, colors, duration, select=None):
+        """Packed pixels of the (selected) leds, bytes of PIXEL_SIZE per led."""
+        leds = self.led_index
+        if select is not None:
+            leds, colors = leds[select], colors[select]
+        pixels = np.empty((len(leds), self.PIXEL_SIZE), dtype=np.uint8)
+        pixels[:, 0] = leds
+        pixels[:, 1] = duration
+        pixels[:, 2:] = colors
+        return pixels.tobytes()
+
+    def encode(self, arr, bgr=False, brightness=(1.0, 1.0, 1.0), duration=50):
+        """All leds of the image: bytes of num_leds * PIXEL_SIZE, by led index."""
+        return self.pack(self.colors(arr, bgr, brightness), duration)
+
+    def delta(self, arr, bgr=False, brightness=(1.0, 1.0, 1.0), now=None):
+        """(colors, select): led colors and the mask of the leds changed since
+        the last sent frame or due for refresh, the shadow is updated to them."""
+        return self.delta_colors(self.colors(arr, bgr, brightness), now)
+
+    def delta_colors(self, colors, now=None):
+        """delta() of (num_leds, 3) uint8 led colors (e.g. replayed ones)."""
+        if now is None:
+            now = time.monotonic()
+        if self.reset_pending:
+            self.reset_pending = False
+            self.shadow = None
+        if self.shadow is None:
+            self.shadow = colors.copy()
+            self.sent_ts[:] = now
+            return colors, np.ones(self.num_leds, dtype=bool)
+
+        delta = np.abs(colors.astype(np.int16) - self.shadow).max(axis=1)
+        select = (delta > self.threshold) | (now - self.sent_ts >= self.max_age_s)
+        self.shadow[select] = colors[select]
+        self.sent_ts[select] = now
+        return colors, select
+
+    def encode_delta(self, arr, bgr=False, brightness=(1.0, 1.0, 1.0), duration=50, now=None):
+        """Leds changed since the last sent frame or due for refresh, may be empty."""
+        colors, select = self.delta(arr, bgr, brightness, now)
+        return self.pack(colors, duration, select)
+
+    @classmethod
+    def messages(cls, pixels, msg_id, max_len):
+        """Split packed pixels into [msg_id, pixels...] payloads of at most max_len bytes."""
+        chunk_len = (max_len - 1) // cls.PIXEL_SIZE * cls.PIXEL_SIZE
+        if chunk_len <= 0:
+            return []
+        return [
+            bytes([msg_id]) + pixels[off : off + chunk_len]
+            for off in range(0, len(pixels), chunk_len)
+        ]
@@ -0,0 +1,188 @@
+import os, struct, threading, time
+
+import numpy as np
+
+from DebugTracer import DebugTracer
+
+
+class RGBFrameRecord:
+    """
+    Recording of the led colors sent to a keyboard: header, led index table,
+    then one fixed size record per sent frame, appended as they are sent
+
+        magic       4 bytes  b"QKRR"
+        version     1 byte
+        format      1 byte   FORMAT_*
+        width       2 bytes  little endian, rgb matrix size of the frames
+        height      2 bytes
+        num leds    2 bytes
+        record size 4 bytes
+        created     8 bytes  float64 unix time
+        led index   num leds bytes, the led of each color, zero padded to 8 bytes
+
+        record: time 8 bytes float64 (s since the first frame), colors
+        num leds * 3 bytes (r, g, b by led index table order)
+
+    The colors are those after brightness (rgb multiplier) and led sampling,
+    every led of every frame, so any record can be replayed on its own. A
+    record cut off by a crash is ignored.
+    """
+
+    MAGIC = b"QKRR"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBHHHId")
+    FORMAT_LED_RGB888 = 0
+
+    @staticmethod
+    def record_dtype(num_leds):
+        return np.dtype([("t", "<f8"), ("rgb", "u1", (num_leds, 3))])
+
+    @classmethod
+    def data_offset(cls, num_leds):
+        return cls.HEADER.size + (num_leds + 7) // 8 * 8
+
+    @classmethod
+    def pack_header(cls, width, height, led_index, created=None):
+        num_leds = len(led_index)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.FORMAT_LED_RGB888, width, height, num_leds,
+                                 cls.record_dtype(num_leds).itemsize, time.time() if created is None else created)
+        table = bytes(np.asarray(led_index, dtype=np.uint8))
+        return header + table + bytes(cls.data_offset(num_leds) - len(header) - num_leds)
+
+    @classmethod
+    def unpack_header(cls, data):
+        """(width, height, led index, created), raises ValueError if data isn't a recording header"""
+        if len(data) < cls.HEADER.size:
+            raise ValueError("rgb recording: file shorter than the header")
+        magic, version, fmt, width, height, num_leds, record_size, created = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION or fmt != cls.FORMAT_LED_RGB888:
+            raise ValueError(f"rgb recording: unknown magic/version/format {magic} {version} {fmt}")
+        if record_size != cls.record_dtype(num_leds).itemsize or len(data) < cls.data_offset(num_leds):
+            raise ValueError("rgb recording: inconsistent header")
+        led_index = np.frombuffer(data, dtype=np.uint8, count=num_leds, offset=cls.HEADER.size).copy()
+        return width, height, led_index, created
+
+
+class RGBFrameRecorder:
+    """Appends the sent led colors of a keyboard to a recording file (RGBFrameRecord)."""
+
+    def __init__(self, path, width, height, led_index):
+        self.path = path
+        self.size = (width, height)
+        self.led_index = np.asarray(led_index, dtype=np.uint8).copy()
+        self.record = np.zeros(1, dtype=RGBFrameRecord.record_dtype(len(self.led_index)))
+        self.file = open(path, "wb")
+        self.file.write(RGBFrameRecord.pack_header(width, height, self.led_index))
+        self.t_start = None
+        self.num_frames = 0
+
+    def matches(self, width, height, led_index):
+        return self.size == (width, height) and np.array_equal(self.led_index, led_index)
+
+    def write(self, colors, now=None):
+        """(num leds, 3) uint8 colors of a sent frame"""
+        if now is None:
+            now = time.monotonic()
+        if self.t_start is None:
+            self.t_start = now
+        self.record["t"] = now - self.t_start
+        self.record["rgb"] = colors
+        self.file.write(self.record.tobytes())
+        self.num_frames += 1
+
+    def close(self):
+        self.file.close()
+
+
+class RGBFrameReplay:
+    """
+    Memory mapped recording (RGBFrameRecord): frames by index or time, and
+    play(), a thread sending the frames at the recorded times (speed scales
+    them) with seek() while playing. Only the pages of the frames played are
+    read, replay costs a copy of the led colors per frame.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(RGBFrameRecord.HEADER.size + 256 + 8)
+        width, height, self.led_index, self.created = RGBFrameRecord.unpack_header(head)
+        self.size = (width, height)
+        dtype = RGBFrameRecord.record_dtype(len(self.led_index))
+        offset = RGBFrameRecord.data_offset(len(self.led_index))
+        num_frames = max(0, (os.path.getsize(path) - offset) // dtype.itemsize)
+        if num_frames:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(num_frames,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.thread = None
+        self.running = False
+        self.wake = threading.Event()
+        self.position = 0  # next frame played
+        self.seek_to = None
+        self.dbg = DebugTracer(zones={"D": 0}, obj=self)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return float(self.records["t"][-1]) if len(self.records) else 0.0
+
+    def frame(self, i):
+        """(time, (num leds, 3) colors) of frame i, the colors are a view of the file"""
+        record = self.records[i]
+        return float(record["t"]), record["rgb"]
+
+    def index_at(self, t):
+        """the frame shown at time t (the last one recorded at or before t)"""
+        return max(0, int(np.searchsorted(self.records["t"], t, side="right")) - 1)
+
+    def seek(self, t):
+        """continue play() at time t"""
+        self.seek_to = t
+        self.wake.set()
+
+    def play(self, send, speed=1.0, start_s=0.0, loop=False):
+        """send(led_index, colors) of each frame from start_s on, in a thread"""
+        self.stop()
+        if not len(self.records):
+            return
+        self.running = True
+        self.seek_to = start_s
+        self.thread = threading.Thread(target=self._run, args=(send, speed, loop), name="rgb_replay", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread and self.thread != threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self, send, speed, loop):
+        times = self.records["t"]
+        base = None  # (wall time, recording time) of the last (re)start
+        while self.running:
+            self.wake.clear()  # before the seek check, a later seek() wakes the wait
+            if self.seek_to is not None:
+                self.position = self.index_at(self.seek_to)
+                base = (time.monotonic(), float(self.seek_to))
+                self.seek_to = None
+            if self.position >= len(times):
+                if not loop:
+                    break
+                self.position = 0
+                base = (time.monotonic(), 0.0)
+            # due at the recorded time, relative to the last (re)start
+            due = base[0] + (float(times[self.position]) - base[1]) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                if self.wake.wait(delay):
+                    continue  # stop/seek
+            try:
+                send(self.led_index, np.array(self.records["rgb"][self.position]))
+            except Exception as e:
+                self.dbg.tr("E", "send: {}", e)
+            self.position += 1
+        self.running = False
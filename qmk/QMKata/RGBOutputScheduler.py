@@ -0,0 +1,69 @@
+import threading, time
+
+from DebugTracer import DebugTracer
+
+
+class RGBOutputScheduler:
+    """
+    Sends rgb frames to the keyboard at a fixed rate from its own thread.
+
+    Producers publish() into a single slot (latest wins, a plain attribute
+    store, no lock); every 1/rate_hz the output thread calls send() with the
+    latest published item, also when nothing new was published (the delta
+    encoder refreshes leds before they time out). publish(None) idles the
+    thread until the next item.
+
+    The thread is started with the scheduler and runs until stop(), publish()
+    never starts one: publishers on several threads (gui, output, replay)
+    can't race into two output threads sharing the encoder and flow control.
+    """
+
+    def __init__(self, send, rate_hz, name="rgb_output"):
+        self.dbg = DebugTracer(zones={"D": 0, "E": 1}, obj=self)
+        self.send = send
+        self.rate_hz = rate_hz
+        self.name = name
+        self.slot = None
+        self.wake = threading.Event()
+        self.num_ticks = 0
+        self.num_late = 0  # ticks started later than one period after due
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def publish(self, item):
+        """latest item to send, None: idle; ignored after stop()"""
+        self.slot = item
+        self.wake.set()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread and self.thread != threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        period = 1 / self.rate_hz
+        due = time.monotonic()
+        while self.running:
+            item = self.slot
+            if item is None:
+                self.wake.wait()
+                self.wake.clear()
+                due = time.monotonic()
+                continue
+            try:
+                self.send(item)
+            except Exception as e:
+                self.dbg.tr("E", "send: {}", e)
+            self.num_ticks += 1
+
+            # fixed cadence, a late tick does not cause a burst of catch up ticks
+            due += period
+            now = time.monotonic()
+            if now > due + period:
+                self.num_late += 1
+                due = now
+            elif due > now:
+                time.sleep(due - now)
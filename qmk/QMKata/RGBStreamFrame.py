@@ -0,0 +1,75 @@
+import struct
+
+import numpy as np
+
+
+class RGBStreamFrame:
+    """
+    Binary websocket rgb frame: header + pixels, row major, no padding
+
+        magic     4 bytes  b"QKRF"
+        version   1 byte
+        format    1 byte   pixel format, FORMAT_*
+        width     2 bytes  little endian
+        height    2 bytes  little endian
+        frame id  4 bytes  little endian, incremented by the sender per frame
+
+    The pixels are wrapped as a numpy view of the message, no per pixel work
+    on either side; 4 byte formats take screen capture buffers as they are.
+    """
+
+    MAGIC = b"QKRF"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBHHI")
+
+    FORMAT_RGB888 = 0
+    FORMAT_BGR888 = 1
+    FORMAT_RGBX8888 = 2
+    FORMAT_BGRX8888 = 3
+
+    # format -> (bytes per pixel, channel slice giving r, g, b)
+    FORMATS = {
+        FORMAT_RGB888: (3, slice(0, 3)),
+        FORMAT_BGR888: (3, slice(2, None, -1)),
+        FORMAT_RGBX8888: (4, slice(0, 3)),
+        FORMAT_BGRX8888: (4, slice(2, None, -1)),
+    }
+
+    @classmethod
+    def is_frame(cls, message):
+        return isinstance(message, (bytes, bytearray, memoryview)) and message[:4] == cls.MAGIC
+
+    @classmethod
+    def pack(cls, arr, frame_id, fmt=FORMAT_RGB888):
+        """Message of a (height, width, channels) uint8 array in format fmt."""
+        height, width = arr.shape[:2]
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, fmt, width, height, frame_id & 0xFFFFFFFF)
+        return header + np.ascontiguousarray(arr, dtype=np.uint8).tobytes()
+
+    @classmethod
+    def unpack(cls, message):
+        """(frame id, format, (height, width, bytes per pixel) uint8 view of message).
+
+        Raises ValueError on a malformed message.
+        """
+        if len(message) < cls.HEADER.size:
+            raise ValueError("rgb frame: message shorter than the header")
+        magic, version, fmt, width, height, frame_id = cls.HEADER.unpack_from(message)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"rgb frame: unknown magic/version {magic} {version}")
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"rgb frame: unknown pixel format {fmt}")
+        bpp = cls.FORMATS[fmt][0]
+        size = width * height * bpp
+        if len(message) - cls.HEADER.size != size:
+            raise ValueError(
+                f"rgb frame: {len(message) - cls.HEADER.size} pixel bytes, "
+                f"{width}x{height} needs {size}"
+            )
+        arr = np.frombuffer(message, dtype=np.uint8, count=size, offset=cls.HEADER.size)
+        return frame_id, fmt, arr.reshape(height, width, bpp)
+
+    @classmethod
+    def rgb(cls, fmt, pixels):
+        """(height, width, 3) r, g, b view of unpacked pixels."""
+        return pixels[:, :, cls.FORMATS[fmt][1]]
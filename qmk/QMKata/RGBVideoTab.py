@@ -1,4 +1,4 @@
-import cv2, numpy as np, time
+import cv2, numpy as np, threading, time
 import asyncio, websockets
 
 from PySide6 import QtCore
@@ -7,10 +7,20 @@ from PySide6.QtCore import Qt, Signal, QTimer
 from PySide6.QtGui import QImage, QPixmap, QColor, QIntValidator
 
 from WSServer import WSServer
+from RGBStreamFrame import RGBStreamFrame
 from DebugTracer import DebugTracer
 
 class RGBVideoTab(QWidget):
     signal_rgb_image = Signal(QImage, object)
+    signal_ws_frame = Signal()
+
+    # RGBStreamFrame pixel format -> qimage format of the same memory layout
+    WS_QIMAGE_FORMATS = {
+        RGBStreamFrame.FORMAT_RGB888: QImage.Format_RGB888,
+        RGBStreamFrame.FORMAT_BGR888: QImage.Format_BGR888,
+        RGBStreamFrame.FORMAT_RGBX8888: QImage.Format_RGBX8888,
+        RGBStreamFrame.FORMAT_BGRX8888: QImage.Format_RGB32,  # little endian
+    }
 
     def __init__(self, size, rgb_matrix_tab, rgb_matrix_size):
         self.dbg = DebugTracer(zones={'D':0, 'WS_MSG':0}, obj=self)
@@ -22,47 +32,87 @@ class RGBVideoTab(QWidget):
         self.framerate = 25
         self.rgb_matrix_size = rgb_matrix_size
         self.rgb_multiplier = (1.0,1.0,1.0)
+        self.ws_frame = None  # latest (frame id, format, pixels) from the ws server thread
+        self.ws_frame_pending = False  # ws_frame not taken yet
+        self.ws_frame_lock = threading.Lock()
+        self.ws_frame_id = None
+        self.ws_frames_dropped = 0  # frames replaced before they were taken or lost
+        self.signal_ws_frame.connect(self.ws_frame_ready)
         self.init_gui()
 
     async def ws_handler(self, websocket, path):
+        """rgb frames of a websocket client:
+
+        binary: RGBStreamFrame message, header + pixels
+        text/legacy: b"rgb.img:" + r, g, b bytes of the rgb matrix size
+        """
         try:
             async for message in websocket:
-                try:
-                    message = bytearray(message, 'utf-8')
-                except:
-                    pass # already bytearray
-                self.dbg.tr('WS_MSG', "ws_handler: {}", message)
-                sub = b"rgb."
-                if message.startswith(sub):
-                    message = message[len(sub):]
-                    subs = [ b"mode:", b"img:" ]
-                    for sub in subs:
-                        if message.startswith(sub):
-                            if sub == b"img:":
-                                data = message[len(sub):]
-                                w = self.rgb_matrix_size[0]
-                                h = self.rgb_matrix_size[1]
-                                img = QImage(w, h, QImage.Format_RGB888)
-                                img.fill(QColor('black'))
-                                for y in range(h):
-                                    for x in range(w):
-                                        index = (y * w + x) * 3
-                                        try:
-                                            r, g, b = data[index], data[index + 1], data[index + 2]
-                                            img.setPixelColor(x, y, QColor(r, g, b))
-                                        except Exception as e:
-                                            #self.dbg.tr('WS_MSG', "ws_handler: {}" ,e)
-                                            pass
-
-                                self.signal_rgb_image.emit(img, self.rgb_multiplier)
-                                #self.dbg.tr('WS_MSG', "ws_handler:emit(img) done")
-                self.dbg.tr('WS_MSG', "ws_handler: message handled")
+                self.dbg.tr('WS_MSG', "ws_handler: {} bytes", len(message))
+                if RGBStreamFrame.is_frame(message):
+                    try:
+                        self.ws_publish(RGBStreamFrame.unpack(message))
+                    except ValueError as e:
+                        self.dbg.tr('WS_MSG', "ws_handler: {}", e)
+                else:
+                    if isinstance(message, str):
+                        message = message.encode('utf-8')
+                    sub = b"rgb.img:"
+                    if message.startswith(sub):
+                        self.ws_publish(self.ws_legacy_frame(message[len(sub):]))
                 await asyncio.sleep(0)  # Ensures control is yielded back to the event loop
 
         except Exception as e:
             self.dbg.tr('WS_MSG', "ws_handler: {}", e)
         self.dbg.tr('WS_MSG', "ws_handler: done")
-        self.signal_rgb_image.emit(None, self.rgb_multiplier)
+        self.ws_publish(None)
+
+    def ws_legacy_frame(self, data):
+        """rgb.img: pixels, missing pixels are black."""
+        w, h = self.rgb_matrix_size
+        pixels = np.zeros(w * h * 3, dtype=np.uint8)
+        data = np.frombuffer(data, dtype=np.uint8)[: len(pixels)]
+        pixels[: len(data)] = data
+        return None, RGBStreamFrame.FORMAT_RGB888, pixels.reshape(h, w, 3)
+
+    def ws_publish(self, frame):
+        """ws server thread: latest frame wins, a client sending faster than the
+        gui thread takes the frames overwrites the pending one instead of
+        queueing up signals. None: client disconnected."""
+        with self.ws_frame_lock:
+            self.ws_frame = frame
+            if self.ws_frame_pending:
+                return
+            self.ws_frame_pending = True
+        self.signal_ws_frame.emit()
+
+    def ws_frame_ready(self):
+        """gui thread: emit the latest websocket frame as rgb image."""
+        with self.ws_frame_lock:
+            if not self.ws_frame_pending:
+                return  # taken on an earlier signal
+            frame, self.ws_frame = self.ws_frame, None
+            self.ws_frame_pending = False
+        if frame is None:
+            self.ws_frame_id = None
+            self.signal_rgb_image.emit(None, self.rgb_multiplier)
+            return
+
+        frame_id, fmt, pixels = frame
+        if frame_id is not None and self.ws_frame_id is not None:
+            # 32 bit ids wrap around, a frame at or before the last one is stale
+            ahead = (frame_id - self.ws_frame_id) & 0xFFFFFFFF
+            if ahead == 0 or ahead >= 0x80000000:
+                return
+            self.ws_frames_dropped += ahead - 1
+        self.ws_frame_id = frame_id
+
+        # qimage on the message buffer, the keyboard copies the pixels on emit
+        h, w, bpp = pixels.shape
+        img = QImage(pixels, w, h, w * bpp, self.WS_QIMAGE_FORMATS[fmt])
+        if (w, h) != tuple(self.rgb_matrix_size):
+            img = img.scaled(self.rgb_matrix_size[0], self.rgb_matrix_size[1])
+        self.signal_rgb_image.emit(img, self.rgb_multiplier)
 
     def ws_server_startstop(self, state):
         #self.dbg.tr('D', "state:{}", state)
@@ -0,0 +1,88 @@
+import threading, time
+
+
+class ResponseDispatcher:
+    """
+    Hands sysex responses from the reader thread to the thread waiting for them.
+
+    A caller registers the key of the response it expects (sysex seqnum,
+    (ID_CLI, cli seqnum), ...) *before* the request goes out, then blocks in
+    wait(). The response handler calls complete() as soon as the response is
+    parsed, which wakes the waiter immediately instead of after the next
+    poll quantum.
+
+    Keys are recycled (seqnums wrap at 256), expect() replaces any stale
+    entry for the key so an old response can't be returned for a new request.
+    """
+
+    class Pending:
+        __slots__ = ("done", "value")
+
+        def __init__(self):
+            self.done = False
+            self.value = None
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}  # key -> Pending
+
+    def expect(self, key):
+        with self._cond:
+            pending = self.Pending()
+            self._pending[key] = pending
+            return pending
+
+    def complete(self, key, value):
+        """Complete the response for key. Returns False if nobody expected it."""
+        with self._cond:
+            pending = self._pending.get(key)
+            expected = pending is not None and not pending.done
+            if not expected:
+                # unsolicited or duplicate response, keep it for a late wait()
+                pending = self.Pending()
+                self._pending[key] = pending
+            pending.value = value
+            pending.done = True
+            self._cond.notify_all()
+            return expected
+
+    def cancel(self, key):
+        with self._cond:
+            self._pending.pop(key, None)
+
+    def wait(self, key, timeout_s):
+        """Wait for the response for key.
+
+        Returns (True, value) if the response arrived within timeout_s,
+        None otherwise. The key is consumed either way.
+        """
+        with self._cond:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = self.Pending()
+            self._cond.wait_for(lambda: pending.done, timeout_s)
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+            if pending.done:
+                return True, pending.value
+            return None
+
+    def wait_any(self, keys, timeout_s):
+        """Wait until at least one of keys is completed.
+
+        Returns a dict key -> value of all completed keys (consumed), an
+        empty dict on timeout.
+        """
+        deadline = time.monotonic() + timeout_s
+        with self._cond:
+            while True:
+                done = {}
+                for key in keys:
+                    pending = self._pending.get(key)
+                    if pending is not None and pending.done:
+                        done[key] = pending.value
+                        del self._pending[key]
+                remaining = deadline - time.monotonic()
+                if done or remaining <= 0:
+                    return done
+                self._cond.wait(remaining)
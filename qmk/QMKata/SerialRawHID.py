@@ -1,8 +1,78 @@
-import serial, hid, time
+import serial, hid, time, threading
 from DebugTracer import DebugTracer
 
+START_SYSEX     = 0xF0
+QMKATA_FRAME    = 0xF1 # START_SYSEX+1, length prefixed 8 bit frame
+END_SYSEX       = 0xF7
+REPORT_VERSION  = 0xF9
+
+#-------------------------------------------------------------------------------
+class RingBuffer:
+    '''
+    preallocated byte ring buffer, single producer/single consumer.
+    read_pos/write_pos only increase, the buffer index is pos % capacity.
+    '''
+    def __init__(self, capacity=0x10000):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.read_pos = 0
+        self.write_pos = 0
+
+    def __len__(self):
+        return self.write_pos - self.read_pos
+
+    def free(self):
+        return self.capacity - len(self)
+
+    def write(self, data):
+        n = len(data)
+        if n > self.free():
+            return False
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.view[start:start+first] = data[:first]
+        if first < n:
+            self.view[:n-first] = data[first:]
+        self.write_pos += n
+        return True
+
+    def peek(self, off=0):
+        return self.buf[(self.read_pos + off) % self.capacity]
+
+    def find(self, byte, off=0):
+        '''offset of byte from the read position or -1'''
+        start = (self.read_pos + off) % self.capacity
+        end = start + len(self) - off
+        if end <= self.capacity:
+            i = self.buf.find(byte, start, end)
+            return -1 if i < 0 else i - start + off
+        i = self.buf.find(byte, start, self.capacity)
+        if i >= 0:
+            return i - start + off
+        i = self.buf.find(byte, 0, end - self.capacity)
+        return -1 if i < 0 else i + self.capacity - start + off
+
+    def slice(self, n):
+        '''first n bytes, memoryview into the buffer when not wrapped, else a copy'''
+        start = self.read_pos % self.capacity
+        if start + n <= self.capacity:
+            return self.view[start:start+n]
+        first = self.capacity - start
+        return bytes(self.view[start:]) + bytes(self.view[:n-first])
+
+    def consume(self, n):
+        self.read_pos += min(n, len(self))
+
+    def read_byte(self):
+        byte = self.buf[self.read_pos % self.capacity]
+        self.read_pos += 1
+        return byte
+
+#-------------------------------------------------------------------------------
 class SerialRawHID(serial.SerialBase):
     FIRMATA_MSG         = 0xFA
+    FIRMATA_MSG_CONT    = 0xFB  # continuation report of a message spanning multiple reports
     QMK_RAW_USAGE_PAGE  = 0xFF60
     QMK_RAW_USAGE_ID    = 0x61
 
@@ -24,6 +94,14 @@ class SerialRawHID(serial.SerialBase):
         self.hid_device = None
         self._port = "{:04x}:{:04x}".format(vid, pid)
         self.MAX_DATA_SIZE = epsize-2
+        # max logical message size, > MAX_DATA_SIZE once multi-report framing
+        # is negotiated with the keyboard (see set_max_msg_size)
+        self.max_msg_size = self.MAX_DATA_SIZE
+        self.write_lock = threading.Lock() # reports of a message must not interleave
+        self.data = RingBuffer()
+        self.reader_thread = None
+        self.reader_running = False
+        self.frame_handler = None
         self.open()
         self.num_read_errors = 0 # device detached if too many read errors
         self.try_reopen = False
@@ -57,15 +135,84 @@ class SerialRawHID(serial.SerialBase):
         if not data or len(data) == 0:
             return
 
-        if data[0] == self.FIRMATA_MSG:
-            data.pop(0)
-            self.data.extend(data)
+        # continuation reports carry the rest of the previous message, the
+        # byte stream is reassembled by appending them in order
+        if data[0] == self.FIRMATA_MSG or data[0] == self.FIRMATA_MSG_CONT:
+            if not self.data.write(memoryview(data)[1:]):
+                # only possible with a frame larger than the buffer (garbage)
+                self.dbg.tr('E', "rx buffer overflow, dropping {} bytes", len(self.data))
+                self.data.consume(len(self.data))
 
     def inWaiting(self):
         if len(self.data) == 0:
             self._read_msg()
         return len(self.data)
 
+    #---------------------------------------------------------------------------
+    # reader thread: reads whole reports into the ring buffer and passes
+    # complete frames to frame_handler, no per byte read() calls
+    def start_reader(self, frame_handler):
+        self.frame_handler = frame_handler
+        self.reader_running = True
+        self.reader_thread = threading.Thread(target=self._reader, name="rawhid_reader", daemon=True)
+        self.reader_thread.start()
+
+    def stop_reader(self):
+        self.reader_running = False
+        if self.reader_thread and self.reader_thread != threading.current_thread():
+            self.reader_thread.join()
+        self.reader_thread = None
+
+    def _reader(self):
+        while self.reader_running:
+            if not self.hid_device:
+                self._reopen()
+                if not self.hid_device:
+                    time.sleep(0.1)
+                    continue
+            self._read_msg()
+            while (frame_len := self._frame_len()) > 0:
+                frame = self.data.slice(frame_len)
+                try:
+                    self.frame_handler(frame)
+                except Exception as e:
+                    self.dbg.tr('E', "frame handler: {}", e)
+                frame = None # release buffer view before consume
+                self.data.consume(frame_len)
+
+    def _frame_len(self):
+        '''
+        length of the complete firmata frame at the read position, 0 if the
+        frame is incomplete. bytes which can't start a frame (report padding)
+        are skipped.
+        '''
+        data = self.data
+        while len(data) > 0:
+            cmd = data.peek()
+            if cmd == QMKATA_FRAME:
+                # [QMKATA_FRAME, cmd, len_lo, len_hi, data..., END_SYSEX]
+                # length prefixed, data may contain any byte value
+                if len(data) < 4:
+                    return 0
+                frame_len = 5 + (data.peek(2) | (data.peek(3) << 8))
+                if frame_len > data.capacity:
+                    data.consume(1) # not a frame
+                    continue
+                if len(data) < frame_len:
+                    return 0
+                if data.peek(frame_len - 1) != END_SYSEX:
+                    data.consume(1) # corrupt, resync on the next frame start
+                    continue
+                return frame_len
+            if cmd == START_SYSEX:
+                end = data.find(END_SYSEX, 1)
+                return end + 1 if end > 0 else 0
+            if cmd == REPORT_VERSION or 0x80 <= cmd < START_SYSEX:
+                # fixed size messages, cmd + 2 data bytes
+                return 3 if len(data) >= 3 else 0
+            data.consume(1)
+        return 0
+
     def _reopen(self):
         if self.try_reopen:
             try:
@@ -94,7 +241,7 @@ class SerialRawHID(serial.SerialBase):
             self.hid_device = hid.device()
             self.hid_device.open_path(device['path'])
 
-            self.data = bytearray()
+            self.data.consume(len(self.data))
             self.write(bytearray([0xf0, 0x71, 0xf7]))
             #self._read_msg()
             #if len(self.data) == 0:
@@ -105,6 +252,14 @@ class SerialRawHID(serial.SerialBase):
 
         self.dbg.tr('I', f"opened HID device: {self.hid_device}")
 
+    def set_max_msg_size(self, max_msg_size):
+        '''
+        max size of a logical message, messages larger than one report are
+        sent as a FIRMATA_MSG report followed by FIRMATA_MSG_CONT reports.
+        '''
+        self.max_msg_size = max(max_msg_size, self.MAX_DATA_SIZE)
+        self.dbg.tr('I', f"max message size: {self.max_msg_size}")
+
     def is_open(self):
         return self.hid_device != None
 
@@ -120,18 +275,20 @@ class SerialRawHID(serial.SerialBase):
         if not self.hid_device:
             raise serial.SerialException("device not open")
 
-        # todo: span sysex data over multiple epsized packets
-        if len(data) > self.MAX_DATA_SIZE:
+        if len(data) > self.max_msg_size:
             self.dbg.tr('E', f"data too large: {len(data)}")
             raise serial.SerialException("data too large")
 
         total_sent = 0
-        while len(data) > 0:
-            chunk = bytearray([0x00, self.FIRMATA_MSG]) + data[:self.MAX_DATA_SIZE]
-            data = data[self.MAX_DATA_SIZE:]
-            self.hid_device.write(chunk)
-            total_sent += len(chunk)
-            if self.dbg_write: self.dbg_write.tr('WRITE', f"write: {chunk.hex(' ')}")
+        msg_id = self.FIRMATA_MSG
+        with self.write_lock:
+            while len(data) > 0:
+                chunk = bytearray([0x00, msg_id]) + data[:self.MAX_DATA_SIZE]
+                data = data[self.MAX_DATA_SIZE:]
+                self.hid_device.write(chunk)
+                total_sent += len(chunk)
+                msg_id = self.FIRMATA_MSG_CONT
+                if self.dbg_write: self.dbg_write.tr('WRITE', f"write: {chunk.hex(' ')}")
         if self.dbg_write:
             self.dbg_write.tr('WRITE', f"total sent: {total_sent}")
         return total_sent
@@ -146,8 +303,8 @@ class SerialRawHID(serial.SerialBase):
         if len(self.data) == 0:
             self._read_msg()
         if len(self.data) > 0:
-            if self.dbg_read: self.dbg_read.tr('READ', f"read:{hex(self.data[0])}")
-            return chr(self.data.pop(0))
+            if self.dbg_read: self.dbg_read.tr('READ', f"read:{hex(self.data.peek())}")
+            return chr(self.data.read_byte())
 
         if self.dbg_read: self.dbg_read.tr('READ', f"read: no data")
         return chr(0)
@@ -0,0 +1,87 @@
+import time
+from collections import deque
+
+from DebugTracer import DebugTracer
+
+
+class WindowedTransfer:
+    """
+    Sliding-window sender for chunked sysex transfers (module upload/read,
+    dynld function upload).
+
+    Up to `window` chunk requests are kept in flight. Each request is tracked
+    by the seqnum it went out with and the offset of its chunk; a chunk is
+    retransmitted (with a new seqnum) when its response times out or fails
+    validation, up to max_retries times per chunk.
+    """
+
+    def __init__(self, keyboard, window=4, timeout_s=None, max_retries=10):
+        self.dbg = DebugTracer(zones={'D': 0}, obj=self)
+        self.keyboard = keyboard
+        self.window = max(1, min(window, 128))  # stay well below seqnum wrap
+        self.timeout_s = timeout_s if timeout_s else keyboard.keyb_poll_time * 100
+        self.max_retries = max_retries
+        self.num_sends = 0
+        self.num_retransmits = 0
+
+    def run(self, sysex_cmd, chunks, validate=None):
+        """Send all chunks and collect their responses.
+
+        chunks: iterable of (offset, data), data is the complete sysex payload.
+        validate: validate(offset, response) -> bool, a failed validation
+            retransmits the chunk.
+        Returns dict offset -> response, None if a chunk ran out of retries.
+        """
+        dispatcher = self.keyboard.response_dispatcher
+        queue = deque(chunks)
+        in_flight = {}  # seqnum -> (offset, data, send time)
+        retries = {}  # offset -> retransmit count
+        responses = {}
+
+        def retransmit(offset, data, reason):
+            retries[offset] = retries.get(offset, 0) + 1
+            self.dbg.tr('D', "retransmit offset {} ({}), retry {}", offset, reason, retries[offset])
+            if retries[offset] > self.max_retries:
+                self.dbg.tr('E', "no response for offset {}", offset)
+                return False
+            self.num_retransmits += 1
+            queue.appendleft((offset, data))
+            return True
+
+        def abort():
+            for seqnum in in_flight:
+                dispatcher.cancel(seqnum)
+            return None
+
+        while queue or in_flight:
+            while queue and len(in_flight) < self.window:
+                offset, data = queue.popleft()
+                self.num_sends += 1
+                sent = self.keyboard.send_sysex(sysex_cmd, data)
+                if not sent:
+                    if not retransmit(offset, data, "send error"):
+                        return abort()
+                    break
+                in_flight[sent[1]] = (offset, data, time.monotonic())
+
+            if not in_flight:
+                continue
+
+            oldest = min(sent_at for _, _, sent_at in in_flight.values())
+            wait_s = max(0, oldest + self.timeout_s - time.monotonic())
+            for seqnum, response in dispatcher.wait_any(list(in_flight), wait_s).items():
+                offset, data, _ = in_flight.pop(seqnum)
+                if validate is None or validate(offset, response):
+                    responses[offset] = response
+                elif not retransmit(offset, data, f"bad response {response}"):
+                    return abort()
+
+            now = time.monotonic()
+            for seqnum, (offset, data, sent_at) in list(in_flight.items()):
+                if now - sent_at >= self.timeout_s:
+                    del in_flight[seqnum]
+                    dispatcher.cancel(seqnum)
+                    if not retransmit(offset, data, "timeout"):
+                        return abort()
+
+        return responses
@@ -0,0 +1,134 @@
+"""
+audio rgb pipeline benchmark: audio file (or a generated test signal) ->
+band analysis -> peak levels to rgb -> frame, as fast as possible, as json.
+
+    QT_QPA_PLATFORM=offscreen python benchmark_audio.py --output audio.json
+    python benchmark_audio.py --file music.wav --fft-len 0 --interval 0.04
+
+The generated signal is deterministic, the colors of its frames are in the
+results (checksum and the first frames) to compare runs.
+"""
+
+import argparse, hashlib, json, sys, time, types
+
+import numpy as np
+
+from PySide6.QtWidgets import QApplication
+
+from AudioSource import FileSource
+from RGBAudioTab import RGBAudioTab
+
+
+def test_signal(rate, seconds):
+    """bass tone, a sweep and noise bursts every 0.5s (beats)"""
+    t = np.arange(int(rate * seconds)) / rate
+    signal = 0.3 * np.sin(2 * np.pi * 55 * t)
+    signal += 0.2 * np.sin(2 * np.pi * (200 + 1800 * t / seconds) * t)
+    rng = np.random.default_rng(0)
+    burst = (t % 0.5) < 0.03
+    signal[burst] += 0.4 * rng.uniform(-1, 1, burst.sum())
+    return signal.astype(np.float32)
+
+
+def frame_color(img):
+    """color of a fill frame, digest of other frames"""
+    rgb = np.ndarray((img.height(), img.width(), 3), buffer=img.constBits(),
+                     strides=[img.bytesPerLine(), 3, 1], dtype=np.uint8)
+    if (rgb == rgb[0, 0]).all():
+        return img.pixelColor(0, 0).name()
+    return hashlib.sha1(rgb.tobytes()).hexdigest()[:12]
+
+
+def summarize(samples_s):
+    samples = sorted(samples_s)
+    if not samples:
+        return {}
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": pick(50),
+        "p99_ms": pick(99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="audio rgb pipeline benchmark")
+    parser.add_argument("--file", type=str, help="wav/npy file, default: generated test signal")
+    parser.add_argument("--rate", type=int, default=48000, help="rate of the test signal/npy file")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the test signal")
+    parser.add_argument("--interval", type=float, default=0.01, help="audio chunk/hop interval")
+    parser.add_argument("--fft-len", type=int, default=4096, help="streaming fft length, 0: fft per chunk")
+    parser.add_argument("--mode", choices=RGBAudioTab.RGB_MODES, default=RGBAudioTab.RGB_MODES[0], help="audio tab rgb mode")
+    parser.add_argument("--size", type=int, nargs=2, default=(17, 6), metavar=("W", "H"), help="rgb matrix size")
+    parser.add_argument("--frames", type=int, default=8, help="frame colors stored in the results")
+    parser.add_argument("--output", type=str, help="json output file, default stdout")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    tab = RGBAudioTab(tuple(args.size))
+    tab.running = True
+    tab.set_rgb_mode(args.mode)
+    tab.update_freq_rgb()
+    tab.update_min_max_level()
+
+    if args.file:
+        source = FileSource(args.file, rate=args.rate, realtime=False)
+    else:
+        source = FileSource(samples=test_signal(args.rate, args.seconds), rate=args.rate, realtime=False)
+    tab.set_audio_interval(args.interval)
+    thread = tab.audio_thread
+    thread.fft_len = args.fft_len or None
+    thread.set_source(source)
+
+    # frames straight from the tab instead of through qt signals, only the
+    # pipeline itself is measured
+    colors = []
+    tab.signal_rgb_image = types.SimpleNamespace(
+        emit=lambda img, mult: colors.append(frame_color(img) if img else None)
+    )
+    tab.signal_peak_levels = types.SimpleNamespace(emit=lambda peak_levels: None)
+    beats = []
+    tab.signal_audio_beat = types.SimpleNamespace(emit=beats.append)
+    tab.peak_level.setText = lambda text: None
+    callback_s = []
+
+    def callback(peak_levels):
+        t0 = time.perf_counter()
+        tab.process_audiopeak_levels(peak_levels)
+        callback_s.append(time.perf_counter() - t0)
+
+    thread.connect_callback(callback)
+    t0 = time.perf_counter()
+    thread.run()  # in this thread
+    elapsed_s = time.perf_counter() - t0
+
+    frames = [c for c in colors if c is not None]
+    results = {
+        "file": args.file,
+        "mode": args.mode,
+        "interval_s": args.interval,
+        "fft_len": args.fft_len,
+        "bands": len(tab.freq_bands),
+        "audio_s": len(source.samples) / source.rate,
+        "elapsed_s": elapsed_s,
+        "realtime_factor": len(source.samples) / source.rate / elapsed_s,
+        "analysis_per_hop_ms": (elapsed_s - sum(callback_s)) / max(1, len(callback_s)) * 1000,
+        "peak_levels_to_frame": summarize(callback_s),
+        "onsets": sum(1 for e in beats if e.kind == "onset"),
+        "beats": sum(1 for e in beats if e.kind == "beat"),
+        "tempo_bpm": tab.beat_detector.tempo_bpm,
+        "frames": len(frames),
+        "frame_colors": frames[: args.frames],
+        "frame_colors_sha1": hashlib.sha1(json.dumps(frames).encode()).hexdigest(),
+    }
+    out = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
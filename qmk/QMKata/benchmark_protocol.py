@@ -0,0 +1,323 @@
+# Copyright (C) 2024 bugbuster
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA.
+
+"""
+qmkata protocol benchmark: round trip latency percentiles, commands/s and
+payload bytes/s of the host <-> keyboard transfer paths, as json.
+
+    python benchmark_protocol.py --sim --output before.json
+    python benchmark_protocol.py --vid 3434 --pid 0830 --module-slot 7 --module-file mod.bin
+
+Without --module-file keyb_set_module only runs on the simulator (it
+overwrites the module slot).
+"""
+
+import argparse, contextlib, json, os, platform, struct, sys, time
+
+import numpy as np
+
+from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from KeyboardSimulator import MODULE_MAGIC, SimulatedFirmware, SimulatedRawHID
+from RGBFrameCodec import CODECS, RGBFrameCodec
+
+BENCHMARKS = (
+    "send_sysex_wait",
+    "keyb_set_cli_command",
+    "keyb_set_module",
+    "keyb_read_module_binary",
+    "keyb_send_rgb_frame",
+)
+
+
+# -------------------------------------------------------------------------------
+class WireCounter:
+    """Counts messages/bytes written to the keyboard transport."""
+
+    def __init__(self, sp):
+        self.sp = sp
+        self._write = sp.write
+        sp.write = self.write
+        self.reset()
+
+    def write(self, data):
+        self.msgs += 1
+        self.bytes += len(data)
+        return self._write(data)
+
+    def reset(self):
+        self.msgs = 0
+        self.bytes = 0
+        device = getattr(self.sp, "device", None)  # simulated hid device
+        self.reports = (device.num_out_reports, device.num_in_reports) if device else None
+
+    def report_counts(self):
+        device = getattr(self.sp, "device", None)
+        if not device or not self.reports:
+            return None
+        return {
+            "out": device.num_out_reports - self.reports[0],
+            "in": device.num_in_reports - self.reports[1],
+        }
+
+
+def percentile(sorted_samples, p):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(round(p / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed_s, payload_bytes, failures, wire):
+    samples_ms = sorted(s * 1000 for s in samples)
+    return {
+        "iterations": len(samples),
+        "failures": failures,
+        "elapsed_s": elapsed_s,
+        "ops_per_s": len(samples) / elapsed_s if elapsed_s else None,
+        "commands_per_s": wire.msgs / elapsed_s if elapsed_s else None,
+        "payload_bytes": payload_bytes,
+        "payload_bytes_per_s": payload_bytes / elapsed_s if elapsed_s else None,
+        "wire_msgs_out": wire.msgs,
+        "wire_bytes_out": wire.bytes,
+        "hid_reports": wire.report_counts(),
+        "latency_ms": {
+            "mean": sum(samples_ms) / len(samples_ms) if samples_ms else None,
+            "p50": percentile(samples_ms, 50),
+            "p90": percentile(samples_ms, 90),
+            "p99": percentile(samples_ms, 99),
+            "max": samples_ms[-1] if samples_ms else None,
+        },
+    }
+
+
+def run(op, iterations, payload_bytes, wire, sync=None):
+    """Time iterations of op() -> bool (success).
+
+    sync: called once after the loop and included in the elapsed time, a
+    round trip which flushes fire-and-forget commands still queued.
+    """
+    samples = []
+    failures = 0
+    wire.reset()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        ok = op()
+        samples.append(time.perf_counter() - t0)
+        if not ok:
+            failures += 1
+    if sync:
+        sync()
+    elapsed_s = time.perf_counter() - start
+    return summarize(samples, elapsed_s, payload_bytes * (iterations - failures), failures, wire)
+
+
+# -------------------------------------------------------------------------------
+def module_binary(size):
+    """Synthetic module image (valid header magic, random body) for the simulator."""
+    binary = bytearray(struct.pack("<IHHI", MODULE_MAGIC, 2, 0, size))
+    binary.extend(os.urandom(size - len(binary)))
+    return bytes(binary)
+
+
+def rgb_frame(keyboard):
+    width, height = keyboard.rgb_matrix_size()
+    return np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def benchmarks(keyboard, args, simulated):
+    """name -> (op, payload bytes per op, sync) or name -> skip reason"""
+    slot = args.module_slot
+    # small acknowledged command without side effects in the firmware, the
+    # rgb flow control sync (transport caps query)
+    ping = lambda: keyboard.send_sysex_wait(
+        QMKataKeybCmd.GET, bytearray([QMKataKeybCmd.ID_TRANSPORT])
+    )
+    if keyboard.transport_caps is None:
+        ping = None  # firmware without ID_TRANSPORT doesn't answer it
+    cli_read_size = 16
+    result = {
+        "send_sysex_wait": (lambda: bool(ping()), 0, None) if ping else "needs ID_TRANSPORT in the firmware",
+        "keyb_set_cli_command": (
+            lambda: keyboard.keyb_set_cli_command(f"mr {args.cli_addr:08x} {cli_read_size}")
+            is not None,
+            cli_read_size,
+            None,
+        ),
+    }
+
+    if args.module_file:
+        with open(args.module_file, "rb") as f:
+            binary = f.read()
+    elif simulated:
+        binary = module_binary(args.module_size)
+    else:
+        binary = None
+    if binary:
+        result["keyb_set_module"] = (lambda: keyboard.keyb_set_module(slot, binary), len(binary), None)
+    else:
+        result["keyb_set_module"] = "needs --module-file on a real keyboard"
+    read_size = len(binary) if binary else args.module_size
+    result["keyb_read_module_binary"] = (
+        lambda: keyboard.keyb_read_module_binary(slot, read_size) is not None,
+        read_size,
+        None,
+    )
+
+    # alternate two random frames, all leds change (worst case for delta frames)
+    frames = [rgb_frame(keyboard), rgb_frame(keyboard)]
+
+    def send_rgb_frame():
+        # the send path of the rgb output thread, without its fixed rate
+        frames.reverse()
+        keyboard.keyb_send_rgb_frame(frames[0], (1.0, 1.0, 1.0))
+        return True
+
+    result["keyb_send_rgb_frame"] = (send_rgb_frame, keyboard.num_rgb_leds() * 3, ping)
+    return result
+
+
+# -------------------------------------------------------------------------------
+def open_keyboard(args):
+    """Started QMKataKeyboard on the device or the simulator."""
+    models_by_name, models_by_vid_pid = QMKataKeyboard.load_keyboard_models()
+    model = None
+    if args.keyboard:
+        model = next((m for m in models_by_name.values() if m.NAME == args.keyboard), None)
+        if not model:
+            sys.exit(f"unknown keyboard model '{args.keyboard}'")
+    elif args.vid is not None and args.pid is not None:
+        model = models_by_vid_pid.get((args.vid, args.pid))
+    elif args.sim:
+        model = next(iter(models_by_name.values()))
+    if not model:
+        sys.exit("keyboard model not found, use --keyboard or --vid/--pid")
+
+    transport = None
+    if args.sim:
+        firmware = SimulatedFirmware(
+            model,
+            max_msg_len=args.sim_max_msg_len,
+            native_frames=not args.sim_no_native_frames,
+            legacy=args.sim_legacy,
+            sector_erase_s=args.sim_sector_erase_ms / 1000,
+            rgb_ack=not args.sim_no_rgb_ack,
+            rgb_queue_len=args.sim_rgb_queue,
+            rgb_apply_s=args.sim_rgb_apply_ms / 1000,
+        )
+        transport = SimulatedRawHID(
+            firmware,
+            report_interval_s=args.sim_report_interval_ms / 1000,
+            latency_s=args.sim_latency_ms / 1000,
+        )
+    keyboard = QMKataKeyboard(vid_pid=model.vid_pid(), transport=transport)
+    keyboard.start()
+
+    # knobs under test, applied after start() negotiated the transport
+    if args.poll_time_ms is not None:
+        keyboard.keyb_poll_time = args.poll_time_ms / 1000
+    if args.max_sysex_data is not None:
+        keyboard.MAX_LEN_SYSEX_DATA = min(args.max_sysex_data, keyboard.MAX_LEN_SYSEX_DATA)
+    if args.window is not None:
+        keyboard.transfer_window = lambda: args.window
+    if args.rgb_codecs is not None and keyboard.transport_caps:
+        keyboard.rgb_codec = RGBFrameCodec(keyboard.transport_caps["rgb_codecs"], args.rgb_codecs)
+    return keyboard, model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qmkata protocol benchmark")
+    parser.add_argument("--vid", type=lambda x: int(x, 16), help="keyboard vid in hex")
+    parser.add_argument("--pid", type=lambda x: int(x, 16), help="keyboard pid in hex")
+    parser.add_argument("--keyboard", type=str, help="keyboard model name (e.g. 'keychron q3 max')")
+    parser.add_argument("--sim", action="store_true", help="run against the simulated keyboard")
+    parser.add_argument("--sim-report-interval-ms", type=float, default=1.0)
+    parser.add_argument("--sim-latency-ms", type=float, default=0.5)
+    parser.add_argument("--sim-sector-erase-ms", type=float, default=250)
+    parser.add_argument("--sim-max-msg-len", type=int, default=512)
+    parser.add_argument("--sim-legacy", action="store_true", help="simulate firmware without ID_TRANSPORT")
+    parser.add_argument("--sim-no-native-frames", action="store_true")
+    parser.add_argument("--sim-no-rgb-ack", action="store_true", help="simulate firmware without rgb packet acks")
+    parser.add_argument("--sim-rgb-queue", type=int, default=16, help="rgb packets the simulated keyboard queues")
+    parser.add_argument("--sim-rgb-apply-ms", type=float, default=0, help="time to apply one rgb packet")
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--module-iterations", type=int, default=5, help="iterations of module load/read")
+    parser.add_argument("--module-slot", type=int, default=0)
+    parser.add_argument("--module-size", type=int, default=0x1000)
+    parser.add_argument("--module-file", type=str, help="module binary for keyb_set_module")
+    parser.add_argument("--cli-addr", type=lambda x: int(x, 16), default=0x20000000, help="cli memory read address in hex")
+    parser.add_argument("--poll-time-ms", type=float, help="override keyb_poll_time")
+    parser.add_argument("--max-sysex-data", type=int, help="limit MAX_LEN_SYSEX_DATA (chunk size)")
+    parser.add_argument("--window", type=int, help="override transfer window")
+    parser.add_argument("--rgb-codecs", nargs="*", choices=list(CODECS), help="override rgb frame codecs, none: rgb buf pixels")
+    parser.add_argument("--label", type=str, default="", help="label stored in the results")
+    parser.add_argument("--output", type=str, help="json output file, default stdout")
+    args = parser.parse_args()
+
+    # keyboard start() prints its info, keep stdout for the json
+    with contextlib.redirect_stdout(sys.stderr):
+        keyboard, model = open_keyboard(args)
+    try:
+        ops = benchmarks(keyboard, args, args.sim)
+        wire = WireCounter(keyboard.sp)
+        results = {}
+        for name in args.benchmarks:
+            bench = ops[name]
+            if isinstance(bench, str):
+                results[name] = {"skipped": bench}
+                continue
+            op, payload_bytes, sync = bench
+            iterations = args.module_iterations if "module" in name else args.iterations
+            print(f"{name}: {iterations} iterations", file=sys.stderr)
+            results[name] = run(op, iterations, payload_bytes, wire, sync)
+    finally:
+        keyboard.stop()
+
+    if args.sim:
+        results["sim_rgb_overruns"] = keyboard.sp.firmware.rgb_overruns
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version()},
+        "keyboard": model.NAME,
+        "transport": {
+            "simulated": args.sim,
+            "sim": {k[4:]: v for k, v in vars(args).items() if k.startswith("sim_")} if args.sim else None,
+            "caps": keyboard.transport_caps,
+            "native_frames": keyboard.native_frames,
+            "rgb_ack": keyboard.rgb_ack,
+        },
+        "config": {
+            "keyb_poll_time": keyboard.keyb_poll_time,
+            "max_len_sysex_data": keyboard.MAX_LEN_SYSEX_DATA,
+            "transfer_window": keyboard.transfer_window(),
+            "rgb_flow": keyboard.rgb_flow.stats() if keyboard.rgb_flow else None,
+            "rgb_codecs": keyboard.rgb_codec.codecs if keyboard.rgb_codec else None,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -153,20 +153,21 @@ class KeychronQ3Max:
         return slots
 
     # pixel position to (rgb) led index
-    @staticmethod
-    def xy_to_rgb_index(x, y):
-        __ = -1
-        xy_to_led = [
-            [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, __, 13, 14, 15],
-            [16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32],
-            [33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49],
-            [50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 62, __, __, __],
-            [63, 63, 64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 74, __, 75, __],
-            [76, 77, 78, 79, 79, 79, 79, 79, 79, 79, 80, 81, 82, 83, 84, 85, 86],
-        ]
+    __ = -1
+    XY_TO_RGB_INDEX = [
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, __, 13, 14, 15],
+        [16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32],
+        [33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49],
+        [50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 62, __, __, __],
+        [63, 63, 64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 74, __, 75, __],
+        [76, 77, 78, 79, 79, 79, 79, 79, 79, 79, 80, 81, 82, 83, 84, 85, 86],
+    ]
+    del __
+
+    @classmethod
+    def xy_to_rgb_index(cls, x, y):
         try:
-            # print(f"xy_to_led[{y}][{x}] = {xy_to_led[y][x]}")
-            return xy_to_led[y][x]
+            return cls.XY_TO_RGB_INDEX[y][x]
         except:
             return -1
 
@@ -0,0 +1,116 @@
+import unittest
+
+import numpy as np
+
+from AudioAnalysis import BandPeaks, StreamingBandAnalyzer
+
+RATE = 48000
+
+
+def _reference_peaks(samples, freq_bands, rate):
+    """per band mask + max, the former AudioCaptureThread loop"""
+    mag = np.abs(np.fft.rfft(samples))
+    freqs = np.fft.rfftfreq(len(samples), d=1.0 / rate)
+    peaks = []
+    for f_min, f_max in freq_bands:
+        band = mag[(freqs >= f_min) & (freqs <= f_max)]
+        peaks.append(band.max() if len(band) else 0)
+    return peaks
+
+
+def _tone(freq, n, amplitude=0.5):
+    return (amplitude * np.sin(2 * np.pi * freq * np.arange(n) / RATE)).astype(np.float32)
+
+
+class BandPeaksTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.samples = rng.uniform(-1, 1, 1920).astype(np.float32)
+        self.bands = [(27.5, 60), (60, 250), (200, 1000), (1000, 4186), (5000, 5010), (20000, 30000)]
+
+    def test_matches_per_band_masks(self):
+        band_peaks = BandPeaks(self.bands, len(self.samples), RATE)
+        np.testing.assert_allclose(
+            _reference_peaks(self.samples, self.bands, RATE), band_peaks.peaks(self.samples), rtol=1e-5
+        )
+
+    def test_empty_bands_are_zero(self):
+        bands = [(1, 2), (100, 200), (30000, 40000)]
+        band_peaks = BandPeaks(bands, len(self.samples), RATE)
+        peaks = band_peaks.peaks(self.samples)
+        self.assertEqual(0, peaks[0])
+        self.assertGreater(peaks[1], 0)
+        self.assertEqual(0, peaks[2])
+
+    def test_set_freq_bands_and_chunk(self):
+        band_peaks = BandPeaks(self.bands, len(self.samples), RATE)
+        bands = [(100, 150), (150, 400)]
+        band_peaks.set_freq_bands(bands)
+        band_peaks.set_chunk(960)
+        samples = self.samples[:960]
+        np.testing.assert_allclose(
+            _reference_peaks(samples, bands, RATE), band_peaks.peaks(samples), rtol=1e-5
+        )
+        self.assertEqual(0, len(BandPeaks([], 960, RATE).peaks(samples)))
+
+    def test_windowed_tone_keeps_its_level(self):
+        n = 1920
+        tone = _tone(1010, n)  # between two bins
+        bands = [(900, 1100), (3000, 4000)]
+        rect = BandPeaks(bands, n, RATE).peaks(tone)
+        hann = BandPeaks(bands, n, RATE, window="hann").peaks(tone)
+        self.assertAlmostEqual(1.0, hann[0] / rect[0], delta=0.25)
+        # less leakage into far bands
+        self.assertLess(hann[1], rect[1] / 10)
+
+
+class StreamingBandAnalyzerTest(unittest.TestCase):
+    HOP = 480  # 10ms
+
+    def analyzer(self, bands, **kwargs):
+        return StreamingBandAnalyzer(bands, RATE, self.HOP, fft_len=4096, short_len=1024,
+                                     level_len=1920, **kwargs)
+
+    def test_hops_of_any_chunk_size(self):
+        analyzer = self.analyzer([(100, 200)])
+        self.assertIsNone(analyzer.push(np.zeros(300)))
+        self.assertIsNotNone(analyzer.push(np.zeros(200)))
+        analyzer.push(np.zeros(4800))
+        self.assertEqual(11, analyzer.num_hops)
+
+    def test_low_bands_keep_the_long_fft_resolution(self):
+        bands = [(40, 50), (55, 65), (1000, 2000)]
+        analyzer = self.analyzer(bands, attack_s=0, decay_s=0)
+        self.assertEqual([0, 1], analyzer.analysis[0].tolist())  # long fft bands
+        levels = analyzer.push(_tone(45, 4800))
+        self.assertGreater(levels[0], 2 * levels[1])
+        # 25Hz bins of 1920 sample chunks, no bin in the 2nd band
+        chunk_levels = BandPeaks(bands, 1920, RATE).peaks(_tone(45, 1920))
+        self.assertEqual(0, chunk_levels[1])
+        # scaled to the level of 1920 sample chunks
+        self.assertAlmostEqual(1.0, levels[0] / chunk_levels[0], delta=0.5)
+
+    def test_transient_within_20ms(self):
+        bands = [(40, 50), (2000, 8000)]
+        analyzer = self.analyzer(bands, decay_s=0.12)
+        analyzer.push(np.zeros(4800))
+        rng = np.random.default_rng(5)
+        burst = rng.uniform(-1, 1, 9600).astype(np.float32)
+        hops = []
+        for i in range(0, len(burst), self.HOP):
+            hops.append(analyzer.push(burst[i : i + self.HOP])[1])
+        steady = np.mean(hops[-5:])
+        self.assertGreater(hops[1], steady / 2)  # 2 hops, 20ms
+        # decay after the burst
+        level = analyzer.push(np.zeros(self.HOP * 30))[1]
+        self.assertLess(level, steady / 5)
+
+    def test_set_freq_bands(self):
+        analyzer = self.analyzer([(100, 200)])
+        analyzer.set_freq_bands([(100, 200), (2000, 8000), (40, 50)])
+        levels = analyzer.push(np.ones(self.HOP))
+        self.assertEqual(3, len(levels))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+from AudioBeat import BeatDetector
+
+HOP = 0.01
+
+
+def _pulses(bpm, seconds, bands=8, kick_bands=(0, 1), seed=3):
+    """band peak levels per hop: noise floor with a decaying kick every beat"""
+    rng = np.random.default_rng(seed)
+    hops = int(seconds / HOP)
+    levels = rng.uniform(1, 1.5, (hops, bands))
+    period = 60 / bpm / HOP
+    for beat in np.arange(0, hops, period):
+        start = int(round(beat))
+        decay = 200 * np.exp(-np.arange(min(15, hops - start)) / 4)
+        levels[start : start + len(decay), list(kick_bands)] += decay[:, None]
+    kicks = [int(round(b)) for b in np.arange(0, hops, period)]
+    return levels, [k for k in kicks if k < hops]
+
+
+class BeatDetectorTest(unittest.TestCase):
+    def run_detector(self, levels, detector):
+        events = []
+        for hop, peak_levels in enumerate(levels):
+            for event in detector.process(peak_levels, now=hop * HOP):
+                events.append((hop, event))
+        return events
+
+    def test_onsets_at_the_kicks(self):
+        levels, kicks = _pulses(120, 6)
+        events = self.run_detector(levels, BeatDetector(HOP))
+        # after the first threshold_s of flux history
+        onsets = [hop for hop, e in events if e.kind == "onset" and hop >= 50]
+        self.assertEqual(kicks[1:], onsets)
+        for hop, e in events:
+            self.assertEqual(hop * HOP, e.t)
+            if hop >= 50:
+                self.assertTrue({0, 1} <= set(e.bands))
+
+    def test_tempo_estimate_and_beats(self):
+        for bpm in (90, 128, 174):
+            levels, kicks = _pulses(bpm, 10)
+            detector = BeatDetector(HOP)
+            events = self.run_detector(levels, detector)
+            self.assertAlmostEqual(bpm, detector.tempo_bpm, delta=bpm * 0.05, msg=f"{bpm} bpm")
+            beats = [hop for hop, e in events if e.kind == "beat" and hop >= 500]
+            self.assertEqual([k for k in kicks if k >= 500], beats)
+
+    def test_beats_continue_through_a_break(self):
+        levels, kicks = _pulses(120, 10)
+        levels[600:800] = 1.5  # two second break, silent kick
+        detector = BeatDetector(HOP)
+        beats = [hop for hop, e in self.run_detector(levels, detector) if e.kind == "beat"]
+        in_break = [hop for hop in beats if 600 < hop < 800]
+        self.assertGreaterEqual(len(in_break), 3)
+        for hop in in_break:
+            self.assertLessEqual(min(abs(hop - k) for k in kicks), 12)
+
+    def test_subscribers_and_bounded_history(self):
+        detector = BeatDetector(HOP)
+        received = []
+        detector.subscribe(received.append)
+        levels, _ = _pulses(120, 30)
+        events = self.run_detector(levels, detector)
+        self.assertEqual([e for _, e in events], received)
+        self.assertEqual(detector.tempo_len, len(detector.onset_strength))
+        self.assertEqual((detector.history_len, 8), detector.flux_history.shape)
+        detector.unsubscribe(received.append)
+        detector.process(np.zeros(4))  # bands changed: history restarted
+        self.assertEqual((detector.history_len, 4), detector.flux_history.shape)
+        self.assertIsNone(detector.tempo_bpm)
+
+
+if __name__ == "__main__":
+    unittest.main()
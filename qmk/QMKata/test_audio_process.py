@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from AudioAnalysis import band_analyzer
+from AudioProcess import AudioAnalysisProcess, BandLevelRing
+from AudioSource import FileSource
+
+BANDS = [(20, 60), (60, 250), (250, 2000), (2000, 16000)]
+
+
+class BandLevelRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = BandLevelRing(slots=4, max_bands=8)
+        self.addCleanup(self.ring.close)
+
+    def test_write_read_and_overwrite(self):
+        reader = BandLevelRing(self.ring.name)
+        self.addCleanup(reader.close)
+        for seq in range(1, 7):
+            self.ring.write(np.arange(3) + seq, 10.0 + seq)
+        self.assertEqual(6, reader.header[reader.SEQ])
+        t, levels = reader.read(6)
+        self.assertEqual(16.0, t)
+        np.testing.assert_array_equal([6, 7, 8], levels)
+        # seq 2 was in the slot of seq 6
+        self.assertIsNone(reader.read(2))
+        # being written
+        self.ring.ring[7 % 4, 0] = 0
+        self.assertIsNone(reader.read(7))
+
+    def test_freq_bands_versions(self):
+        reader = BandLevelRing(self.ring.name)
+        self.addCleanup(reader.close)
+        self.ring.set_freq_bands(BANDS)
+        version, bands = reader.freq_bands()
+        self.assertEqual([list(b) for b in BANDS], bands)
+        self.ring.set_freq_bands(BANDS[:2])
+        self.assertEqual((version + 2, [list(b) for b in BANDS[:2]]), reader.freq_bands())
+        self.ring.header[self.ring.BANDS_VERSION] += 1  # writing
+        self.assertIsNone(reader.freq_bands())
+
+
+class AudioAnalysisProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rate = 48000
+        self.samples = (np.random.default_rng(1).uniform(-0.3, 0.3, self.rate // 2)).astype(np.float32)
+        self.path = os.path.join(self.tmp.name, "a.npy")
+        np.save(self.path, self.samples)
+
+    def test_levels_of_the_child_process(self):
+        source = FileSource(self.path, rate=self.rate, realtime=True)
+        analysis = AudioAnalysisProcess(BANDS, 0.01, 4096, source=source, slots=128)
+        self.addCleanup(analysis.stop)
+        analysis.start()
+        hops = []
+        t_end = time.monotonic() + 30
+        while (new := analysis.read()) is not None and time.monotonic() < t_end:
+            hops += new
+            analysis.wait(0.01)
+        self.assertEqual(0, analysis.skipped)
+        # same levels as the analysis in this process
+        analyzer = band_analyzer(BANDS, self.rate, 480, 4096, int(self.rate * 0.04))
+        expected = [analyzer.push(self.samples[i : i + 480]) for i in range(0, len(self.samples), 480)]
+        np.testing.assert_allclose(expected, [levels for _, levels in hops])
+        times = [t for t, _ in hops]
+        self.assertEqual(sorted(times), times)
+        analysis.stop()
+        self.assertIsNone(analysis.proc)
+
+    def test_wait_wakes_on_a_hop(self):
+        source = FileSource(self.path, rate=self.rate, realtime=True)
+        analysis = AudioAnalysisProcess(BANDS, 0.01, 4096, source=source)
+        self.addCleanup(analysis.stop)
+        analysis.start()
+        waits = []
+        t_end = time.monotonic() + 30
+        while (new := analysis.read()) is not None and time.monotonic() < t_end:
+            t = time.monotonic()
+            analysis.wait(5)
+            waits.append(time.monotonic() - t)
+        # hops every 10 ms, the end of the child wakes the last wait
+        self.assertGreater(len(waits), 10)
+        self.assertLess(max(waits), 1)
+
+    def test_source_without_a_file(self):
+        analysis = AudioAnalysisProcess(BANDS, 0.01, source=FileSource(samples=self.samples))
+        with self.assertRaises(ValueError):
+            analysis.start()
+        self.assertIsNone(analysis.ring)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+
+from AudioRGB import SpectrumRenderer, band_levels, levels_to_rgb
+
+
+def _reference_rgb(peak_levels, db_min, max_level, freq_rgb, log_scale=True):
+    """per band loop of the former RGBAudioTab.peak_level_to_rgb"""
+    r = g = b = 0
+    for i in range(len(peak_levels)):
+        try:
+            ratio = peak_levels[i] / max_level[i]
+            if ratio == 0:
+                continue
+            if log_scale:
+                if db_min[i] >= 0:
+                    continue  # ZeroDivisionError, no dB range
+                peak_db = 20 * np.log10(ratio)
+                normalized = max(0, min(1, (peak_db - db_min[i]) / -db_min[i]))
+                level = int(round(255 * normalized))
+            else:
+                level = ratio * 255
+            r += level * freq_rgb[i][0]
+            g += level * freq_rgb[i][1]
+            b += level * freq_rgb[i][2]
+        except Exception:
+            pass
+    return min(r / 6, 255), min(g / 6, 255), min(b / 6, 255)
+
+
+class AudioRGBTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.n = 31
+        self.peaks = rng.uniform(0, 300, self.n).tolist()
+        self.peaks[3] = 0
+        self.db_min = [-27.0] * self.n
+        self.max_level = rng.uniform(50, 250, self.n).tolist()
+        self.freq_rgb = rng.uniform(0, 2, (self.n, 3)).round(2).tolist()
+
+    def test_matches_per_band_loop(self):
+        for log_scale in (True, False):
+            for peaks in (self.peaks, [p / 40 for p in self.peaks]):
+                levels = band_levels(peaks, self.db_min, self.max_level, log_scale)
+                np.testing.assert_allclose(
+                    _reference_rgb(peaks, self.db_min, self.max_level, self.freq_rgb, log_scale),
+                    levels_to_rgb(levels, self.freq_rgb),
+                    atol=1e-9,
+                )
+
+    def test_bands_without_db_range_are_dark(self):
+        # min level == max level in the ui: db_min 0
+        levels = band_levels([0.5, 1.0, 0.3], [0.0, 0.0, -27], [1, 1, 1])
+        np.testing.assert_array_equal([0, 0, 156], levels)
+        db_min = list(self.db_min)
+        db_min[1] = db_min[5] = 0.0
+        levels = band_levels(self.peaks, db_min, self.max_level)
+        self.assertFalse(np.isnan(levels).any())
+        np.testing.assert_allclose(
+            _reference_rgb(self.peaks, db_min, self.max_level, self.freq_rgb),
+            levels_to_rgb(levels, self.freq_rgb),
+            atol=1e-9,
+        )
+
+    def test_zero_max_level_and_changed_band_count(self):
+        max_level = list(self.max_level)
+        max_level[0] = 0
+        levels = band_levels(self.peaks, self.db_min[:-2], max_level)
+        self.assertEqual(self.n - 2, len(levels))
+        self.assertEqual(0, levels[0])
+        self.assertEqual(0, levels[3])
+        self.assertEqual((0.0, 0.0, 0.0), levels_to_rgb([], self.freq_rgb))
+
+    def test_spectrum_bars(self):
+        renderer = SpectrumRenderer(4, 4)
+        freq_rgb = [[1, 0, 0], [0, 2, 0], [0, 0, 0.5], [1, 1, 0]]
+        frame = renderer.render([255, 127.5, 0, 32], freq_rgb)
+        self.assertEqual((4, 4, 3), frame.shape)
+        # column 0 full red bar
+        np.testing.assert_array_equal([[255, 0, 0]] * 4, frame[:, 0])
+        # column 1 two rows, green scaled to 255
+        np.testing.assert_array_equal([[0, 0, 0]] * 2 + [[0, 255, 0]] * 2, frame[:, 1])
+        # column 2 silent
+        self.assertFalse(frame[:, 2].any())
+        # column 3 half of the bottom led
+        np.testing.assert_array_equal([[0, 0, 0]] * 3 + [[128, 128, 0]], frame[:, 3])
+
+    def test_spectrum_columns_show_the_loudest_band(self):
+        renderer = SpectrumRenderer(2, 2)
+        freq_rgb = [[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1], [1, 0, 1]]
+        out = np.zeros((2, 2, 3), dtype=np.uint8)
+        renderer.render([10, 255, 0, 0, 255], freq_rgb, out)
+        np.testing.assert_array_equal([[0, 255, 0]] * 2, out[:, 0])
+        np.testing.assert_array_equal([[255, 0, 255]] * 2, out[:, 1])
+        # fewer bands than columns
+        renderer = SpectrumRenderer(4, 1)
+        frame = renderer.render([255, 0], freq_rgb)
+        np.testing.assert_array_equal([[255, 0, 0]] * 2 + [[0, 0, 0]] * 2, frame[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+import wave
+
+import numpy as np
+
+from AudioSource import FileSource
+
+
+def _write_wav(path, frames, width, rate=8000):
+    """frames: (n, channels) int pcm values of width bytes"""
+    if width == 1:
+        data = (frames + 128).astype(np.uint8).tobytes()
+    elif width == 3:
+        data = frames.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = frames.astype({2: "<i2", 4: "<i4"}[width]).tobytes()
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(frames.shape[1])
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(data)
+
+
+class FileSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_wav_formats_to_float_mono(self):
+        for width in (1, 2, 3, 4):
+            full = 1 << (8 * width - 1)
+            left = np.array([0, full // 2, -full // 2, -full, full - 1])
+            right = np.array([0, full // 2, full // 2, -full, full - 1])
+            _write_wav(self.path("a.wav"), np.stack((left, right), axis=1), width)
+            samples, rate = FileSource.load_wav(self.path("a.wav"))
+            self.assertEqual(8000, rate)
+            self.assertEqual(np.float32, samples.dtype)
+            np.testing.assert_allclose([0, 0.5, 0, -1, 1], samples, atol=2.0 / full, err_msg=f"width {width}")
+
+    def test_chunks_until_the_end(self):
+        source = FileSource(samples=np.arange(2500) / 2500, rate=1000, realtime=False)
+        source.open(0.1)
+        self.assertEqual(100, source.chunk)
+        chunks = []
+        while (chunk := source.read()) is not None:
+            chunks.append(chunk)
+        self.assertEqual(25, len(chunks))
+        np.testing.assert_allclose(np.arange(2500) / 2500, np.concatenate(chunks), rtol=1e-6)
+
+    def test_loop_stop_and_npy_channels(self):
+        np.save(self.path("a.npy"), np.stack((np.ones(150), np.zeros(150)), axis=1))
+        source = FileSource(self.path("a.npy"), rate=1000, realtime=False, loop=True)
+        source.open(0.1)
+        for _ in range(5):
+            np.testing.assert_array_equal(np.full(100, 0.5), source.read())
+        source.stop()
+        self.assertIsNone(source.read())
+
+    def test_realtime_pacing(self):
+        source = FileSource(samples=np.zeros(1000), rate=1000, realtime=True)
+        source.open(0.02)
+        t0 = time.monotonic()
+        for _ in range(5):
+            source.read()
+        self.assertGreaterEqual(time.monotonic() - t0, 0.095)
+
+
+if __name__ == "__main__":
+    unittest.main()
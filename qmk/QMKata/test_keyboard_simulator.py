@@ -0,0 +1,190 @@
+import struct
+import sys
+import threading
+import types
+import unittest
+
+
+class _DummyQObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _DummySignal:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class _DummyQImage:
+    Format_RGB888 = 0
+    Format_BGR888 = 1
+
+
+class _DummyDebugTracer:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def enabled(self, *args, **kwargs):
+        return False
+
+    def tr(self, *args, **kwargs):
+        pass
+
+
+def _install_test_stubs():
+    qtcore = types.ModuleType("PySide6.QtCore")
+    qtcore.Qt = types.SimpleNamespace()
+    qtcore.QObject = _DummyQObject
+    qtcore.Signal = _DummySignal
+
+    qtgui = types.ModuleType("PySide6.QtGui")
+    qtgui.QImage = _DummyQImage
+    qtgui.QColor = object
+    qtgui.QPainter = object
+
+    pyside6 = types.ModuleType("PySide6")
+    pyside6.QtCore = qtcore
+    pyside6.QtGui = qtgui
+
+    pyfirmata2 = types.ModuleType("pyfirmata2")
+    pyfirmata2.Board = type("Board", (), {})
+    pyfirmata2.START_SYSEX = 0xF0
+    pyfirmata2.END_SYSEX = 0xF7
+
+    sys.modules.setdefault("PySide6", pyside6)
+    sys.modules.setdefault("PySide6.QtCore", qtcore)
+    sys.modules.setdefault("PySide6.QtGui", qtgui)
+    sys.modules.setdefault("pyfirmata2", pyfirmata2)
+    sys.modules.setdefault("numpy", types.ModuleType("numpy"))
+    try:
+        import serial
+    except ImportError:
+        serial = types.ModuleType("serial")
+        serial.SerialBase = object
+        serial.SerialException = type("SerialException", (Exception,), {})
+        sys.modules["serial"] = serial
+    try:
+        import hid
+    except ImportError:
+        sys.modules["hid"] = types.ModuleType("hid")
+
+    debug_tracer = types.ModuleType("DebugTracer")
+    debug_tracer.DebugTracer = _DummyDebugTracer
+    sys.modules.setdefault("DebugTracer", debug_tracer)
+
+
+_install_test_stubs()
+
+from KeyboardSimulator import MODULE_MAGIC, SimulatedFirmware, SimulatedRawHID
+from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from ResponseDispatcher import ResponseDispatcher
+
+
+def _module_binary(size, fill):
+    binary = bytearray(struct.pack("<IHHI", MODULE_MAGIC, 2, 0, size))
+    binary.extend(bytes([fill]) * (size - len(binary)))
+    return bytes(binary)
+
+
+class SimulatedKeyboardTest(unittest.TestCase):
+    def keyboard(self, firmware):
+        """QMKataKeyboard on a simulated raw hid device, without start()."""
+        sp = SimulatedRawHID(firmware, report_interval_s=0, latency_s=0)
+        keyboard = QMKataKeyboard.__new__(QMKataKeyboard)
+        keyboard.dbg = _DummyDebugTracer()
+        keyboard.sp = sp
+        keyboard.pack_endian = "<"
+        keyboard.encode_7bits_sysex = False
+        keyboard.MAX_LEN_SYSEX_DATA = sp.epsize - 6
+        keyboard.keyb_poll_time = 1 / 1000
+        keyboard.keyb_cli_seqnum = 0
+        keyboard.keyboardModel = None
+        keyboard.transport_caps = None
+        keyboard.native_frames = False
+        keyboard.response_dispatcher = ResponseDispatcher()
+        keyboard.sysex_send_lock = threading.Lock()
+        keyboard.sysex_seqnum = 0
+        keyboard._command_handlers = {
+            QMKataKeybCmd.RESPONSE: keyboard.sysex_response_handler
+        }
+        keyboard.frame_handlers = {QMKataKeybCmd.RESPONSE: keyboard.response_handler}
+        sp.start_reader(keyboard.handle_frame)
+        self.addCleanup(sp.stop_reader)
+        return keyboard
+
+    def test_module_upload_and_read_back_with_native_frames(self):
+        firmware = SimulatedFirmware(sector_erase_s=0)
+        keyboard = self.keyboard(firmware)
+
+        self.assertIsNotNone(keyboard.keyb_get_transport())
+        self.assertTrue(keyboard.native_frames)
+        self.assertTrue(firmware.native_frames)
+        self.assertEqual(512 - 4, keyboard.MAX_LEN_SYSEX_DATA)
+
+        binary = _module_binary(1000, 0xF7)
+        self.assertTrue(keyboard.keyb_set_module(1, binary))
+        self.assertEqual(binary, keyboard.keyb_read_module_binary(1, len(binary)))
+
+    def test_empty_module_read_chunk_is_requested_again(self):
+        firmware = SimulatedFirmware(sector_erase_s=0)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        binary = _module_binary(1000, 0x5A)
+        self.assertTrue(keyboard.keyb_set_module(1, binary))
+
+        # first answer for the second chunk is empty (chunk_len 0)
+        module_read = firmware._module_read
+        empty = []
+
+        def read_once_empty(data):
+            response = module_read(data)
+            if len(data) >= 4 and data[2] | (data[3] << 8) and not empty:
+                empty.append(response)
+                return bytes(response[:4]) + bytes(2)  # chunk_len 0, padding
+            return response
+
+        firmware._module_read = read_once_empty
+        self.assertEqual(binary, keyboard.keyb_read_module_binary(1, len(binary)))
+        self.assertEqual(1, len(empty))
+
+    def test_legacy_firmware_single_report_cli(self):
+        firmware = SimulatedFirmware(legacy=True)
+        keyboard = self.keyboard(firmware)
+
+        self.assertIsNone(keyboard.keyb_get_transport(timeout_s=0.05))
+        self.assertFalse(keyboard.native_frames)
+
+        keyboard.keyb_set_cli_command("mw 20000100 4 12345678")
+        self.assertEqual(
+            bytearray([0x78, 0x56, 0x34, 0x12]),
+            keyboard.keyb_set_cli_command("mr 20000100 4"),
+        )
+
+
+class SimulatedFirmwareTest(unittest.TestCase):
+    def module_set(self, firmware, slot_id, offset, payload=b""):
+        data = bytes([QMKataKeybCmd.ID_MODULE, slot_id, offset & 0xFF, offset >> 8, len(payload)])
+        msg = bytes([0xF1, QMKataKeybCmd.SET, 0]) + data + payload + b"\xf7"
+        return firmware.handle_message(msg)
+
+    def test_reloading_a_slot_erases_the_whole_sector(self):
+        firmware = SimulatedFirmware(sector_erase_s=0.3)
+        busy = []
+        for slot_id in (0, 1, 0):
+            self.module_set(firmware, slot_id, 0, _module_binary(32, slot_id))
+            frames, busy_s = self.module_set(firmware, slot_id, 0xFFFF)
+            self.assertEqual(1, len(frames))
+            busy.append(busy_s)
+
+        # only the reload finds programmed flash and erases, taking slot 1 with it
+        self.assertEqual([0, 0, 0.3], busy)
+        magic = lambda slot: bytes(firmware._mem(firmware.module_slots[slot][0], 4))
+        self.assertEqual(struct.pack("<I", MODULE_MAGIC), magic(0))
+        self.assertEqual(b"\xff" * 4, magic(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import struct
 import sys
+import threading
 import types
 import unittest
 
@@ -139,6 +140,7 @@ def _install_test_stubs():
 _install_test_stubs()
 
 from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from ResponseDispatcher import ResponseDispatcher
 
 
 class _FakeSignal:
@@ -245,14 +247,23 @@ class ModuleSummaryEndianTest(unittest.TestCase):
         keyboard.dbg = _FakeDbg()
         keyboard.pack_endian = ">"
         keyboard.MAX_LEN_SYSEX_DATA = 7  # header(5) + 2-byte payload
+        keyboard.keyboardModel = None
+        keyboard.keyb_poll_time = 1 / 1000
+        keyboard.encode_7bits_sysex = False
+        keyboard.response_dispatcher = ResponseDispatcher()
+        keyboard.sysex_send_lock = threading.Lock()
+        keyboard.sysex_seqnum = 0
 
         sent_packets = []
 
-        def fake_send_sysex_wait(_sysex_cmd, data):
-            sent_packets.append(bytes(data))
-            return bytes([0, 0])
+        class _AckingPort:
+            def write(self, msg):
+                # [START_SYSEX+1, cmd, seqnum, data..., END_SYSEX], ack rc=0
+                sent_packets.append(bytes(msg[3:-1]))
+                keyboard.response_dispatcher.complete(msg[2], 0)
+                return len(msg)
 
-        keyboard.send_sysex_wait = fake_send_sysex_wait
+        keyboard.sp = _AckingPort()
 
         self.assertTrue(keyboard.keyb_set_module(2, b"ABCD"))
         self.assertEqual(
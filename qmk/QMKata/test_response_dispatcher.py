@@ -0,0 +1,192 @@
+import sys
+import threading
+import time
+import types
+import unittest
+
+
+class _DummyQObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _DummySignal:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class _DummyQImage:
+    Format_RGB888 = 0
+    Format_BGR888 = 1
+
+
+class _DummyDebugTracer:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def enabled(self, *args, **kwargs):
+        return False
+
+    def tr(self, *args, **kwargs):
+        pass
+
+
+def _install_test_stubs():
+    qtcore = types.ModuleType("PySide6.QtCore")
+    qtcore.Qt = types.SimpleNamespace()
+    qtcore.QObject = _DummyQObject
+    qtcore.Signal = _DummySignal
+
+    qtgui = types.ModuleType("PySide6.QtGui")
+    qtgui.QImage = _DummyQImage
+    qtgui.QColor = object
+    qtgui.QPainter = object
+
+    pyside6 = types.ModuleType("PySide6")
+    pyside6.QtCore = qtcore
+    pyside6.QtGui = qtgui
+
+    pyfirmata2 = types.ModuleType("pyfirmata2")
+    pyfirmata2.Board = type("Board", (), {})
+    pyfirmata2.START_SYSEX = 0xF0
+    pyfirmata2.END_SYSEX = 0xF7
+
+    serial = types.ModuleType("serial")
+    serial.Serial = object
+    serial.tools = types.SimpleNamespace(
+        list_ports=types.SimpleNamespace(comports=lambda: [])
+    )
+
+    sys.modules.setdefault("PySide6", pyside6)
+    sys.modules.setdefault("PySide6.QtCore", qtcore)
+    sys.modules.setdefault("PySide6.QtGui", qtgui)
+    sys.modules.setdefault("pyfirmata2", pyfirmata2)
+    sys.modules.setdefault("serial", serial)
+    sys.modules.setdefault("numpy", types.ModuleType("numpy"))
+
+    serial_raw_hid = types.ModuleType("SerialRawHID")
+    serial_raw_hid.SerialRawHID = object
+    sys.modules.setdefault("SerialRawHID", serial_raw_hid)
+
+    debug_tracer = types.ModuleType("DebugTracer")
+    debug_tracer.DebugTracer = _DummyDebugTracer
+    sys.modules.setdefault("DebugTracer", debug_tracer)
+
+
+_install_test_stubs()
+
+from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from ResponseDispatcher import ResponseDispatcher
+
+
+class _DelayedResponder:
+    """Fake transport: answers every written message from another thread."""
+
+    def __init__(self, keyboard, respond, delay_s=0.02):
+        self.keyboard = keyboard
+        self.respond = respond
+        self.delay_s = delay_s
+        self.written = []
+
+    def write(self, msg):
+        self.written.append(bytes(msg))
+        response = self.respond(bytes(msg))
+        if response is not None:
+            threading.Timer(
+                self.delay_s, self.keyboard.sysex_response_handler, response
+            ).start()
+        return len(msg)
+
+
+def _keyboard():
+    keyboard = QMKataKeyboard.__new__(QMKataKeyboard)
+    keyboard.dbg = _DummyDebugTracer()
+    keyboard.pack_endian = "<"
+    keyboard.encode_7bits_sysex = False
+    keyboard.MAX_LEN_SYSEX_DATA = 58
+    keyboard.keyb_poll_time = 1 / 1000
+    keyboard.keyb_cli_seqnum = 0
+    keyboard.response_dispatcher = ResponseDispatcher()
+    keyboard.sysex_send_lock = threading.Lock()
+    keyboard.sysex_seqnum = 0
+    # response handler input is already 8 bit in these tests
+    keyboard._sysex_data_to_bytearray = lambda data: bytearray(data)
+    return keyboard
+
+
+class ResponseDispatcherTest(unittest.TestCase):
+    def test_wait_wakes_when_response_is_completed(self):
+        dispatcher = ResponseDispatcher()
+        dispatcher.expect(7)
+        threading.Timer(0.02, dispatcher.complete, (7, "ack")).start()
+
+        start = time.monotonic()
+        self.assertEqual((True, "ack"), dispatcher.wait(7, 1.0))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_wait_times_out_and_consumes_key(self):
+        dispatcher = ResponseDispatcher()
+        dispatcher.expect(1)
+        self.assertIsNone(dispatcher.wait(1, 0.01))
+        # late response is kept for a later waiter but not for a new request
+        dispatcher.complete(1, "late")
+        dispatcher.expect(1)
+        self.assertIsNone(dispatcher.wait(1, 0.01))
+
+    def test_response_before_wait_is_not_lost(self):
+        dispatcher = ResponseDispatcher()
+        dispatcher.expect(3)
+        self.assertTrue(dispatcher.complete(3, b"x"))
+        self.assertEqual((True, b"x"), dispatcher.wait(3, 0))
+
+
+class KeyboardResponseDispatchTest(unittest.TestCase):
+    def test_send_sysex_wait_returns_module_ack(self):
+        keyboard = _keyboard()
+
+        def respond(msg):
+            seqnum = msg[2]
+            return (seqnum, QMKataKeybCmd.ID_MODULE, 0)
+
+        keyboard.sp = _DelayedResponder(keyboard, respond)
+        response = keyboard.send_sysex_wait(
+            QMKataKeybCmd.SET, bytearray([QMKataKeybCmd.ID_MODULE, 1]), timeout_s=1.0
+        )
+        self.assertEqual((True, 0), response)
+        self.assertEqual(1, len(keyboard.sp.written))
+
+    def test_cli_command_returns_response_for_its_cli_seqnum(self):
+        keyboard = _keyboard()
+
+        def respond(msg):
+            # [START, SET, seqnum, ID_CLI, cli_seq, cmd...]
+            return (msg[2], QMKataKeybCmd.ID_CLI, msg[4], 0xAB, 0xCD)
+
+        keyboard.sp = _DelayedResponder(keyboard, respond)
+        keyboard.keyb_poll_time = 1 / 100  # 1s cli timeout
+        self.assertEqual(
+            bytearray([0xAB, 0xCD]), keyboard.keyb_set_cli_command("mr 20000000 2")
+        )
+
+    def test_native_frame_completes_with_a_copy(self):
+        keyboard = _keyboard()
+        keyboard.frame_handlers = {QMKataKeybCmd.RESPONSE: keyboard.response_handler}
+        keyboard.response_dispatcher.expect(9)
+        # [START_SYSEX+1, RESPONSE, len, seqnum, ID_MODULE, slot, off, len, data..., END]
+        payload = bytes([9, QMKataKeybCmd.ID_MODULE, 1, 0x40, 0x00, 3, 0xF7, 0xF0, 0x80])
+        frame = bytearray([0xF1, QMKataKeybCmd.RESPONSE, len(payload), 0]) + payload + b"\xf7"
+
+        keyboard.handle_frame(memoryview(frame))
+        frame[:] = bytes(len(frame))  # reader buffer is reused
+
+        self.assertEqual(
+            (True, bytearray([QMKataKeybCmd.ID_MODULE, 1, 0x40, 0x00, 3, 0xF7, 0xF0, 0x80])),
+            keyboard.response_dispatcher.wait(9, 0),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import random
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+import RGBAnimation
+from RGBAnimation import CachedFrameAnimation, FrameAnimation, FrameCache, axes_grid, blend, line_coverage, rect_coverage
+
+
+def _load_animations():
+    """animation.py methods, with the globals RGBAnimationTab runs them with"""
+    scope = {"np": np, "random": random}
+    scope.update({name: getattr(RGBAnimation, name) for name in ("axes_grid", "blend", "line_coverage", "rect_coverage")})
+    with open("animation.py", encoding="utf-8") as f:
+        exec(f.read(), scope)
+    return scope
+
+
+class FrameAnimationTest(unittest.TestCase):
+    def test_frames_repeat_into_the_same_buffer(self):
+        calls = []
+        anim = FrameAnimation(lambda i, frame: calls.append((i, frame)), 4, 2, n_frames=3,
+                              init=lambda: calls.append("init"))
+        frames = [anim.next_frame() for _ in range(4)]
+        self.assertEqual(["init", 0, 1, 2, 0], [c if c == "init" else c[0] for c in calls])
+        self.assertEqual((2, 4, 3), frames[0].shape)
+        self.assertTrue(all(f is anim.frame for f in frames))
+
+    def test_grid_and_coverage(self):
+        x, y = axes_grid(4, 2, (0, 4), (-1, 1))
+        np.testing.assert_allclose([0.5, 1.5, 2.5, 3.5], x[0])
+        np.testing.assert_allclose([0.5, -0.5], y[:, 0])
+        cover = rect_coverage(4, 2, 0.5, 0, 2, 1.5)
+        np.testing.assert_allclose([[0.5, 1, 0, 0], [0.25, 0.5, 0, 0]], cover)
+        np.testing.assert_allclose([0.5, 0.25, 0], line_coverage(np.array([0, 0.5, 2]), 0, 0.25, 1))
+        frame = np.full((2, 4, 3), 100, dtype=np.uint8)
+        blend(frame, (200, 0, 0), cover)
+        np.testing.assert_array_equal([150, 50, 50], frame[0, 0])
+        np.testing.assert_array_equal([100, 100, 100], frame[0, 3])
+
+
+class FrameCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = FrameCache(self.tmp.name, max_files=2)
+        self.renders = 0
+
+    def animation(self, n_frames=5):
+        def render(i, frame):
+            self.renders += 1
+            frame[...] = i * 10
+        return FrameAnimation(render, 3, 2, n_frames)
+
+    def test_rendered_once_then_memory_mapped(self):
+        key = FrameCache.key("src", size=(3, 2), n_frames=5)
+        self.assertNotEqual(key, FrameCache.key("src", size=(3, 2), n_frames=6))
+        frames = self.cache.frames(key, self.animation())
+        self.assertEqual((5, 2, 3, 3), frames.shape)
+        self.assertEqual(5, self.renders)
+        self.assertEqual([key + ".npy"], os.listdir(self.tmp.name))
+        # next run (e.g. app restart) only maps the file
+        frames = FrameCache(self.tmp.name).frames(key, self.animation())
+        self.assertEqual(5, self.renders)
+        self.assertIsInstance(frames, np.memmap)
+        playback = CachedFrameAnimation(frames)
+        values = [int(playback.next_frame()[1, 2, 0]) for _ in range(7)]
+        self.assertEqual([0, 10, 20, 30, 40, 0, 10], values)
+        self.assertFalse(playback.frame.base is frames)
+
+    def test_incomplete_file_and_pruning(self):
+        with open(os.path.join(self.tmp.name, "a.npy"), "wb") as f:
+            f.write(b"\x93NUMPY")
+        self.assertIsNone(self.cache.load("a"))
+        self.cache.frames("a", self.animation())
+        self.assertEqual(5, self.renders)
+        for key in ("b", "c"):
+            self.cache.frames(key, self.animation())
+        self.assertEqual(2, len(os.listdir(self.tmp.name)))
+        self.assertIsNone(self.cache.load("a"))
+
+    def test_no_temporary_file_left_by_a_failed_render(self):
+        def render(i, frame):
+            if i == 3:
+                raise ValueError("render")
+        with self.assertRaises(ValueError):
+            self.cache.frames("a", FrameAnimation(render, 3, 2, 5))
+        self.assertEqual([], os.listdir(self.tmp.name))
+
+
+class AnimationScriptTest(unittest.TestCase):
+    def test_builtins_render_at_matrix_resolution(self):
+        scope = _load_animations()
+        tab = types.SimpleNamespace(rgb_matrix_size=(17, 6), n_frames=1000,
+                                    audio_peak_levels=lambda: list(np.linspace(0, 200, 31)))
+        names = [n[len("render_"):] for n in scope if n.startswith("render_")]
+        self.assertEqual({"random_colors", "spiral", "wave", "circle_wave", "rect", "audio"}, set(names))
+        for name in names:
+            init = scope["init_audio_anim" if name == "audio" else "init_" + name]
+            render = scope["render_" + name]
+            anim = FrameAnimation(lambda i, frame: render(tab, i, frame), 17, 6, init=lambda: init(tab))
+            lit = [anim.next_frame().any() for _ in range(60)]
+            self.assertGreater(sum(lit), 30, name)
+
+    def test_cached_builtins_are_periodic_functions_of_i(self):
+        scope = _load_animations()
+        self.assertEqual(("init_wave", "render_wave", "cache"), scope["animate_methods"](None))
+        tab = types.SimpleNamespace(rgb_matrix_size=(17, 6), n_frames=1000)
+        scope["init_wave"](tab)
+        anim = FrameAnimation(lambda i, frame: scope["render_wave"](tab, i, frame), 17, 6, tab.n_frames)
+        frames = [anim.next_frame().copy() for _ in range(tab.n_frames + 1)]
+        # same frame after the wrap, and i = n_frames continues like frame 0
+        np.testing.assert_array_equal(frames[0], frames[-1])
+        frame = np.zeros((6, 17, 3), dtype=np.uint8)
+        scope["render_wave"](tab, tab.n_frames, frame)
+        np.testing.assert_array_equal(frames[0], frame)
+        # no state between frames
+        frame = np.zeros((6, 17, 3), dtype=np.uint8)
+        scope["render_wave"](tab, 123, frame)
+        np.testing.assert_array_equal(frames[123], frame)
+
+    def test_spiral_matches_the_rectangle_grid(self):
+        scope = _load_animations()
+        tab = types.SimpleNamespace(rgb_matrix_size=(17, 6), n_frames=1000)
+        scope["init_spiral"](tab)
+        frame = np.zeros((6, 17, 3), dtype=np.uint8)
+        scope["render_spiral"](tab, 0, frame)
+        # former per point loop: rectangle int(y) * cols + int(x) blue
+        expected = np.zeros((6, 17), dtype=bool)
+        for k in range(16):
+            theta = 0.1 * k + np.radians(10)
+            x, y = 8 + k / 2 * np.cos(theta), 3 + k / 2 * np.sin(theta)
+            if 0 <= x < 17 and 0 <= y < 6:
+                expected[int(y), int(x)] = True
+        np.testing.assert_array_equal(expected, frame[:, :, 2] == 255)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from RGBCompositor import RGBCompositor
+
+
+def _frame(*rgb):
+    return np.array([[rgb, rgb]], dtype=np.uint8)  # 1x2 image
+
+
+class RGBCompositorTest(unittest.TestCase):
+    def setUp(self):
+        self.compositor = RGBCompositor()
+
+    def test_single_sender_frame_is_a_copy(self):
+        frame = _frame(1, 2, 3)
+        self.compositor.set_frame("video", frame)
+        frame[...] = 0
+        np.testing.assert_array_equal(_frame(1, 2, 3), self.compositor.compose())
+
+    def test_saturating_add(self):
+        self.compositor.set_frame("video", _frame(200, 10, 0))
+        self.compositor.set_frame("audio", _frame(100, 20, 0))
+        self.compositor.set_frame("anim", _frame(0, 30, 255))
+        np.testing.assert_array_equal(_frame(255, 60, 255), self.compositor.compose())
+
+    def test_blend_modes_in_z_order(self):
+        self.compositor.configure("top", mode="multiply", z=2)
+        self.compositor.configure("mid", mode="max", z=1)
+        self.compositor.set_frame("top", _frame(255, 128, 0))
+        self.compositor.set_frame("mid", _frame(10, 200, 10))
+        self.compositor.set_frame("bottom", _frame(100, 100, 100))
+        # max(bottom, mid) * top / 255
+        np.testing.assert_array_equal(_frame(100, 100, 0), self.compositor.compose())
+
+        self.compositor.configure("top", mode="alpha", alpha=0.25)
+        # (100, 200, 100) * 0.75 + (255, 128, 0) * 0.25
+        np.testing.assert_array_equal(_frame(139, 182, 75), self.compositor.compose())
+
+    def test_add_is_clipped_before_other_modes(self):
+        self.compositor.configure("b", mode="add", z=1)
+        self.compositor.configure("c", mode="multiply", z=2)
+        self.compositor.set_frame("a", _frame(200, 0, 0))
+        self.compositor.set_frame("b", _frame(200, 0, 0))
+        self.compositor.set_frame("c", _frame(128, 0, 0))
+        np.testing.assert_array_equal(_frame(128, 0, 0), self.compositor.compose())
+
+    def test_stopped_sender_and_other_sizes_are_skipped(self):
+        self.compositor.configure("audio", mode="max")
+        self.compositor.set_frame("video", _frame(1, 1, 1))
+        self.compositor.set_frame("audio", _frame(5, 5, 5))
+        self.compositor.set_frame("ws", np.zeros((2, 2, 3), dtype=np.uint8))
+        self.compositor.remove_frame("audio")
+        self.assertEqual(2, self.compositor.num_frames())
+        np.testing.assert_array_equal(_frame(1, 1, 1), self.compositor.compose((1, 2)))
+        self.assertEqual("max", self.compositor.layers["audio"].mode)
+
+    def test_beat_layer_flashes_on_beats(self):
+        self.compositor.set_frame("audio", _frame(0, 0, 0))
+        self.compositor.set_frame("beat", _frame(200, 100, 0))
+        self.compositor.configure("beat", mode="alpha", z=1, beat_decay=0.1)
+        # no beat yet
+        np.testing.assert_array_equal(_frame(0, 0, 0), self.compositor.compose(now=5.0))
+        self.compositor.on_beat(SimpleNamespace(kind="onset", t=5.0))
+        np.testing.assert_array_equal(_frame(0, 0, 0), self.compositor.compose(now=5.0))
+        self.compositor.on_beat(SimpleNamespace(kind="beat", t=5.0))
+        np.testing.assert_array_equal(_frame(200, 100, 0), self.compositor.compose(now=5.0))
+        # alpha exp(-1)
+        np.testing.assert_array_equal(_frame(74, 37, 0), self.compositor.compose(now=5.1))
+
+    def test_unknown_blend_mode(self):
+        with self.assertRaises(ValueError):
+            self.compositor.configure("video", mode="screen")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+
+class _DummyQObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _DummySignal:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class _DummyQImage:
+    Format_RGB888 = 0
+    Format_BGR888 = 1
+
+
+class _DummyDebugTracer:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def enabled(self, *args, **kwargs):
+        return False
+
+    def tr(self, *args, **kwargs):
+        pass
+
+
+def _install_test_stubs():
+    qtcore = types.ModuleType("PySide6.QtCore")
+    qtcore.Qt = types.SimpleNamespace()
+    qtcore.QObject = _DummyQObject
+    qtcore.Signal = _DummySignal
+
+    qtgui = types.ModuleType("PySide6.QtGui")
+    qtgui.QImage = _DummyQImage
+    qtgui.QColor = object
+    qtgui.QPainter = object
+
+    pyside6 = types.ModuleType("PySide6")
+    pyside6.QtCore = qtcore
+    pyside6.QtGui = qtgui
+
+    pyfirmata2 = types.ModuleType("pyfirmata2")
+    pyfirmata2.Board = type("Board", (), {})
+    pyfirmata2.START_SYSEX = 0xF0
+    pyfirmata2.END_SYSEX = 0xF7
+
+    sys.modules.setdefault("PySide6", pyside6)
+    sys.modules.setdefault("PySide6.QtCore", qtcore)
+    sys.modules.setdefault("PySide6.QtGui", qtgui)
+    sys.modules.setdefault("pyfirmata2", pyfirmata2)
+    try:
+        import numpy
+    except ImportError:
+        sys.modules["numpy"] = types.ModuleType("numpy")
+    try:
+        import serial
+    except ImportError:
+        serial = types.ModuleType("serial")
+        serial.SerialBase = object
+        serial.SerialException = type("SerialException", (Exception,), {})
+        sys.modules["serial"] = serial
+    try:
+        import hid
+    except ImportError:
+        sys.modules["hid"] = types.ModuleType("hid")
+
+    debug_tracer = types.ModuleType("DebugTracer")
+    debug_tracer.DebugTracer = _DummyDebugTracer
+    sys.modules.setdefault("DebugTracer", debug_tracer)
+
+
+_install_test_stubs()
+
+import numpy
+from KeyboardSimulator import MODULE_MAGIC, SimulatedFirmware, SimulatedRawHID
+from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from ResponseDispatcher import ResponseDispatcher
+
+
+def _rgb_packet(led):
+    return bytes([QMKataKeybCmd.ID_RGB_MATRIX_BUF, led, 50, 1, 2, 3])
+
+
+def _module_binary(size, fill):
+    binary = bytearray(struct.pack("<IHHI", MODULE_MAGIC, 2, 0, size))
+    binary.extend(bytes([fill]) * (size - len(binary)))
+    return bytes(binary)
+
+
+class RGBFlowControlTest(unittest.TestCase):
+    def keyboard(self, firmware, report_interval_s=0):
+        """QMKataKeyboard on a simulated raw hid device, without start()."""
+        sp = SimulatedRawHID(firmware, report_interval_s=report_interval_s, latency_s=0)
+        keyboard = QMKataKeyboard.__new__(QMKataKeyboard)
+        keyboard.dbg = _DummyDebugTracer()
+        keyboard.sp = sp
+        keyboard.port_type = "rawhid"
+        keyboard.pack_endian = "<"
+        keyboard.encode_7bits_sysex = False
+        keyboard.MAX_LEN_SYSEX_DATA = sp.epsize - 6
+        keyboard.keyb_poll_time = 1 / 1000
+        keyboard.keyboardModel = None
+        keyboard.transport_caps = None
+        keyboard.native_frames = False
+        keyboard.rgb_ack = False
+        keyboard.rgb_flow = None
+        keyboard.rgb_record_path = None
+        keyboard.response_dispatcher = ResponseDispatcher()
+        keyboard.sysex_send_lock = threading.Lock()
+        keyboard.sysex_seqnum = 0
+        keyboard._command_handlers = {
+            QMKataKeybCmd.RESPONSE: keyboard.sysex_response_handler
+        }
+        keyboard.frame_handlers = {QMKataKeybCmd.RESPONSE: keyboard.response_handler}
+        sp.start_reader(keyboard.handle_frame)
+        self.addCleanup(sp.stop_reader)
+        return keyboard
+
+    def test_credits_keep_the_rgb_queue_from_overrunning(self):
+        firmware = SimulatedFirmware(rgb_queue_len=3, rgb_apply_s=0.002)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        self.assertTrue(keyboard.rgb_ack)
+
+        flow = keyboard.rgb_flow_control()
+        self.assertEqual("credit", flow.mode)
+        for led in range(30):
+            flow.send(_rgb_packet(led))
+        flow.end_frame()
+        self.assertEqual(0, firmware.rgb_overruns)
+        self.assertEqual(3, flow.credits)
+        self.assertEqual(0, flow.num_timeouts)
+
+    def test_fixed_bursts_overrun_a_slow_keyboard(self):
+        # reference for the tests above/below: pacing without flow control
+        firmware = SimulatedFirmware(rgb_queue_len=3, rgb_apply_s=0.002)
+        keyboard = self.keyboard(firmware)
+        for led in range(30):
+            keyboard.send_sysex(QMKataKeybCmd.SET, _rgb_packet(led))
+        self.assertGreater(firmware.rgb_overruns, 0)
+
+    def test_sync_bursts_adapt_without_rgb_acks(self):
+        firmware = SimulatedFirmware(rgb_ack=False, rgb_queue_len=10)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        self.assertFalse(keyboard.rgb_ack)
+
+        flow = keyboard.rgb_flow_control()
+        self.assertEqual("sync", flow.mode)
+        for _ in range(3):
+            for led in range(30):
+                flow.send(_rgb_packet(led))
+            flow.end_frame()
+        self.assertEqual(10, flow.burst)
+
+        # keyboard gets slow, bursts shrink
+        firmware.rgb_apply_s = 0.002
+        for led in range(30):
+            flow.send(_rgb_packet(led))
+        flow.end_frame()
+        self.assertLess(flow.burst, 10)
+        self.assertEqual("sync", flow.mode)
+        self.assertEqual(0, firmware.rgb_overruns)
+
+    def test_unanswered_sync_falls_back_to_fixed_pacing(self):
+        firmware = SimulatedFirmware(rgb_ack=False)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        # a sync command the firmware never answers
+        keyboard.rgb_flow = None
+        flow = keyboard.rgb_flow_control()
+        flow.sync = (QMKataKeybCmd.SET, bytearray([QMKataKeybCmd.ID_DEFAULT_LAYER, 0]))
+        flow.timeout_s = 0.01
+        for _ in range(4):
+            flow.send(_rgb_packet(0))
+            flow.end_frame()
+        self.assertEqual("fixed", flow.mode)
+        self.assertEqual(10, flow.burst)
+
+    def test_no_sync_without_transport_caps(self):
+        keyboard = self.keyboard(SimulatedFirmware(legacy=True))
+        self.assertIsNone(keyboard.keyb_get_transport(timeout_s=0.05))
+        self.assertEqual("fixed", keyboard.rgb_flow_control().mode)
+
+    def test_sector_reload_while_frames_are_streaming(self):
+        firmware = SimulatedFirmware(rgb_ack=False, sector_erase_s=0)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        flow = keyboard.rgb_flow_control()
+        self.assertEqual("sync", flow.mode)
+
+        # erase-skip flag of the firmware at each slot finalize
+        reload_flags = []
+        module_write = firmware._module_write
+
+        def finalize_flag(data):
+            if data[1] < len(firmware.module_slots) and data[2:4] == b"\xff\xff":
+                reload_flags.append(firmware.module_reload)
+            return module_write(data)
+
+        firmware._module_write = finalize_flag
+        stop = threading.Event()
+
+        def stream():
+            while not stop.is_set():
+                for led in range(20):
+                    flow.send(_rgb_packet(led))
+                flow.end_frame()
+
+        streamer = threading.Thread(target=stream)
+        streamer.start()
+        try:
+            binaries = {slot: _module_binary(600, slot + 1) for slot in range(3)}
+            self.assertTrue(keyboard.keyb_sector_reload(0, binaries))
+        finally:
+            stop.set()
+            streamer.join()
+        self.assertGreater(flow.num_packets, 0)
+        self.assertEqual([True] * 3, reload_flags)
+        self.assertFalse(firmware.module_reload)
+        for slot, binary in binaries.items():
+            base, _ = firmware.module_slots[slot]
+            self.assertEqual(binary, bytes(firmware._mem(base, len(binary))))
+
+    def send_frame(self, firmware):
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        keyboard.rgb_encoder = None
+        keyboard.dbg_rgb_buf = False
+        keyboard.keyb_send_rgb_frame(numpy.full((6, 17, 3), 7, dtype=numpy.uint8), (1, 1, 1))
+        self.assertEqual(0, firmware.rgb_overruns)
+        self.assertEqual([(7, 7, 7)] * 102, firmware.rgb_pixels())
+        return keyboard
+
+    def test_rgb_frame_goes_through_flow_control(self):
+        firmware = SimulatedFirmware(rgb_queue_len=1, rgb_apply_s=0.001)
+        keyboard = self.send_frame(firmware)
+        # one color, palette frame
+        self.assertEqual(1, keyboard.rgb_flow.num_packets)
+
+    def test_rgb_buf_pixels_without_frame_codecs(self):
+        firmware = SimulatedFirmware(rgb_queue_len=1, rgb_apply_s=0.001, rgb_codecs=0)
+        keyboard = self.send_frame(firmware)
+        self.assertEqual(2, keyboard.rgb_flow.num_packets)
+
+    def test_many_colors_in_small_messages(self):
+        firmware = SimulatedFirmware(rgb_queue_len=1, rgb_apply_s=0.001)
+        keyboard = self.keyboard(firmware)
+        keyboard.keyb_get_transport()
+        keyboard.MAX_LEN_SYSEX_DATA = 58
+        keyboard.rgb_encoder = None
+        keyboard.dbg_rgb_buf = False
+        arr = numpy.zeros((6, 17, 3), dtype=numpy.uint8)
+        arr[..., 0] = numpy.arange(6 * 17).reshape(6, 17) % 30
+        keyboard.keyb_send_rgb_frame(arr, (1, 1, 1))
+        self.assertGreater(keyboard.rgb_flow.num_packets, 0)
+        pixels = firmware.rgb_pixels()
+        self.assertNotIn(None, pixels)
+        self.assertEqual(30, len(set(pixels)))
+
+    def test_record_and_replay_sent_frames(self):
+        firmware = SimulatedFirmware(rgb_queue_len=1, rgb_apply_s=0)
+        keyboard = self.send_frame(firmware)
+        keyboard.rgb_recorder = None
+        keyboard.rgb_record_lock = threading.Lock()
+        keyboard.rgb_output = None
+        keyboard.rgb_replay = None
+        keyboard.rgb_composed = None
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "rec.qkrr")
+
+        keyboard.keyb_rgb_record(path)
+        for value in (1, 2, 3):
+            keyboard.keyb_send_rgb_frame(numpy.full((6, 17, 3), value, dtype=numpy.uint8), (1, 1, 1))
+        keyboard.keyb_rgb_record(None)
+        # a send that read the path before the recording stopped
+        keyboard.rgb_record(keyboard.rgb_encoder, numpy.zeros((102, 3), dtype=numpy.uint8))
+        self.assertIsNone(keyboard.rgb_recorder)
+
+        keyboard.keyb_send_rgb_frame(numpy.full((6, 17, 3), 9, dtype=numpy.uint8), (1, 1, 1))
+        replay = keyboard.keyb_rgb_replay(path, speed=10)
+        self.addCleanup(keyboard.rgb_output.stop)
+        self.assertEqual(3, len(replay))
+        replay.thread.join(5)
+        # the last replayed frame is sent, then not again and again
+        t_end = time.monotonic() + 5
+        while keyboard.rgb_output.slot is not None and time.monotonic() < t_end:
+            time.sleep(0.001)
+        self.assertIsNone(keyboard.rgb_output.slot)
+        keyboard.rgb_output.stop()
+        self.assertEqual([(3, 3, 3)] * 102, firmware.rgb_pixels())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import sys
+import types
+import unittest
+
+import numpy as np
+
+
+def _install_test_stubs():
+    try:
+        import serial
+    except ImportError:
+        serial = types.ModuleType("serial")
+        serial.SerialBase = object
+        serial.SerialException = type("SerialException", (Exception,), {})
+        sys.modules["serial"] = serial
+    try:
+        import hid
+    except ImportError:
+        sys.modules["hid"] = types.ModuleType("hid")
+
+
+_install_test_stubs()
+
+from KeyboardSimulator import SimulatedFirmware
+from RGBFrameCodec import CODEC_PALETTE, CODEC_RGB565, CODEC_RGB888, RGBFrameCodec
+
+ID_RGB_MATRIX_FRAME = 16
+
+
+def _decode(messages):
+    """led -> (r, g, b) of the simulator's reference decoder"""
+    firmware = SimulatedFirmware()
+    leds = {}
+    for msg in messages:
+        leds.update(firmware._rgb_frame_decode(memoryview(msg)))
+    return leds
+
+
+class RGBFrameCodecTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        # led 5 unmapped
+        self.led_index = np.array([i for i in range(40) if i != 5], dtype=np.uint8)
+        self.colors = rng.integers(0, 256, (len(self.led_index), 3), dtype=np.uint8)
+
+    def expected(self, select, colors=None):
+        colors = self.colors if colors is None else colors
+        return {
+            int(led): tuple(int(c) for c in rgb)
+            for led, rgb, s in zip(self.led_index, colors, select)
+            if s
+        }
+
+    def test_rgb888_full_frame_round_trip(self):
+        codec = RGBFrameCodec(0b111, ("rgb888",))
+        select = np.ones(len(self.led_index), dtype=bool)
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, self.colors, select, 50, 508)
+        self.assertEqual(1, len(messages))
+        self.assertEqual(bytes([ID_RGB_MATRIX_FRAME, CODEC_RGB888, 50]), messages[0][:3])
+        # 2 runs (led 5 missing), 3 bytes per led instead of 5
+        self.assertEqual(3 + 2 * 2 + 39 * 3, len(messages[0]))
+        self.assertEqual(self.expected(select), _decode(messages))
+
+    def test_runs_split_over_messages(self):
+        codec = RGBFrameCodec(0b111, ("rgb888",))
+        select = np.zeros(len(self.led_index), dtype=bool)
+        select[[0, 1, 2, 10, 11, 12, 13, 20, 30, 31, 32, 33, 34, 35, 36, 37]] = True
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, self.colors, select, 50, 20)
+        self.assertTrue(all(len(m) <= 20 for m in messages))
+        self.assertEqual(self.expected(select), _decode(messages))
+
+    def test_small_gaps_are_filled(self):
+        codec = RGBFrameCodec(0b111, ("rgb565",))
+        select = np.zeros(len(self.led_index), dtype=bool)
+        select[[10, 12]] = True
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, self.colors, select, 50, 508)
+        # one run of 3 leds (2 bytes each) is cheaper than 2 runs
+        self.assertEqual(3 + 2 + 3 * 2, len(messages[0]))
+        self.assertEqual([11, 12, 13], sorted(_decode(messages)))
+
+    def test_rgb565_is_close(self):
+        codec = RGBFrameCodec(1 << CODEC_RGB565, ("palette", "rgb565", "rgb888"))
+        select = np.ones(len(self.led_index), dtype=bool)
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, self.colors, select, 50, 508)
+        self.assertEqual(CODEC_RGB565, messages[0][1])
+        decoded = _decode(messages)
+        for led, rgb in self.expected(select).items():
+            self.assertTrue(all(abs(a - b) <= 7 for a, b in zip(rgb, decoded[led])))
+
+    def test_palette_for_few_colors(self):
+        colors = np.array([[255, 0, 0], [0, 0, 255], [9, 9, 9]], dtype=np.uint8)[
+            np.arange(len(self.led_index)) % 3
+        ]
+        select = np.ones(len(self.led_index), dtype=bool)
+        select[7] = False
+        codec = RGBFrameCodec(0b111)
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 508)
+        self.assertEqual(CODEC_PALETTE, messages[0][1])
+        # palette: 1 + 3 colors, 2 runs (led 5 unmapped, led 7 sent as gap), 4 bit indices
+        self.assertEqual(3 + 10 + 2 * 2 + 3 + 17, len(messages[0]))
+        self.assertEqual(self.expected(select, colors), {
+            led: rgb for led, rgb in _decode(messages).items() if led != self.led_index[7]
+        })
+
+    def test_palette_is_counted_in_every_message(self):
+        # 30 colors: the palette alone is larger than a message
+        colors = self.colors.copy()
+        colors[30:] = colors[:9]
+        select = np.ones(len(self.led_index), dtype=bool)
+        codec = RGBFrameCodec(0b111)
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 58)
+        self.assertTrue(all(len(m) <= 58 for m in messages))
+        self.assertEqual({CODEC_RGB888}, {m[1] for m in messages})
+        self.assertEqual(self.expected(select, colors), _decode(messages))
+
+        # 12 colors: palette and 8 bit indices fit, but repeated in 6 messages
+        colors = self.colors[np.arange(len(self.led_index)) % 12]
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 58)
+        self.assertTrue(all(len(m) <= 58 for m in messages))
+        rgb888 = RGBFrameCodec(0b111, ("rgb888",)).messages(
+            ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 58
+        )
+        self.assertLessEqual(sum(map(len, messages)), sum(map(len, rgb888)))
+        self.assertEqual(self.expected(select, colors), _decode(messages))
+
+        # no room for a header and a led
+        self.assertIsNone(codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 6))
+
+    def test_palette_of_the_selected_leds(self):
+        select = np.zeros(len(self.led_index), dtype=bool)
+        select[[0, 20, 30]] = True
+        colors = self.colors.copy()
+        colors[[0, 20, 30]] = 7
+        codec = RGBFrameCodec(0b111)
+        messages = codec.messages(ID_RGB_MATRIX_FRAME, self.led_index, colors, select, 50, 508)
+        self.assertEqual(CODEC_PALETTE, messages[0][1])
+        self.assertEqual(1, messages[0][3])  # one color
+        self.assertEqual(self.expected(select, colors), _decode(messages))
+
+    def test_unsupported_codecs_are_not_used(self):
+        self.assertFalse(RGBFrameCodec(0, ("palette", "rgb888")))
+        codec = RGBFrameCodec(1 << CODEC_RGB888, ("palette", "rgb565", "rgb888"))
+        self.assertEqual([CODEC_RGB888], codec.codecs)
+
+
+if __name__ == "__main__":
+    unittest.main()
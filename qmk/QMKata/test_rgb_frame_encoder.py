@@ -0,0 +1,120 @@
+import unittest
+
+import numpy as np
+
+from RGBFrameEncoder import RGBFrameEncoder
+
+
+def _xy_to_rgb_index(x, y):
+    # 4x2 matrix, (3, 0) has no led, (1, 1) and (2, 1) share led 5
+    xy_to_led = [
+        [0, 1, 2, -1],
+        [3, 5, 5, 4],
+    ]
+    return xy_to_led[y][x]
+
+
+def _reference_pixels(arr, brightness, duration):
+    """Per led encoding: mean of the led's pixels, scaled, in led order."""
+    colors = {}
+    for y in range(arr.shape[0]):
+        for x in range(arr.shape[1]):
+            index = _xy_to_rgb_index(x, y)
+            if index >= 0:
+                colors.setdefault(index, []).append(arr[y, x].astype(float))
+    data = bytearray()
+    for index in sorted(colors):
+        mean = sum(colors[index]) / len(colors[index])
+        data.extend((index, duration))
+        for c in range(3):
+            data.append(min(int(mean[c] * brightness[c]), 255))
+    return bytes(data)
+
+
+class RGBFrameEncoderTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.arr = rng.integers(0, 256, (2, 4, 3), dtype=np.uint8)
+        self.encoder = RGBFrameEncoder(_xy_to_rgb_index, 4, 2)
+
+    def test_matches_per_pixel_encoding(self):
+        brightness = (1.5, 0.5, 1.0)
+        self.assertEqual(
+            _reference_pixels(self.arr, brightness, 50),
+            self.encoder.encode(self.arr, brightness=brightness, duration=50),
+        )
+
+    def test_bgr_is_swapped_to_rgb(self):
+        bgr = np.ascontiguousarray(self.arr[:, :, ::-1])
+        self.assertEqual(
+            self.encoder.encode(self.arr), self.encoder.encode(bgr, bgr=True)
+        )
+
+    def test_strided_image_rows(self):
+        # qimage rows are padded to 4 bytes
+        padded = np.zeros((2, 16), dtype=np.uint8)
+        padded[:, :12] = self.arr.reshape(2, 12)
+        view = np.ndarray((2, 4, 3), buffer=padded, strides=[16, 3, 1], dtype=np.uint8)
+        self.assertEqual(self.encoder.encode(self.arr), self.encoder.encode(view))
+
+    def test_shared_led_is_sent_once_with_the_average(self):
+        arr = np.zeros((2, 4, 3), dtype=np.uint8)
+        arr[1, 1] = (10, 20, 255)
+        arr[1, 2] = (30, 41, 255)
+        pixels = self.encoder.encode(arr)
+        self.assertEqual(6 * RGBFrameEncoder.PIXEL_SIZE, len(pixels))
+        leds = pixels[:: RGBFrameEncoder.PIXEL_SIZE]
+        self.assertEqual(bytes(range(6)), leds)
+        self.assertEqual(bytes([5, 50, 20, 30, 255]), pixels[25:30])
+
+    def test_messages_hold_whole_pixels(self):
+        pixels = self.encoder.encode(self.arr)  # 6 leds
+        messages = RGBFrameEncoder.messages(pixels, 1, 17)  # 3 pixels per message
+        self.assertEqual([16, 16], [len(m) for m in messages])
+        self.assertTrue(all(m[0] == 1 for m in messages))
+        self.assertEqual(pixels, b"".join(m[1:] for m in messages))
+
+    def test_delta_sends_changed_leds_only(self):
+        encoder = RGBFrameEncoder(_xy_to_rgb_index, 4, 2, threshold=2, max_age_s=1.0)
+        self.assertEqual(encoder.encode(self.arr), encoder.encode_delta(self.arr, now=0))
+        self.assertEqual(b"", encoder.encode_delta(self.arr, now=0.1))
+
+        arr = self.arr.copy()
+        arr[0, 1] ^= 0x80  # led 1 changed
+        arr[1, 0, 0] ^= 0x01  # led 3 within threshold
+        pixels = encoder.encode_delta(arr, now=0.2)
+        self.assertEqual(encoder.encode(arr)[5:10], pixels)
+
+        # unchanged leds are refreshed once older than max_age_s
+        pixels = encoder.encode_delta(arr, now=1.0)
+        self.assertEqual(bytes([0, 2, 3, 4, 5]), pixels[:: RGBFrameEncoder.PIXEL_SIZE])
+        self.assertEqual(b"", encoder.encode_delta(arr, now=1.1))
+
+        encoder.reset()
+        self.assertEqual(encoder.encode(arr), encoder.encode_delta(arr, now=1.2))
+
+    def test_reset_is_applied_by_the_next_delta(self):
+        encoder = RGBFrameEncoder(_xy_to_rgb_index, 4, 2, threshold=2, max_age_s=1.0)
+        colors = encoder.colors(self.arr)
+        encoder.delta_colors(colors, now=0)
+        # e.g. from the gui thread while the output thread encodes
+        encoder.reset()
+        self.assertIsNotNone(encoder.shadow)
+        _, select = encoder.delta_colors(colors, now=0.1)
+        self.assertTrue(select.all())
+        _, select = encoder.delta_colors(colors, now=0.2)
+        self.assertFalse(select.any())
+
+    def test_delta_of_led_colors(self):
+        encoder = RGBFrameEncoder(_xy_to_rgb_index, 4, 2, threshold=2, max_age_s=1.0)
+        colors = encoder.colors(self.arr)
+        _, select = encoder.delta_colors(colors, now=0)
+        self.assertTrue(select.all())
+        changed = colors.copy()
+        changed[1] ^= 0x80
+        _, select = encoder.delta_colors(changed, now=0.1)
+        self.assertEqual([1], np.flatnonzero(select).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from RGBFrameRecord import RGBFrameRecord, RGBFrameRecorder, RGBFrameReplay
+
+LED_INDEX = [3, 0, 1, 2, 7]
+
+
+def _colors(i):
+    return np.full((len(LED_INDEX), 3), i, dtype=np.uint8)
+
+
+class RGBFrameRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "rec.qkrr")
+
+    def record(self, times):
+        recorder = RGBFrameRecorder(self.path, 17, 6, LED_INDEX)
+        for i, t in enumerate(times):
+            recorder.write(_colors(i), 100.0 + t)
+        recorder.close()
+        return recorder
+
+    def test_header_round_trip(self):
+        data = RGBFrameRecord.pack_header(17, 6, LED_INDEX, created=12.5)
+        self.assertEqual(RGBFrameRecord.data_offset(len(LED_INDEX)), len(data))
+        self.assertEqual(0, len(data) % 8)
+        width, height, led_index, created = RGBFrameRecord.unpack_header(data)
+        self.assertEqual((17, 6, 12.5), (width, height, created))
+        self.assertEqual(LED_INDEX, led_index.tolist())
+        with self.assertRaises(ValueError):
+            RGBFrameRecord.unpack_header(b"XXXX" + data[4:])
+        with self.assertRaises(ValueError):
+            RGBFrameRecord.unpack_header(data[:10])
+
+    def test_frames_by_index_and_time(self):
+        recorder = self.record([0.0, 0.1, 0.25, 0.5])
+        self.assertEqual(4, recorder.num_frames)
+        replay = RGBFrameReplay(self.path)
+        self.assertEqual(4, len(replay))
+        self.assertEqual((17, 6), replay.size)
+        self.assertEqual(LED_INDEX, replay.led_index.tolist())
+        self.assertAlmostEqual(0.5, replay.duration)
+        t, colors = replay.frame(2)
+        self.assertAlmostEqual(0.25, t)
+        np.testing.assert_array_equal(_colors(2), colors)
+        self.assertEqual([0, 0, 1, 2, 3, 3], [replay.index_at(t) for t in (-1, 0.05, 0.1, 0.3, 0.5, 9)])
+
+    def test_cut_off_record_is_ignored(self):
+        self.record([0.0, 0.1, 0.2])
+        with open(self.path, "ab") as f:
+            f.write(bytes(5))
+        self.assertEqual(3, len(RGBFrameReplay(self.path)))
+        # header only
+        RGBFrameRecorder(self.path, 17, 6, LED_INDEX).close()
+        replay = RGBFrameReplay(self.path)
+        self.assertEqual(0, len(replay))
+        replay.play(lambda led_index, colors: None)
+        self.assertFalse(replay.running)
+
+    def test_play_at_the_recorded_times(self):
+        self.record([0.0, 0.05, 0.1, 0.15, 0.2])
+        replay = RGBFrameReplay(self.path)
+        sent = []
+        done = threading.Event()
+
+        def send(led_index, colors):
+            sent.append((time.monotonic(), int(colors[0, 0])))
+            if len(sent) == 3:
+                done.set()
+
+        start = time.monotonic()
+        replay.play(send, speed=2.0, start_s=0.1)
+        self.assertTrue(done.wait(5))
+        replay.thread.join(5)
+        self.assertFalse(replay.running)
+        self.assertEqual([2, 3, 4], [i for _, i in sent])
+        # 0.05 s apart recorded, at twice the speed
+        self.assertGreaterEqual(sent[-1][0] - start, 0.05 - 0.005)
+        self.assertLess(sent[-1][0] - start, 1.0)
+
+    def test_seek_and_stop_while_playing(self):
+        self.record([0.0, 10.0, 20.0])
+        replay = RGBFrameReplay(self.path)
+        sent = []
+        replay.play(lambda led_index, colors: sent.append(int(colors[0, 0])))
+        t_end = time.monotonic() + 5
+        while not sent and time.monotonic() < t_end:
+            time.sleep(0.001)
+        replay.seek(20.0)
+        while len(sent) < 2 and time.monotonic() < t_end:
+            time.sleep(0.001)
+        self.assertEqual([0, 2], sent)
+        replay.stop()
+        self.assertFalse(replay.running)
+        self.assertIsNone(replay.thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
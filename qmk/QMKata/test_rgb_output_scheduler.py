@@ -0,0 +1,97 @@
+import threading
+import time
+import unittest
+
+from RGBOutputScheduler import RGBOutputScheduler
+
+
+class RGBOutputSchedulerTest(unittest.TestCase):
+    def scheduler(self, rate_hz, send):
+        scheduler = RGBOutputScheduler(send, rate_hz)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def test_latest_published_frame_wins(self):
+        sent = []
+        first = threading.Event()
+        release = threading.Event()
+
+        def send(item):
+            sent.append(item)
+            first.set()
+            release.wait(1)
+
+        scheduler = self.scheduler(1000, send)
+        scheduler.publish(1)
+        self.assertTrue(first.wait(1))
+        # producer does not block on the sending output thread
+        for item in range(2, 10):
+            scheduler.publish(item)
+        release.set()
+        time.sleep(0.05)
+        scheduler.stop()
+        self.assertEqual([1, 9], sorted(set(sent)))
+
+    def test_fixed_rate_repeats_the_latest_frame(self):
+        sent = []
+        scheduler = self.scheduler(50, sent.append)
+        scheduler.publish("frame")
+        time.sleep(0.21)
+        scheduler.stop()
+        self.assertTrue(8 <= len(sent) <= 13, len(sent))
+        self.assertEqual({"frame"}, set(sent))
+
+    def test_idle_until_next_frame(self):
+        sent = []
+        scheduler = self.scheduler(200, sent.append)
+        scheduler.publish("a")
+        time.sleep(0.03)
+        scheduler.publish(None)
+        time.sleep(0.03)
+        num_sent = len(sent)
+        time.sleep(0.05)
+        self.assertEqual(num_sent, len(sent))
+
+        scheduler.publish("b")
+        time.sleep(0.03)
+        self.assertEqual("b", sent[-1])
+
+    def test_one_output_thread_for_concurrent_publishers(self):
+        senders = set()
+        scheduler = self.scheduler(1000, lambda item: senders.add(threading.current_thread()))
+        start = threading.Barrier(4)
+
+        def publish(item):
+            start.wait()
+            for _ in range(100):
+                scheduler.publish(item)
+
+        publishers = [threading.Thread(target=publish, args=(i,)) for i in range(4)]
+        for t in publishers:
+            t.start()
+        for t in publishers:
+            t.join()
+        time.sleep(0.02)
+        scheduler.stop()
+        self.assertEqual({scheduler.name}, {t.name for t in senders})
+        self.assertEqual(1, len(senders))
+        # stopped: not restarted by a publish
+        scheduler.publish(1)
+        self.assertIsNone(scheduler.thread)
+
+    def test_send_error_keeps_running(self):
+        calls = []
+
+        def send(item):
+            calls.append(item)
+            raise RuntimeError("usb gone")
+
+        scheduler = self.scheduler(200, send)
+        scheduler.publish("a")
+        time.sleep(0.05)
+        self.assertGreater(len(calls), 1)
+        self.assertTrue(scheduler.thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
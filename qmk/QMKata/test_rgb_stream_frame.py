@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from RGBStreamFrame import RGBStreamFrame
+
+
+class RGBStreamFrameTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.frame = rng.integers(0, 256, (6, 17, 4), dtype=np.uint8)
+
+    def test_pack_unpack_round_trip(self):
+        message = RGBStreamFrame.pack(self.frame[:, :, :3], 42)
+        self.assertTrue(RGBStreamFrame.is_frame(message))
+        self.assertEqual(RGBStreamFrame.HEADER.size + 6 * 17 * 3, len(message))
+
+        frame_id, fmt, pixels = RGBStreamFrame.unpack(message)
+        self.assertEqual(42, frame_id)
+        self.assertEqual(RGBStreamFrame.FORMAT_RGB888, fmt)
+        np.testing.assert_array_equal(self.frame[:, :, :3], RGBStreamFrame.rgb(fmt, pixels))
+
+    def test_pixels_are_a_view_of_the_message(self):
+        message = bytearray(RGBStreamFrame.pack(self.frame[:, :, :3], 1))
+        _, _, pixels = RGBStreamFrame.unpack(message)
+        message[RGBStreamFrame.HEADER.size] ^= 0xFF
+        self.assertEqual(self.frame[0, 0, 0] ^ 0xFF, pixels[0, 0, 0])
+
+    def test_rgb_of_bgr_and_4_byte_formats(self):
+        rgb = self.frame[:, :, :3]
+        for fmt, pixels in (
+            (RGBStreamFrame.FORMAT_BGR888, rgb[:, :, ::-1]),
+            (RGBStreamFrame.FORMAT_RGBX8888, self.frame),
+            (RGBStreamFrame.FORMAT_BGRX8888, np.dstack((rgb[:, :, ::-1], self.frame[:, :, 3]))),
+        ):
+            _, unpacked_fmt, unpacked = RGBStreamFrame.unpack(RGBStreamFrame.pack(pixels, 0, fmt))
+            self.assertEqual(fmt, unpacked_fmt)
+            np.testing.assert_array_equal(rgb, RGBStreamFrame.rgb(fmt, unpacked))
+
+    def test_malformed_messages(self):
+        message = RGBStreamFrame.pack(self.frame[:, :, :3], 1)
+        self.assertFalse(RGBStreamFrame.is_frame("rgb.img:"))
+        self.assertFalse(RGBStreamFrame.is_frame(b"rgb.img:"))
+        for bad in (
+            message[:10],  # short header
+            message[:-1],  # short pixels
+            message + b"\0",
+            message[:4] + b"\x02" + message[5:],  # version
+            message[:5] + b"\x09" + message[6:],  # pixel format
+        ):
+            with self.assertRaises(ValueError):
+                RGBStreamFrame.unpack(bad)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import sys
+import threading
+import types
+import unittest
+
+
+def _install_test_stubs():
+    try:
+        import serial
+    except ImportError:
+        serial = types.ModuleType("serial")
+        serial.SerialBase = object
+        serial.SerialException = type("SerialException", (Exception,), {})
+        sys.modules["serial"] = serial
+    try:
+        import hid
+    except ImportError:
+        sys.modules["hid"] = types.ModuleType("hid")
+
+
+_install_test_stubs()
+
+import serial
+from SerialRawHID import RingBuffer, SerialRawHID
+
+
+class _FakeHidDevice:
+    def __init__(self, reports=()):
+        self.reports = list(reports)
+        self.written = []
+
+    def write(self, report):
+        self.written.append(bytes(report))
+        return len(report)
+
+    def read(self, size, timeout):
+        if self.reports:
+            return self.reports.pop(0)
+        return []
+
+
+def _raw_hid(hid_device, epsize=64, capacity=0x10000):
+    raw_hid = SerialRawHID.__new__(SerialRawHID)
+    raw_hid.dbg = types.SimpleNamespace(tr=lambda *args, **kwargs: None)
+    raw_hid.dbg_write = None
+    raw_hid.dbg_read = None
+    raw_hid.epsize = epsize
+    raw_hid.timeout = 1
+    raw_hid.MAX_DATA_SIZE = epsize - 2
+    raw_hid.max_msg_size = raw_hid.MAX_DATA_SIZE
+    raw_hid.write_lock = threading.Lock()
+    raw_hid.hid_device = hid_device
+    raw_hid.num_read_errors = 0
+    raw_hid.try_reopen = False
+    raw_hid.data = RingBuffer(capacity)
+    return raw_hid
+
+
+class SerialRawHIDFramingTest(unittest.TestCase):
+    def test_single_report_limit_without_negotiation(self):
+        raw_hid = _raw_hid(_FakeHidDevice())
+        with self.assertRaises(serial.SerialException):
+            raw_hid.write(bytearray(63))
+
+    def test_message_spans_continuation_reports(self):
+        device = _FakeHidDevice()
+        raw_hid = _raw_hid(device)
+        raw_hid.set_max_msg_size(200)
+        msg = bytearray(range(150))
+
+        raw_hid.write(msg)
+
+        self.assertEqual(
+            [SerialRawHID.FIRMATA_MSG, SerialRawHID.FIRMATA_MSG_CONT, SerialRawHID.FIRMATA_MSG_CONT],
+            [report[1] for report in device.written],
+        )
+        self.assertTrue(all(report[0] == 0 for report in device.written))
+        self.assertEqual(msg, b"".join(report[2:] for report in device.written))
+
+    def test_continuation_reports_are_reassembled_on_read(self):
+        msg = bytes([0xF0, 0x0F]) + bytes(range(70)) + bytes([0xF7])
+        reports = [
+            bytes([SerialRawHID.FIRMATA_MSG]) + msg[:63],
+            bytes([SerialRawHID.FIRMATA_MSG_CONT]) + msg[63:] + bytes(63 - len(msg[63:])),
+        ]
+        raw_hid = _raw_hid(_FakeHidDevice(reports))
+
+        received = bytearray()
+        while len(received) < len(msg):
+            received.append(ord(raw_hid.read()))
+        self.assertEqual(msg, bytes(received))
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_wrapped_write_find_and_slice(self):
+        ring = RingBuffer(8)
+        ring.write(b"abcdef")
+        ring.consume(5)
+        self.assertTrue(ring.write(b"ghijk"))  # wraps
+        self.assertFalse(ring.write(b"xyz"))  # full
+        self.assertEqual(6, len(ring))
+        self.assertEqual(3, ring.find(ord("i")))
+        self.assertEqual(b"fghijk", bytes(ring.slice(6)))
+        ring.consume(3)  # read position wrapped to the buffer start
+        self.assertIsInstance(ring.slice(3), memoryview)
+        self.assertEqual(b"ijk", bytes(ring.slice(3)))
+
+
+class SerialRawHIDReaderTest(unittest.TestCase):
+    def test_reader_splits_frames_across_reports_and_padding(self):
+        sysex = bytes([0xF0, 0x0F]) + bytes(range(1, 80)) + bytes([0xF7])
+        stream = sysex + bytes([0xF9, 2, 6]) + bytes([0xF0, 0x71, 0x41, 0x00, 0xF7])
+        reports = []
+        marker = SerialRawHID.FIRMATA_MSG
+        for off in range(0, len(stream), 63):
+            chunk = stream[off : off + 63]
+            reports.append(bytes([marker]) + chunk + bytes(63 - len(chunk)))
+            marker = SerialRawHID.FIRMATA_MSG_CONT
+        # small buffer so frames wrap around
+        raw_hid = _raw_hid(_FakeHidDevice(reports), capacity=128)
+
+        frames = []
+        raw_hid.frame_handler = lambda frame: frames.append(bytes(frame))
+        raw_hid.reader_running = True
+        for _ in reports:
+            raw_hid._read_msg()
+            while (frame_len := raw_hid._frame_len()) > 0:
+                raw_hid.frame_handler(raw_hid.data.slice(frame_len))
+                raw_hid.data.consume(frame_len)
+
+        self.assertEqual(
+            [sysex, bytes([0xF9, 2, 6]), bytes([0xF0, 0x71, 0x41, 0x00, 0xF7])], frames
+        )
+
+    def test_native_frame_is_split_by_length(self):
+        payload = bytes([0x05, 0x0E, 0xF7, 0xF0, 0xF1, 0x00]) + bytes(range(60))
+        native = bytes([0xF1, 0x0F, len(payload) & 0xFF, len(payload) >> 8]) + payload + b"\xf7"
+        stream = native + bytes([0xF9, 2, 6])
+        reports = [
+            bytes([SerialRawHID.FIRMATA_MSG]) + stream[:63],
+            bytes([SerialRawHID.FIRMATA_MSG_CONT]) + stream[63:] + bytes(126 - len(stream)),
+        ]
+        raw_hid = _raw_hid(_FakeHidDevice(reports))
+
+        frames = []
+        for _ in reports:
+            raw_hid._read_msg()
+            while (frame_len := raw_hid._frame_len()) > 0:
+                frames.append(bytes(raw_hid.data.slice(frame_len)))
+                raw_hid.data.consume(frame_len)
+
+        self.assertEqual([native, bytes([0xF9, 2, 6])], frames)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import sys
+import threading
+import types
+import unittest
+
+
+class _DummyQObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _DummySignal:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class _DummyQImage:
+    Format_RGB888 = 0
+    Format_BGR888 = 1
+
+
+class _DummyDebugTracer:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def enabled(self, *args, **kwargs):
+        return False
+
+    def tr(self, *args, **kwargs):
+        pass
+
+
+def _install_test_stubs():
+    qtcore = types.ModuleType("PySide6.QtCore")
+    qtcore.Qt = types.SimpleNamespace()
+    qtcore.QObject = _DummyQObject
+    qtcore.Signal = _DummySignal
+
+    qtgui = types.ModuleType("PySide6.QtGui")
+    qtgui.QImage = _DummyQImage
+    qtgui.QColor = object
+    qtgui.QPainter = object
+
+    pyside6 = types.ModuleType("PySide6")
+    pyside6.QtCore = qtcore
+    pyside6.QtGui = qtgui
+
+    pyfirmata2 = types.ModuleType("pyfirmata2")
+    pyfirmata2.Board = type("Board", (), {})
+    pyfirmata2.START_SYSEX = 0xF0
+    pyfirmata2.END_SYSEX = 0xF7
+
+    serial = types.ModuleType("serial")
+    serial.Serial = object
+    serial.tools = types.SimpleNamespace(
+        list_ports=types.SimpleNamespace(comports=lambda: [])
+    )
+
+    sys.modules.setdefault("PySide6", pyside6)
+    sys.modules.setdefault("PySide6.QtCore", qtcore)
+    sys.modules.setdefault("PySide6.QtGui", qtgui)
+    sys.modules.setdefault("pyfirmata2", pyfirmata2)
+    sys.modules.setdefault("serial", serial)
+    sys.modules.setdefault("numpy", types.ModuleType("numpy"))
+
+    serial_raw_hid = types.ModuleType("SerialRawHID")
+    serial_raw_hid.SerialRawHID = object
+    sys.modules.setdefault("SerialRawHID", serial_raw_hid)
+
+    debug_tracer = types.ModuleType("DebugTracer")
+    debug_tracer.DebugTracer = _DummyDebugTracer
+    sys.modules.setdefault("DebugTracer", debug_tracer)
+
+
+_install_test_stubs()
+
+from QMKataKeyboard import QMKataKeyboard, QMKataKeybCmd
+from ResponseDispatcher import ResponseDispatcher
+from WindowedTransfer import WindowedTransfer
+
+
+class _ModuleFirmware:
+    """Fake transport answering module chunk writes/reads synchronously."""
+
+    def __init__(self, keyboard, slot_data=b"", drop_first=(), chunk_len=4):
+        self.keyboard = keyboard
+        self.slot_data = slot_data
+        self.drop = set(drop_first)  # offsets whose first request is lost
+        self.chunk_len = chunk_len
+        self.written = []
+
+    def write(self, msg):
+        seqnum, data = msg[2], bytes(msg[3:-1])
+        self.written.append(data)
+        offset = data[2] | (data[3] << 8)
+        if offset in self.drop:
+            self.drop.discard(offset)
+            return len(msg)
+        if msg[1] == QMKataKeybCmd.GET:
+            chunk = self.slot_data[offset : offset + self.chunk_len]
+            response = bytearray(data[:4]) + bytearray([len(chunk)]) + chunk
+        else:
+            response = 0
+        self.keyboard.response_dispatcher.complete(seqnum, response)
+        return len(msg)
+
+
+def _keyboard():
+    keyboard = QMKataKeyboard.__new__(QMKataKeyboard)
+    keyboard.dbg = _DummyDebugTracer()
+    keyboard.keyboardModel = None
+    keyboard.pack_endian = "<"
+    keyboard.encode_7bits_sysex = False
+    keyboard.MAX_LEN_SYSEX_DATA = 58
+    keyboard.keyb_poll_time = 1 / 1000
+    keyboard.response_dispatcher = ResponseDispatcher()
+    keyboard.sysex_send_lock = threading.Lock()
+    keyboard.sysex_seqnum = 0
+    return keyboard
+
+
+class WindowedTransferTest(unittest.TestCase):
+    def test_lost_chunk_is_retransmitted(self):
+        keyboard = _keyboard()
+        keyboard.sp = _ModuleFirmware(keyboard, drop_first=[53])
+        binary = bytes(range(200))
+
+        self.assertTrue(keyboard.keyb_set_module(1, binary))
+        offsets = [d[2] | (d[3] << 8) for d in keyboard.sp.written]
+        # 4 chunks, offset 53 sent twice, then finalize
+        self.assertEqual([0, 53, 106, 159, 53, 0xFFFF], offsets)
+
+    def test_chunk_out_of_retries_fails_transfer(self):
+        keyboard = _keyboard()
+        keyboard.sp = _ModuleFirmware(keyboard)
+        transfer = WindowedTransfer(keyboard, window=2, timeout_s=0.01, max_retries=2)
+
+        responses = transfer.run(
+            QMKataKeybCmd.SET,
+            [(0, bytearray([QMKataKeybCmd.ID_MODULE, 1, 0, 0, 0]))],
+            lambda offset, rc: False,
+        )
+        self.assertIsNone(responses)
+        self.assertEqual(3, transfer.num_sends)
+
+    def test_read_module_binary_pipelined(self):
+        keyboard = _keyboard()
+        slot_data = bytes(range(37))
+        keyboard.sp = _ModuleFirmware(keyboard, slot_data, drop_first=[8], chunk_len=4)
+
+        self.assertEqual(slot_data, keyboard.keyb_read_module_binary(2, len(slot_data)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,72 +1,174 @@
-import sys, time, argparse
-import d3dshot
-import cv2
+import os, sys, time, argparse
 import asyncio
-import websockets
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from RGBStreamFrame import RGBStreamFrame
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+#-------------------------------------------------------------------------------
+# capture sources: read() -> (height, width, channels) uint8 frame in format fmt
+class D3DShotSource:
+    """screen capture (windows, d3dshot)"""
+    fmt = RGBStreamFrame.FORMAT_RGB888
+
+    def __init__(self, args):
+        import d3dshot
+        self.d = d3dshot.create(capture_output="numpy")
+        self.d.display = self.d.displays[args.display]
+        # start capture
+        self.d.capture()
+
+    def read(self):
+        return self.d.get_latest_frame()
+
+    def close(self):
+        self.d.stop()
+
+class VideoFileSource:
+    """video/gif file playback, restarts at the end"""
+    fmt = RGBStreamFrame.FORMAT_BGR888  # as decoded, the server swaps the channels
+
+    def __init__(self, args):
+        self.cap = cv2.VideoCapture(args.video)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"can't open {args.video}")
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # restart
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def close(self):
+        self.cap.release()
+
+class SyntheticSource:
+    """moving color gradient of the source size, for benchmarks without a display"""
+    fmt = RGBStreamFrame.FORMAT_RGB888
+
+    def __init__(self, args):
+        w, h = args.source_size
+        x = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+        y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+        self.base = np.stack(np.broadcast_arrays(x, y, (x + y) / 2), axis=-1).astype(np.uint8)
+        self.n = 0
+
+    def read(self):
+        self.n += 1
+        return self.base + np.uint8(self.n % 256)  # wraps around
+
+    def close(self):
+        pass
+
+SOURCES = {"d3dshot": D3DShotSource, "video": VideoFileSource, "synthetic": SyntheticSource}
+
+#-------------------------------------------------------------------------------
+def area_resize(frame, width, height):
+    """downsample to width x height, every output pixel is the average of its source area"""
+    if cv2:
+        return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    h, w = frame.shape[:2]
+    ys = np.arange(height) * h // height
+    xs = np.arange(width) * w // width
+    if h < height or w < width:
+        return frame[ys][:, xs]  # upscaling, nearest pixel
+    block = np.add.reduceat(np.add.reduceat(frame, ys, axis=0, dtype=np.uint32), xs, axis=1)
+    count = np.outer(np.diff(ys, append=h), np.diff(xs, append=w))[:, :, None]
+    return ((block + count // 2) // count).astype(np.uint8)
+
+class Stats:
+    def __init__(self):
+        self.frames = 0
+        self.late = 0  # frames started more than one period after due
+        self.bytes = 0
+        self.t_capture = 0.0
+        self.t_pack = 0.0
+        self.t_send = 0.0
+
+    def report(self, elapsed):
+        n = max(1, self.frames)
+        return (f"{self.frames} frames {self.frames / elapsed:.1f} fps, late {self.late}, "
+                f"{self.bytes / n:.0f} bytes/frame, per frame: capture {self.t_capture / n * 1000:.3f} ms "
+                f"resize+pack {self.t_pack / n * 1000:.3f} ms send {self.t_send / n * 1000:.3f} ms")
 
 def parse_args():
     parser = argparse.ArgumentParser(description="capture screen and stream as rgb image over websocket")
+    parser.add_argument("--source", choices=SOURCES, default="d3dshot", help="capture source")
     parser.add_argument("--display", type=int, default=0, help="display index to capture")
+    parser.add_argument("--video", help="video file of the video source")
+    parser.add_argument("--source-size", type=int, nargs=2, default=(1920, 1080), metavar=("W", "H"),
+                        help="frame size of the synthetic source")
     parser.add_argument("--width", type=int, default=17, help="rgb matrix width")
     parser.add_argument("--height", type=int, default=6, help="rgb matrix height")
     parser.add_argument("--fps", type=int, default=25, help="frame rate of the capture")
     parser.add_argument("--port", type=int, default=8787, help="websocket server port")
+    parser.add_argument("--duration", type=float, help="stop after seconds and print stats")
+    parser.add_argument("--dry-run", action="store_true", help="capture and pack only, no websocket")
     return parser.parse_args()
 
-if __name__ == "__main__":
-    args = parse_args()
-
-    display_index = args.display
-    rgb_w = args.width
-    rgb_h = args.height
-    fps = args.fps
-    port = args.port
-
-    d = d3dshot.create(capture_output="numpy")
-    d.display = d.displays[display_index]
-    # start capture
-    d.capture()
-    print("capture is running...")
+async def capture_ws_send(args, source, websocket, stats):
+    loop = asyncio.get_running_loop()
+    period = 1 / args.fps
+    start = due = loop.time()
+    frame_id = 0
+    while args.duration is None or loop.time() - start < args.duration:
+        t0 = time.perf_counter()
+        frame = source.read()
+        t1 = time.perf_counter()
+        if frame is not None:
+            frame = area_resize(frame, args.width, args.height)
+            data = RGBStreamFrame.pack(frame, frame_id, source.fmt)
+            t2 = time.perf_counter()
+            if websocket:
+                await websocket.send(data)
+            stats.t_capture += t1 - t0
+            stats.t_pack += t2 - t1
+            stats.t_send += time.perf_counter() - t2
+            stats.frames += 1
+            stats.bytes += len(data)
+            frame_id += 1
+
+        # frame times on a fixed grid, no drift from the work per frame, a late
+        # frame does not cause a burst of catch up frames
+        due += period
+        now = loop.time()
+        if now > due + period:
+            stats.late += 1
+            due = now
+        await asyncio.sleep(max(0, due - now))
+    return loop.time() - start
 
-    async def capture_ws_send():
-        uri = f"ws://localhost:{port}"
-        try:
-            async with websockets.connect(uri) as websocket:
-                while True:
-                    try:
-                        frame = d.get_latest_frame()
-                        #print(frame.shape)
-                        frame = cv2.resize(frame, (rgb_w, rgb_h))
-                        #frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        frame_bytes = bytearray()
-                        for y in range(0, rgb_h):
-                            for x in range(0, rgb_w):
-                                r,g,b = frame[y, x]
-                                frame_bytes.append(r)
-                                frame_bytes.append(g)
-                                frame_bytes.append(b)
-                        #print(frame_bytes)
-                        data = "rgb.img:".encode('utf-8')
-                        data = data + frame_bytes
-
-                        try:
-                            await websocket.send(data)
-                            await asyncio.sleep(0)
-                        except websockets.exceptions.ConnectionClosed as e:
-                            print("websocket connection closed: ", e)
-                            break
-                        except Exception as e:
-                            print("websocket send error:", e)
-                            break
-                    except Exception as e:
-                        print(e)
-                    time.sleep(1/fps)
-        except Exception as e:
-            print("websocket error: ", e)
+async def main(args):
+    source = SOURCES[args.source](args)
+    stats = Stats()
+    print("capture is running...")
+    try:
+        if args.dry_run:
+            elapsed = await capture_ws_send(args, source, None, stats)
+        else:
+            import websockets
+            uri = f"ws://localhost:{args.port}"
+            try:
+                async with websockets.connect(uri) as websocket:
+                    elapsed = await capture_ws_send(args, source, websocket, stats)
+            except websockets.exceptions.ConnectionClosed as e:
+                print("websocket connection closed: ", e)
+                return
+            except Exception as e:
+                print("websocket error: ", e)
+                return
+        print(stats.report(elapsed))
+    finally:
+        source.close()
 
+if __name__ == "__main__":
     try:
-        asyncio.get_event_loop().run_until_complete(capture_ws_send())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         print("exit run")
-
-    d.stop()